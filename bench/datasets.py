@@ -0,0 +1,177 @@
+"""
+Синтетические данные upstream для бенчмарков. Каждая строка — функция от номера,
+поэтому любой размер воспроизводится без хранения таблиц, а выборка по tg_id
+считается арифметикой (ключ i принадлежит пользователю i % users).
+"""
+from datetime import datetime, timedelta, timezone
+import json
+
+SERVERS = 20
+TARIFFS = 12
+COUPONS = 200
+PAYMENT_SYSTEMS = ("yookassa", "cryptobot", "stars", "balance")
+TARIFF_GROUPS = ("basic", "premium", "business")
+FIRST_TG_ID = 100_000_000
+
+# Фиксированная точка отсчёта: одинаковые размеры дают одинаковые данные в любой день.
+EPOCH = datetime(2025, 1, 1, tzinfo=timezone.utc)
+SPAN_DAYS = 365
+
+
+def _mix(i: int, salt: int) -> int:
+    """Детерминированное «случайное» число из номера строки (хэш Кнута)."""
+    return ((i + 1) * 2654435761 + salt * 40503) % 4294967296
+
+
+def _moment(i: int, salt: int) -> datetime:
+    return EPOCH + timedelta(seconds=_mix(i, salt) % (SPAN_DAYS * 86400))
+
+
+class Dataset:
+    """Таблицы одного размера: size пользователей, ключей и платежей; подарков и рефералов — size // 4."""
+
+    def __init__(self, size: int):
+        self.size = size
+        self.counts = {
+            "users": size,
+            "keys": size,
+            "payments": size,
+            "gifts": max(size // 4, 1),
+            "referrals": max(size // 4, 1),
+            "servers": SERVERS,
+            "tariffs": TARIFFS,
+            "coupons": COUPONS,
+        }
+        self._bodies: dict = {}
+
+    def tg_id(self, user: int) -> int:
+        return FIRST_TG_ID + user
+
+    def user(self, i: int) -> dict:
+        created = _moment(i, 1)
+        return {
+            "tg_id": self.tg_id(i),
+            "username": f"user{i}",
+            "first_name": f"Имя{i % 997}",
+            "last_name": None,
+            "balance": float(_mix(i, 2) % 5000),
+            "trial": _mix(i, 3) % 2,
+            "created_at": created.isoformat(),
+            "updated_at": (created + timedelta(days=_mix(i, 4) % 30)).isoformat(),
+        }
+
+    def key(self, i: int) -> dict:
+        created = _moment(i, 5)
+        return {
+            "tg_id": self.tg_id(i % self.size),
+            "email": f"key{i}@bench",
+            "client_id": f"{_mix(i, 6):08x}-0000-4000-8000-{i:012x}",
+            "server_id": f"server-{i % SERVERS}",
+            "key": f"vless://{_mix(i, 7):08x}@bench:443",
+            "remnawave_link": None,
+            "alias": None,
+            "tariff_id": 1 + i % TARIFFS,
+            "is_frozen": False,
+            "expiry_time": int((created + timedelta(days=30 + _mix(i, 8) % 60)).timestamp() * 1000),
+            "created_at": int(created.timestamp() * 1000),
+        }
+
+    def payment(self, i: int) -> dict:
+        return {
+            "id": i + 1,
+            "tg_id": self.tg_id(i % self.size),
+            "amount": float(99 + _mix(i, 9) % 900),
+            "provider": PAYMENT_SYSTEMS[i % len(PAYMENT_SYSTEMS)],
+            "status": "success" if _mix(i, 10) % 10 else "failed",
+            "created_at": _moment(i, 11).isoformat(),
+        }
+
+    def gift(self, i: int) -> dict:
+        created = _moment(i, 12)
+        return {
+            "gift_id": f"gift{i}",
+            "sender_tg_id": self.tg_id(i % self.size),
+            "recipient_tg_id": self.tg_id((i * 7) % self.size) if i % 2 else None,
+            "selected_months": 1 + i % 12,
+            "tariff_id": 1 + i % TARIFFS,
+            "max_usages": 1,
+            "gift_link": f"https://t.me/bench_bot?start=gift_{i}",
+            "comment": None,
+            "is_used": bool(i % 2),
+            "is_unlimited": False,
+            "expiry_time": (created + timedelta(days=90)).isoformat(),
+            "created_at": created.isoformat(),
+        }
+
+    def referral(self, i: int) -> dict:
+        return {
+            "id": i + 1,
+            "referrer_tg_id": self.tg_id(i % self.size),
+            "referred_tg_id": self.tg_id((i * 31 + 1) % self.size),
+            "reward_issued": bool(_mix(i, 13) % 2),
+            "bonus": 50.0,
+            "created_at": _moment(i, 14).isoformat(),
+        }
+
+    def server(self, i: int) -> dict:
+        return {
+            "id": i + 1,
+            "server_name": f"server-{i}",
+            "cluster_name": f"cluster-{i % 4}",
+            "api_url": f"https://server-{i}.bench/api",
+            "subscription_url": None,
+            "inbound_id": str(i),
+            "panel_type": "3x-ui",
+            "tariff_group": TARIFF_GROUPS[i % len(TARIFF_GROUPS)],
+            "max_keys": 1000 + 100 * i,
+            "enabled": i % 10 != 9,
+        }
+
+    def tariff(self, i: int) -> dict:
+        return {
+            "id": i + 1,
+            "name": f"tariff-{i}",
+            "group_code": TARIFF_GROUPS[i % len(TARIFF_GROUPS)],
+            "subgroup_title": f"Подгруппа {i % 3}" if i % 2 else None,
+            "price_rub": float(100 * (1 + i)),
+            "duration_days": 30 * (1 + i % 12),
+            "traffic_limit": None,
+            "device_limit": 1 + i % 5,
+            "is_active": True,
+        }
+
+    def coupon(self, i: int) -> dict:
+        return {
+            "id": i + 1,
+            "code": f"BENCH{i}",
+            "amount": float(50 + i % 10 * 50),
+            "days": None,
+            "usage_limit": 100,
+            "usage_count": i % 100,
+            "is_used": False,
+        }
+
+    def rows(self, collection: str, indexes):
+        make = getattr(self, collection.rstrip("s"))
+        return [make(i) for i in indexes]
+
+    def body(self, collection: str) -> bytes:
+        """Весь список как JSON; собирается при первом запросе и хранится только в байтах."""
+        body = self._bodies.get(collection)
+        if body is None:
+            make = getattr(self, collection.rstrip("s"))
+            parts = [b"["]
+            for i in range(self.counts[collection]):
+                if i:
+                    parts.append(b",")
+                parts.append(json.dumps(make(i), ensure_ascii=False).encode("utf-8"))
+            parts.append(b"]")
+            body = self._bodies[collection] = b"".join(parts)
+        return body
+
+    def owned(self, collection: str, tg_id: int) -> list:
+        """Строки пользователя tg_id: номера i, для которых i % size == user."""
+        user = tg_id - FIRST_TG_ID
+        if not 0 <= user < self.size:
+            return []
+        return self.rows(collection, range(user, self.counts[collection], self.size))
@@ -0,0 +1,85 @@
+"""
+Заглушка upstream API для бенчмарков: отдаёт синтетические таблицы (bench/datasets.py)
+по тем же путям, что и настоящий API_BASE_URL, с искусственной задержкой и ошибками.
+
+    python -m app.bench.mock_upstream --size 100000 --port 8900 --latency 0.05 --error-rate 0.01
+"""
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+from app.bench.datasets import Dataset
+import argparse
+import asyncio
+import random
+
+LIST_ROUTES = ("users", "keys", "payments", "gifts", "referrals", "servers", "tariffs", "coupons")
+OWNED_ROUTES = {
+    "keys/all": "keys",
+    "payments/by_tg_id": "payments",
+    "gifts/by_tg_id": "gifts",
+    "referrals/all": "referrals",
+}
+
+
+def create_app(dataset: Dataset, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0) -> FastAPI:
+    """
+    latency ± jitter — задержка перед каждым ответом, сек; error_rate — доля ответов 503.
+    Пишущие запросы ничего не меняют и отвечают {"detail": "ok"}.
+    """
+    app = FastAPI()
+    app.state.requests = 0
+
+    @app.middleware("http")
+    async def degrade(request: Request, call_next):
+        app.state.requests += 1
+        delay = latency + random.uniform(-jitter, jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if error_rate and random.random() < error_rate:
+            return JSONResponse({"detail": "injected failure"}, status_code=503)
+        return await call_next(request)
+
+    @app.get("/api/{collection}/")
+    async def list_rows(collection: str):
+        if collection not in LIST_ROUTES:
+            return JSONResponse({"detail": "not found"}, status_code=404)
+        return Response(dataset.body(collection), media_type="application/json")
+
+    @app.get("/api/users/{tg_id}")
+    async def get_user(tg_id: int):
+        rows = dataset.owned("users", tg_id)
+        if not rows:
+            return JSONResponse({"detail": "not found"}, status_code=404)
+        return rows[0]
+
+    @app.get("/api/{collection}/{lookup}/{tg_id}")
+    async def owned_rows(collection: str, lookup: str, tg_id: int):
+        source = OWNED_ROUTES.get(f"{collection}/{lookup}")
+        if source is None:
+            return JSONResponse({"detail": "not found"}, status_code=404)
+        return dataset.owned(source, tg_id)
+
+    @app.api_route("/api/{path:path}", methods=["POST", "PATCH", "DELETE"])
+    async def write(path: str):
+        return {"detail": "ok"}
+
+    return app
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Заглушка upstream API для бенчмарков")
+    parser.add_argument("--size", type=int, default=10_000)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    app = create_app(Dataset(args.size), args.latency, args.jitter, args.error_rate)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,276 @@
+"""
+Бенчмарк эндпоинтов панели на синтетических данных. Для каждого размера поднимается
+заглушка upstream (bench/mock_upstream.py) и отдельный процесс панели; по каждому
+GET-эндпоинту меряются p50/p99, пропускная способность и пик памяти на запрос.
+
+    cd <каталог, где лежит app/>
+    python -m app.bench.run --sizes 1000,100000 --requests 200 --concurrency 10
+    python -m app.bench.run --sizes 100000 --latency 0.05 --error-rate 0.02 --compare app/bench/results/<прошлый>.json
+
+Результаты пишутся в bench/results/<время>.json вместе с коммитом и параметрами запуска.
+--compare печатает изменение относительно прошлого запуска.
+"""
+from datetime import datetime
+from pathlib import Path
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+ROOT = Path(__file__).resolve().parent.parent
+RESULTS_DIR = ROOT / "bench" / "results"
+
+ROUTERS = ("dashboard", "users", "keys", "servers", "tariffs", "payments", "coupons", "gifts", "referrals", "metrics", "search")
+ENDPOINTS = (
+    "/dashboard",
+    "/users",
+    "/users/rows",
+    "/users/{tg_id}",
+    "/users/export",
+    "/keys",
+    "/keys/rows",
+    "/keys/export",
+    "/keys/expiring",
+    "/keys/expiring/rows",
+    "/payments",
+    "/payments/rows",
+    "/payments/export",
+    "/payments/analytics",
+    "/payments/analytics/data",
+    "/gifts",
+    "/gifts/rows",
+    "/referrals",
+    "/servers",
+    "/servers/capacity",
+    "/servers/capacity/data",
+    "/servers/least_loaded",
+    "/tariffs",
+    "/coupons",
+    "/coupons/rows",
+    "/metrics",
+    "/search",
+)
+# Query string для эндпоинтов, которым без параметров нечего делать.
+QUERIES = {"/search": "?q=user1", "/servers/least_loaded": "?group=basic"}
+# GET-маршруты, которые не меряются: бесконечный поток событий, выгрузки по id и отладочные.
+SKIPPED = ("/dashboard/live", "/gifts/batch/{batch_id}/codes", "/profiles", "/profiles/{name}")
+METRICS = ("p50_ms", "p99_ms", "rps", "peak_kb")
+
+
+def _percentile(sorted_values: list, q: float) -> float:
+    if len(sorted_values) == 1:
+        return sorted_values[0]
+    return statistics.quantiles(sorted_values, n=100, method="inclusive")[int(q) - 1]
+
+
+def _wait_for_port(port: int, process: subprocess.Popen, timeout: float = 60):
+    import httpx
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("заглушка upstream завершилась при старте")
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/api/tariffs/", timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError(f"заглушка upstream не поднялась на порту {port}")
+
+
+def start_mock(args) -> subprocess.Popen:
+    process = subprocess.Popen([
+        sys.executable, "-m", "app.bench.mock_upstream",
+        "--size", str(args.size), "--port", str(args.port),
+        "--latency", str(args.latency), "--jitter", str(args.jitter), "--error-rate", str(args.error_rate),
+    ])
+    try:
+        _wait_for_port(args.port, process)
+    except Exception:
+        process.terminate()
+        raise
+    return process
+
+
+async def measure(client, path: str, requests: int, concurrency: int, before_request) -> dict:
+    latencies = []
+    errors = 0
+    remaining = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for _ in remaining:
+            before_request()
+            started = time.perf_counter()
+            response = await client.get(path)
+            latencies.append(time.perf_counter() - started)
+            if response.status_code >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "p50_ms": _percentile(latencies, 50) * 1000,
+        "p99_ms": _percentile(latencies, 99) * 1000,
+        "mean_ms": statistics.fmean(latencies) * 1000,
+        "rps": requests / elapsed,
+        "errors": errors,
+    }
+
+
+async def peak_memory(client, path: str, before_request) -> float:
+    """Пик выделенной Python-памяти за один запрос, КБ (отдельный проход: tracemalloc замедляет код)."""
+    before_request()
+    tracemalloc.start()
+    try:
+        baseline = tracemalloc.get_traced_memory()[0]
+        await client.get(path)
+        return (tracemalloc.get_traced_memory()[1] - baseline) / 1024
+    finally:
+        tracemalloc.stop()
+
+
+async def run_worker(args) -> dict:
+    """Один размер данных в отдельном процессе: чистые кэши и честный пик RSS."""
+    os.environ["API_BASE_URL"] = f"http://127.0.0.1:{args.port}/api"
+    import httpx
+    import importlib
+    from fastapi import FastAPI
+    from app.bench.datasets import Dataset
+    from app.core import upstream
+    from app.core.lifespan import lifespan
+
+    panel = FastAPI(docs_url=None, redoc_url=None, openapi_url=None)
+    for name in ROUTERS:
+        panel.include_router(importlib.import_module(f"app.routers.{name}").router)
+    routes = {route.path for route in panel.routes if "GET" in getattr(route, "methods", ())}
+    for path in sorted(routes - set(ENDPOINTS) - set(SKIPPED)):
+        print(f"[WARN] {path} не входит в бенчмарк", file=sys.stderr)
+
+    def before_request():
+        if args.cold:
+            upstream.response_cache.clear()
+
+    sample_tg_id = Dataset(args.size).tg_id(args.size // 2)
+    results = {}
+    mock = start_mock(args)
+    try:
+        async with lifespan(panel):
+            transport = httpx.ASGITransport(app=panel)
+            async with httpx.AsyncClient(transport=transport, base_url="http://panel", timeout=None) as client:
+                for endpoint in ENDPOINTS:
+                    if args.endpoints and endpoint not in args.endpoints:
+                        continue
+                    path = endpoint.format(tg_id=sample_tg_id) + QUERIES.get(endpoint, "")
+                    for _ in range(args.warmup):
+                        await client.get(path)
+                    result = await measure(client, path, args.requests, args.concurrency, before_request)
+                    result["peak_kb"] = await peak_memory(client, path, before_request)
+                    results[endpoint] = result
+                    print(f"  {endpoint:<18} p50 {result['p50_ms']:8.1f} ms  p99 {result['p99_ms']:8.1f} ms  "
+                          f"{result['rps']:8.1f} rps  peak {result['peak_kb']:9.0f} KB  errors {result['errors']}",
+                          file=sys.stderr)
+    finally:
+        mock.terminate()
+        mock.wait()
+    # ru_maxrss в Linux — КБ, в macOS — байты.
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {"endpoints": results, "max_rss_kb": max_rss if sys.platform != "darwin" else max_rss // 1024}
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current: dict, previous: dict):
+    """Изменение p50/p99/rps/пика памяти по эндпоинтам, которые есть в обоих запусках, %."""
+    print(f"\nсравнение с {previous['meta'].get('commit')} ({previous['meta'].get('date')}):")
+    for size, run in current["runs"].items():
+        old_run = previous["runs"].get(size)
+        if old_run is None:
+            continue
+        print(f"size {size}")
+        for endpoint, result in run["endpoints"].items():
+            old = old_run["endpoints"].get(endpoint)
+            if old is None:
+                continue
+            changes = []
+            for metric in METRICS:
+                if old.get(metric):
+                    changes.append(f"{metric} {(result[metric] - old[metric]) / old[metric] * 100:+6.1f}%")
+            print(f"  {endpoint:<18} " + "  ".join(changes))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default="1000,10000", help="размеры данных через запятую (1000 … 1000000)")
+    parser.add_argument("--requests", type=int, default=100, help="запросов на эндпоинт")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.0, help="задержка upstream, сек")
+    parser.add_argument("--jitter", type=float, default=0.0, help="разброс задержки upstream, сек")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="доля ответов upstream 503")
+    parser.add_argument("--cold", action="store_true", help="сбрасывать кэш upstream перед каждым запросом")
+    parser.add_argument("--endpoints", nargs="*", help="только эти эндпоинты (как в ENDPOINTS)")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--output", type=Path)
+    parser.add_argument("--compare", type=Path, help="JSON прошлого запуска")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--size", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(asyncio.run(run_worker(args))))
+        return
+
+    options = {key: value for key, value in vars(args).items() if key not in ("output", "compare", "worker", "size")}
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "date": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "options": options,
+        },
+        "runs": {},
+    }
+    for size in (int(s) for s in args.sizes.split(",")):
+        print(f"size {size}", file=sys.stderr)
+        command = [sys.executable, "-m", "app.bench.run", "--worker", "--size", str(size)]
+        for key, value in options.items():
+            flag = "--" + key.replace("_", "-")
+            if key == "sizes" or value in (None, False):
+                continue
+            if value is True:
+                command.append(flag)
+            elif isinstance(value, list):
+                command.extend([flag, *value])
+            else:
+                command.extend([flag, str(value)])
+        worker = subprocess.run(command, stdout=subprocess.PIPE, text=True, check=True)
+        report["runs"][str(size)] = json.loads(worker.stdout.strip().splitlines()[-1])
+
+    output = args.output or RESULTS_DIR / f"{datetime.now():%Y%m%d-%H%M%S}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+    print(f"результаты: {output}")
+    if args.compare:
+        compare(report, json.loads(args.compare.read_text(encoding="utf-8")))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse
+import anyio
+import json
+import mimetypes
+import os
+import stat
+
+STATIC_DIR = "app/static"
+DIST_DIR = "dist"
+MANIFEST_PATH = os.path.join(STATIC_DIR, DIST_DIR, "manifest.json")
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# Бандлы: имя бандла -> исходные файлы в порядке подключения (пути от static/).
+BUNDLES = {
+    "css/core.css": [
+        "css/base.css",
+        "css/button.css",
+        "css/table.css",
+        "css/modals_forms.css",
+        "css/telegram-mobile.css",
+        "css/table-mobile.css",
+        "css/forms-mobile.css",
+        "css/modern-theme.css",
+    ],
+    "js/core.js": [
+        "js/app.js",
+        "js/telegram-mobile.js",
+    ],
+}
+
+# Ресурсы, которые без сборки берутся со стороннего адреса.
+EXTERNAL_FALLBACKS = {
+    "css/icons.css": "https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.4.0/css/all.min.css",
+}
+
+_manifest: dict | None = None
+
+
+def load_manifest() -> dict:
+    """Манифест сборки scripts/build_assets.py: логическое имя -> путь в dist/. Без сборки — пустой."""
+    global _manifest
+    if _manifest is None:
+        try:
+            with open(MANIFEST_PATH, encoding="utf-8") as f:
+                _manifest = json.load(f)
+        except FileNotFoundError:
+            _manifest = {}
+        except (OSError, ValueError) as e:
+            print(f"[WARN] Не удалось прочитать {MANIFEST_PATH}: {e}")
+            _manifest = {}
+    return _manifest
+
+
+def asset_urls(name: str) -> list:
+    """
+    URL ресурса для шаблона. После сборки — один файл с хэшем в имени;
+    без неё — исходные файлы бандла (или внешний адрес для иконок).
+    """
+    built = load_manifest().get(name)
+    if built:
+        return [f"/static/{built}"]
+    if name in EXTERNAL_FALLBACKS:
+        return [EXTERNAL_FALLBACKS[name]]
+    return [f"/static/{source}" for source in BUNDLES.get(name, [name])]
+
+
+def asset_url(name: str) -> str:
+    return asset_urls(name)[0]
+
+
+def install(env):
+    """
+    Регистрирует asset_url/asset_urls в окружении Jinja. Нужна любому Environment, который
+    рендерит шаблоны с base.html, — в том числе окружению основного приложения, если оно
+    рендерит их само, а не через app.core.templating.templates.
+    """
+    env.globals.update(asset_url=asset_url, asset_urls=asset_urls)
+
+
+class AssetFiles(StaticFiles):
+    """
+    StaticFiles для каталога со сборкой: файлы из dist/ отдаются с бессрочным кэшем
+    (имя меняется вместе с содержимым) и в предсжатом виде (.br/.gz), если клиент его принимает.
+    """
+
+    async def get_response(self, path, scope):
+        if not path.startswith(DIST_DIR + "/"):
+            return await super().get_response(path, scope)
+
+        accept = Headers(scope=scope).get("accept-encoding", "")
+        for encoding, suffix in (("br", ".br"), ("gzip", ".gz")):
+            if encoding not in accept:
+                continue
+            full_path, stat_result = await anyio.to_thread.run_sync(self.lookup_path, path + suffix)
+            if stat_result and stat.S_ISREG(stat_result.st_mode):
+                return FileResponse(
+                    full_path,
+                    stat_result=stat_result,
+                    media_type=mimetypes.guess_type(path)[0] or "application/octet-stream",
+                    headers={
+                        "Content-Encoding": encoding,
+                        "Cache-Control": IMMUTABLE_CACHE_CONTROL,
+                        "Vary": "Accept-Encoding",
+                    },
+                )
+
+        response = await super().get_response(path, scope)
+        response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+        response.headers["Vary"] = "Accept-Encoding"
+        return response
@@ -0,0 +1,53 @@
+from collections import OrderedDict
+import time
+
+MISSING = object()
+
+
+class TTLCache:
+    """
+    LRU-кэш с временем жизни записей. Ключ — (path, params); при переполнении
+    вытесняется давно не использованная запись. Просроченные записи остаются
+    до вытеснения — get_stale() отдаёт их, когда свежих данных получить нельзя.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+
+    @staticmethod
+    def key(path: str, params: dict | None = None):
+        return path, tuple(sorted((params or {}).items()))
+
+    def get(self, key):
+        entry = self._data.get(key)
+        if entry is None:
+            return MISSING
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            return MISSING
+        self._data.move_to_end(key)
+        return value
+
+    def get_stale(self, key):
+        """Значение без учёта срока жизни (MISSING, если записи нет)."""
+        entry = self._data.get(key)
+        return MISSING if entry is None else entry[1]
+
+    def set(self, key, value, ttl: float | None = None):
+        self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def invalidate(self, *prefixes: str):
+        """Удаляет записи, чей path начинается с любого из префиксов."""
+        for key in [key for key in self._data if key[0].startswith(prefixes)]:
+            del self._data[key]
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
@@ -0,0 +1,95 @@
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from datetime import date, datetime, timezone
+
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+DAY_MS = 86_400_000
+NO_DAY = -1
+
+
+def day_number(value) -> int:
+    """
+    День (число суток от 1970-01-01) для ISO-строки 'YYYY-MM-DD...' или метки времени в мс.
+    Для пустых и нераспознанных значений — NO_DAY.
+    """
+    if not value:
+        return NO_DAY
+    try:
+        if isinstance(value, str):
+            if len(value) >= 10 and value[4] == '-' and value[7] == '-':
+                return date.fromisoformat(value[:10]).toordinal() - EPOCH_ORDINAL
+            value = float(value)
+        return int(value) // DAY_MS
+    except (TypeError, ValueError, OverflowError):
+        return NO_DAY
+
+
+def day_of(d: date) -> int:
+    return d.toordinal() - EPOCH_ORDINAL
+
+
+def timestamp_ms(value) -> int:
+    """Метка времени в мс для числа (мс) или ISO-строки (без зоны — UTC, как day_number); 0, если значение не распознано."""
+    if not value:
+        return 0
+    try:
+        if isinstance(value, str):
+            try:
+                value = float(value)
+            except ValueError:
+                moment = datetime.fromisoformat(value.replace("Z", "+00:00"))
+                if moment.tzinfo is None:
+                    moment = moment.replace(tzinfo=timezone.utc)
+                return int(moment.timestamp() * 1000)
+        return int(value)
+    except (TypeError, ValueError, OverflowError):
+        return 0
+
+
+def to_int(value, default: int = -1) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def to_float(value, default: float = 0.0) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+class Columns:
+    """
+    Записи, разложенные по типизированным колонкам array.array
+    ('q' — int64, 'd' — float64, 'b' — флаги). Занимают 8 байт на значение вместо
+    словаря на запись; агрегаты считаются встроенными функциями над колонками.
+    """
+
+    def __init__(self, **typecodes: str):
+        self.columns = {name: array(code) for name, code in typecodes.items()}
+        self._appends = [column.append for column in self.columns.values()]
+
+    def append(self, *values):
+        """Добавляет строку: значения в порядке объявления колонок."""
+        for append, value in zip(self._appends, values):
+            append(value)
+
+    def __getitem__(self, name: str) -> array:
+        return self.columns[name]
+
+    def __len__(self):
+        return len(next(iter(self.columns.values()), ()))
+
+
+def histogram(column, keys) -> list:
+    """Число вхождений каждого из keys в колонку, за один проход."""
+    counts = Counter(column)
+    return [counts[key] for key in keys]
+
+
+def count_in_range(sorted_column, low, high) -> int:
+    """Число значений low <= v < high в отсортированной колонке."""
+    return bisect_left(sorted_column, high) - bisect_left(sorted_column, low)
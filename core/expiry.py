@@ -0,0 +1,122 @@
+from bisect import bisect_left, insort
+from app.core import mirror, upstream
+from app.core.columns import DAY_MS, timestamp_ms
+from app.core.snapshot import Snapshot
+import os
+import time
+
+# Индекс — единственный полный проход по ключам: из него же берут ключи дашборд и загрузка серверов.
+EXPIRY_INDEX_TTL = float(os.getenv("EXPIRY_INDEX_TTL", "60"))
+EXPIRY_WINDOWS = (1, 7, 30)
+
+
+def now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+class ExpiryIndex:
+    """
+    Ключи, упорядоченные по expiry_time: отсортированный список (срок в мс, email) и ключи по email.
+    Число ключей со сроком в [low, high) — два bisect, сами ключи диапазона — срез списка,
+    то есть O(log n + k) вместо обхода всех ключей. Ключи без срока хранятся с нулём
+    и в диапазоны, начинающиеся после 1970 года, не попадают.
+    """
+
+    def __init__(self, keys=()):
+        self.keys = {key["email"]: key for key in keys if isinstance(key, dict) and key.get("email") is not None}
+        self.order = sorted((timestamp_ms(key.get("expiry_time")), email) for email, key in self.keys.items())
+
+    def __len__(self):
+        return len(self.keys)
+
+    def add(self, key: dict):
+        email = key.get("email")
+        if email is None:
+            return
+        self.remove(email)
+        self.keys[email] = key
+        insort(self.order, (timestamp_ms(key.get("expiry_time")), email))
+
+    def remove(self, email):
+        key = self.keys.pop(email, None)
+        if key is None:
+            return
+        entry = (timestamp_ms(key.get("expiry_time")), email)
+        i = bisect_left(self.order, entry)
+        if i < len(self.order) and self.order[i] == entry:
+            del self.order[i]
+
+    def patch(self, email, fields: dict):
+        key = self.keys.get(email)
+        if key is not None:
+            self.remove(email)
+            self.add({**key, **fields})
+
+    def remove_where(self, field: str, value):
+        for key in [key for key in self.keys.values() if key.get(field) == value]:
+            self.remove(key["email"])
+
+    def _bounds(self, low: int, high: int) -> tuple:
+        # (low,) меньше любого (low, email): bisect даёт первую запись со сроком >= low.
+        return bisect_left(self.order, (low,)), bisect_left(self.order, (high,))
+
+    def count(self, low: int, high: int) -> int:
+        start, end = self._bounds(low, high)
+        return end - start
+
+    def between(self, low: int, high: int, newest_first: bool = False) -> list:
+        start, end = self._bounds(low, high)
+        entries = self.order[start:end]
+        if newest_first:
+            entries.reverse()
+        return [self.keys[email] for _, email in entries]
+
+    def expired(self, now: int) -> int:
+        return self.count(1, now)
+
+    def expiring(self, days: int, now: int) -> list:
+        """Истекают в ближайшие days дней, ближайшие первыми."""
+        return self.between(now, now + days * DAY_MS)
+
+    def recently_expired(self, days: int, now: int) -> list:
+        """Истекли за последние days дней, недавние первыми."""
+        return self.between(now - days * DAY_MS, now, newest_first=True)
+
+    def counters(self, now: int) -> dict:
+        counters = {"expired_total": self.expired(now)}
+        for days in EXPIRY_WINDOWS:
+            counters[f"expiring_{days}"] = self.count(now, now + days * DAY_MS)
+            counters[f"expired_{days}"] = self.count(now - days * DAY_MS, now)
+        return counters
+
+
+async def build_expiry_index() -> ExpiryIndex:
+    return ExpiryIndex([key async for key in mirror.stream("/keys/")])
+
+
+keys_index = Snapshot(build_expiry_index, EXPIRY_INDEX_TTL)
+
+
+def _on_invalidate(prefixes: tuple):
+    if "/keys/".startswith(prefixes):
+        keys_index.expire()
+
+
+upstream.on_invalidate(_on_invalidate)
+
+
+# --- запись через панель: изменения видны сразу, до пересборки индекса ---
+
+def patch(email, fields: dict):
+    if keys_index.value is not None and isinstance(fields, dict):
+        keys_index.value.patch(email, fields)
+
+
+def delete(email):
+    if keys_index.value is not None:
+        keys_index.value.remove(email)
+
+
+def delete_where(field: str, value):
+    if keys_index.value is not None:
+        keys_index.value.remove_where(field, value)
@@ -0,0 +1,119 @@
+from datetime import datetime, timedelta, timezone
+from fastapi.responses import JSONResponse, StreamingResponse
+from app.core.columns import timestamp_ms
+from app.core.fastjson import dumps, dumps_str
+import csv
+import io
+import os
+
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "65536"))
+EXPORT_FORMATS = {"csv": "text/csv; charset=utf-8", "ndjson": "application/x-ndjson"}
+
+# Excel и LibreOffice выполняют ячейки, начинающиеся с этих символов, как формулы.
+_FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+
+def _bound(value: str | None, end: bool = False) -> int | None:
+    if not value:
+        return None
+    moment = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)  # даты без зоны — UTC, как и во всей панели
+    if end and len(value) == 10:
+        moment += timedelta(days=1)  # ?to=2025-01-31 — включая весь этот день
+    return int(moment.timestamp() * 1000)
+
+
+def parse_range(date_from: str | None, date_to: str | None) -> tuple:
+    """Границы выгрузки в мс (UTC): from включительно, to — не включительно; ValueError для некорректной даты."""
+    return _bound(date_from), _bound(date_to, end=True)
+
+
+def parse_fields(fields: str | None) -> tuple:
+    return tuple(field.strip() for field in (fields or "").split(",") if field.strip())
+
+
+async def _in_range(items, date_field: str, start: int | None, end: int | None):
+    async for item in items:
+        if not isinstance(item, dict):
+            continue
+        if start is not None or end is not None:
+            moment = timestamp_ms(item.get(date_field))
+            if not moment or (start is not None and moment < start) or (end is not None and moment >= end):
+                continue
+        yield item
+
+
+def _cell(value):
+    if value is None:
+        return ""
+    if isinstance(value, (dict, list)):
+        return dumps_str(value)
+    if isinstance(value, str) and value.startswith(_FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+async def csv_chunks(items, fields: tuple):
+    """CSV с BOM (чтобы Excel узнал UTF-8) порциями около EXPORT_CHUNK_SIZE байт."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write("\ufeff")
+    writer.writerow(fields)
+    async for item in items:
+        writer.writerow([_cell(item.get(field)) for field in fields])
+        if buffer.tell() >= EXPORT_CHUNK_SIZE:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode("utf-8")
+
+
+async def ndjson_chunks(items, fields: tuple):
+    """Запись на строку; без fields — записи целиком, как их отдал upstream."""
+    parts = []
+    size = 0
+    async for item in items:
+        line = dumps({field: item.get(field) for field in fields} if fields else item) + b"\n"
+        parts.append(line)
+        size += len(line)
+        if size >= EXPORT_CHUNK_SIZE:
+            yield b"".join(parts)
+            parts = []
+            size = 0
+    yield b"".join(parts)
+
+
+async def _guarded(chunks, name: str):
+    try:
+        async for chunk in chunks:
+            yield chunk
+    except Exception as e:
+        # Заголовки уже отправлены: обрываем ответ, чтобы клиент не принял неполный файл за целый.
+        print(f"[ERROR] Выгрузка {name} прервана: {e}")
+        raise
+
+
+def export_response(name: str, items, fmt: str, fields: str | None, date_from: str | None, date_to: str | None,
+                    date_field: str = "created_at", default_fields: tuple = ()):
+    """
+    Выгрузка потока записей items в CSV или NDJSON. Записи читаются и отправляются порциями —
+    в памяти воркера не больше одной порции, сколько бы строк ни было в upstream.
+    fields — поля через запятую (для CSV по умолчанию default_fields), from/to — диапазон по date_field.
+    """
+    if fmt not in EXPORT_FORMATS:
+        return JSONResponse(status_code=400, content={"error": f"Формат: {', '.join(EXPORT_FORMATS)}"})
+    try:
+        start, end = parse_range(date_from, date_to)
+    except ValueError:
+        return JSONResponse(status_code=400, content={"error": "Некорректная дата: нужен ISO 8601 (2025-01-31)"})
+
+    selected = parse_fields(fields) or (default_fields if fmt == "csv" else ())
+    rows = _in_range(items, date_field, start, end)
+    chunks = csv_chunks(rows, selected) if fmt == "csv" else ndjson_chunks(rows, selected)
+    filename = f"{name}-{datetime.now():%Y%m%d-%H%M%S}.{fmt}"
+    return StreamingResponse(
+        _guarded(chunks, name),
+        media_type=EXPORT_FORMATS[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
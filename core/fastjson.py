@@ -0,0 +1,40 @@
+from fastapi.responses import JSONResponse
+import json
+
+try:
+    import orjson
+except ImportError:  # orjson необязателен: без него работает стандартный json
+    orjson = None
+
+
+def _default(obj):
+    to_dict = getattr(obj, "to_dict", None)
+    if to_dict is not None:
+        return to_dict()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def loads(data):
+    """Разбирает JSON из bytes/str (orjson, если установлен)."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(obj) -> bytes:
+    """Сериализует в UTF-8 JSON; записи из app.core.records — через to_dict()."""
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_PASSTHROUGH_DATACLASS | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def dumps_str(obj, **kwargs) -> str:
+    """Вариант dumps() для фильтра tojson в шаблонах (аргументы Jinja игнорируются)."""
+    return dumps(obj).decode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse на dumps(): быстрее на больших списках и понимает записи."""
+
+    def render(self, content) -> bytes:
+        return dumps(content)
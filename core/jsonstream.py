@@ -0,0 +1,64 @@
+import codecs
+import json
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = " \t\r\n"
+_DELIMITERS = _WHITESPACE + ",]"
+
+
+async def iter_json_array(chunks):
+    """
+    Разбирает JSON-массив верхнего уровня по мере поступления байтов и отдаёт элементы
+    по одному. В памяти держится только недочитанный хвост, а не всё тело ответа.
+    """
+    text = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    pos = 0
+    started = False
+    finished = False
+    eof = False
+    chunks = chunks.__aiter__()
+
+    while not finished:
+        if not eof:
+            try:
+                chunk = await chunks.__anext__()
+                buffer = buffer[pos:] + text.decode(chunk)
+            except StopAsyncIteration:
+                eof = True
+                buffer = buffer[pos:] + text.decode(b"", final=True)
+            pos = 0
+
+        while True:
+            while pos < len(buffer) and buffer[pos] in _WHITESPACE:
+                pos += 1
+            if pos >= len(buffer):
+                break
+
+            if not started:
+                if buffer[pos] != "[":
+                    raise ValueError("Ожидался JSON-массив")
+                started = True
+                pos += 1
+                continue
+            if buffer[pos] == ",":
+                pos += 1
+                continue
+            if buffer[pos] == "]":
+                finished = True
+                break
+
+            try:
+                item, end = _decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                break
+            # Скаляр в конце буфера мог быть обрезан (число "1.5" из "1.5e3") — ждём следующий кусок.
+            if not eof and not isinstance(item, (dict, list)) and (end == len(buffer) or buffer[end] not in _DELIMITERS):
+                break
+            pos = end
+            yield item
+
+        if eof and not finished:
+            raise ValueError("JSON-массив оборван")
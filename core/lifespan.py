@@ -0,0 +1,19 @@
+from contextlib import asynccontextmanager
+from app.core import mirror, snapshot, upstream
+
+
+@asynccontextmanager
+async def lifespan(app):
+    """
+    Подключается в приложении: FastAPI(lifespan=lifespan).
+    Открывает общий upstream-клиент, запускает синхронизацию зеркала (если задан MIRROR_PATH)
+    и останавливает фоновые задачи при выключении.
+    """
+    upstream.get_client()
+    await mirror.start()
+    try:
+        yield
+    finally:
+        await mirror.stop()
+        await snapshot.stop_all()
+        await upstream.close_client()
@@ -0,0 +1,129 @@
+from fastapi import Query
+import heapq
+import math
+
+PAGE_LIMIT_DEFAULT = 50
+PAGE_LIMIT_MAX = 500
+
+
+class ListParams:
+    """
+    Параметры списка из query string: ?page=&limit=&sort=&order=asc|desc&q=
+    Используется как Depends() в обработчиках страниц и /rows.
+    """
+
+    def __init__(
+        self,
+        page: int = Query(1, ge=1),
+        limit: int = Query(PAGE_LIMIT_DEFAULT, ge=1, le=PAGE_LIMIT_MAX),
+        sort: str | None = Query(None),
+        order: str = Query("asc"),
+        q: str | None = Query(None),
+    ):
+        self.page = page
+        self.limit = limit
+        self.sort = sort
+        self.desc = order == "desc"
+        self.q = (q or "").strip().lower()
+
+
+def _sort_key(field):
+    def key(item):
+        value = item.get(field)
+        return (value is None, isinstance(value, str), value if value is not None else 0)
+    return key
+
+
+class _Ranked:
+    """Элемент ограниченной кучи: на вершине — худшая из отобранных записей."""
+
+    __slots__ = ("key", "seq", "desc", "item")
+
+    def __init__(self, key, seq, desc, item):
+        self.key = key
+        self.seq = seq
+        self.desc = desc
+        self.item = item
+
+    def better_than(self, other):
+        if self.key != other.key:
+            return self.key > other.key if self.desc else self.key < other.key
+        return self.seq < other.seq
+
+    def __lt__(self, other):
+        return other.better_than(self)
+
+
+def _matches(item, needle, search_fields):
+    return any(needle in str(item.get(field) or "").lower() for field in search_fields)
+
+
+def paginate(items: list, params: ListParams, search_fields=(), sort_fields=(), record=None) -> dict:
+    """
+    Фильтрует items подстрокой q по search_fields, сортирует по sort (если поле разрешено)
+    и возвращает одну страницу: {"items", "total", "page", "limit", "pages"}.
+    record — класс из app.core.records: в него декодируются только записи страницы.
+    """
+    if params.q and search_fields:
+        needle = params.q
+        items = [item for item in items if _matches(item, needle, search_fields)]
+    if params.sort in sort_fields:
+        items = sorted(items, key=_sort_key(params.sort), reverse=params.desc)
+
+    total = len(items)
+    pages = max(1, math.ceil(total / params.limit))
+    page = min(params.page, pages)
+    start = (page - 1) * params.limit
+    items = items[start:start + params.limit]
+    return {
+        "items": record.from_list(items) if record else items,
+        "total": total,
+        "page": page,
+        "limit": params.limit,
+        "pages": pages,
+    }
+
+
+async def paginate_stream(items, params: ListParams, search_fields=(), sort_fields=(), on_item=None, record=None) -> dict:
+    """
+    То же, что paginate(), но для асинхронного потока записей: хранит только записи
+    нужной страницы (при сортировке — первые page * limit), а не весь список.
+    on_item вызывается для каждой прочитанной записи, например для подсчёта итогов.
+    """
+    needle = params.q if search_fields else ""
+    sort_field = params.sort if params.sort in sort_fields else None
+    keep = params.page * params.limit
+    sort_key = _sort_key(sort_field)
+    kept = []
+    total = 0
+
+    async for item in items:
+        if on_item is not None:
+            on_item(item)
+        if needle and not _matches(item, needle, search_fields):
+            continue
+        total += 1
+        if sort_field is None:
+            if total <= keep:
+                kept.append(item)
+            continue
+        ranked = _Ranked(sort_key(item), total, params.desc, item)
+        if len(kept) < keep:
+            heapq.heappush(kept, ranked)
+        elif ranked.better_than(kept[0]):
+            heapq.heapreplace(kept, ranked)
+
+    if sort_field is not None:
+        kept = [ranked.item for ranked in sorted(kept, reverse=True)]
+
+    pages = max(1, math.ceil(total / params.limit))
+    page = min(params.page, pages)
+    start = (page - 1) * params.limit
+    kept = kept[start:start + params.limit]
+    return {
+        "items": record.from_list(kept) if record else kept,
+        "total": total,
+        "page": page,
+        "limit": params.limit,
+        "pages": pages,
+    }
@@ -0,0 +1,175 @@
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+import httpx
+import re
+import time
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (1_000, 10_000, 100_000, 1_000_000, 10_000_000, 100_000_000)
+
+_registry: list = []
+# Фазы текущего запроса к панели для заголовка Server-Timing: имя -> секунды.
+_timings: ContextVar[dict | None] = ContextVar("timings", default=None)
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values: dict = {}
+        _registry.append(self)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for values, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labels, values)} {value:g}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels, value: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + value
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def inc(self, *labels, value: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + value
+
+    def dec(self, *labels, value: float = 1):
+        self.inc(*labels, value=-value)
+
+
+class Histogram(_Metric):
+    """Гистограмма с фиксированными границами: на каждое значение — bisect и два сложения."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = buckets
+
+    def observe(self, *labels, value: float):
+        series = self._values.get(labels)
+        if series is None:
+            # Счётчики по корзинам (последняя — +Inf), сумма, количество.
+            series = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for values, (counts, total, count) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += bucket_count
+                le = f'le="{bound if bound == "+Inf" else f"{bound:g}"}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, values, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, values)} {total:g}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, values)} {count}")
+        return lines
+
+
+http_duration = Histogram("panel_http_request_duration_seconds", "Время обработки запроса к панели (до начала ответа)", ("route", "method", "status"))
+http_inflight = Gauge("panel_http_requests_in_flight", "Запросы к панели в обработке")
+upstream_duration = Histogram("panel_upstream_request_duration_seconds", "Время до заголовков ответа upstream, одна попытка", ("endpoint", "method"))
+upstream_responses = Counter("panel_upstream_responses_total", "Ответы upstream по статусу (error — сетевая ошибка)", ("endpoint", "method", "status"))
+upstream_inflight = Gauge("panel_upstream_requests_in_flight", "Запросы к upstream в полёте")
+upstream_bytes = Histogram("panel_upstream_response_bytes", "Размер тела ответа upstream", ("endpoint",), SIZE_BUCKETS)
+decode_duration = Histogram("panel_upstream_decode_seconds", "Разбор JSON ответа upstream", ("endpoint",))
+render_duration = Histogram("panel_template_render_seconds", "Рендеринг шаблона", ("template",))
+
+
+def render() -> str:
+    """Все метрики в текстовом формате Prometheus."""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+_IDENTIFIER = re.compile(r"[a-z_]+")
+
+
+def endpoint_label(path: str) -> str:
+    """
+    Путь upstream без идентификаторов, чтобы число серий не росло с числом записей:
+    /users/123 -> /users/{id}, /keys/by_email/a@b -> /keys/by_email/{id}.
+    """
+    parts = [part for part in path.split("/") if part]
+    if not parts:
+        return "/"
+    label = [parts[0]]
+    for i, part in enumerate(parts[1:], start=1):
+        label.append(part if i < len(parts) - 1 and _IDENTIFIER.fullmatch(part) else "{id}")
+    return "/" + "/".join(label) + ("/" if path.endswith("/") and len(parts) == 1 else "")
+
+
+def start_timings() -> dict:
+    timings = {}
+    _timings.set(timings)
+    return timings
+
+
+def add_timing(phase: str, seconds: float):
+    timings = _timings.get()
+    if timings is not None:
+        timings[phase] = timings.get(phase, 0.0) + seconds
+
+
+@contextmanager
+def timed(phase: str):
+    """Добавляет длительность блока к фазе phase в Server-Timing текущего запроса."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_timing(phase, time.perf_counter() - started)
+
+
+def server_timing(timings: dict) -> str:
+    return ", ".join(f"{phase};dur={seconds * 1000:.1f}" for phase, seconds in timings.items())
+
+
+class MeteredTransport(httpx.AsyncBaseTransport):
+    """Транспорт upstream-клиента, который считает задержку, статусы и запросы в полёте."""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, base_path: str = ""):
+        self.transport = transport
+        self.base_path = base_path
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        endpoint = endpoint_label(request.url.path.removeprefix(self.base_path))
+        status = "error"
+        upstream_inflight.inc()
+        started = time.perf_counter()
+        try:
+            response = await self.transport.handle_async_request(request)
+            status = str(response.status_code)
+            return response
+        finally:
+            upstream_inflight.dec()
+            upstream_duration.observe(endpoint, request.method, value=time.perf_counter() - started)
+            upstream_responses.inc(endpoint, request.method, status)
+
+    async def aclose(self):
+        await self.transport.aclose()
@@ -0,0 +1,454 @@
+from dataclasses import dataclass
+from app.core.fastjson import dumps_str, loads
+from app.core.jsonstream import iter_json_array
+from app.core import upstream
+import asyncio
+import math
+import os
+import sqlite3
+import threading
+import time
+
+MIRROR_PATH = os.getenv("MIRROR_PATH", "")
+MIRROR_SYNC_INTERVAL = float(os.getenv("MIRROR_SYNC_INTERVAL", "60"))
+MIRROR_FULL_SYNC_INTERVAL = float(os.getenv("MIRROR_FULL_SYNC_INTERVAL", "3600"))
+# Параметр, которым upstream отдаёт только изменённые записи (?updated_after=...). По умолчанию пусто:
+# имя параметра у upstream не стандартное, поэтому каждая синхронизация полная, пока его не задать.
+# И с ним инкрементально синхронизируются только таблицы с водяным знаком (Table.watermark).
+MIRROR_SINCE_PARAM = os.getenv("MIRROR_SINCE_PARAM", "")
+MIRROR_BATCH = int(os.getenv("MIRROR_BATCH", "2000"))
+MIRROR_READ_BATCH = 1000
+
+
+@dataclass(frozen=True)
+class Table:
+    name: str
+    path: str
+    key: tuple
+    watermark: str
+    search: tuple = ()
+    columns: tuple = ()
+
+
+# Индексируемые колонки — поля сортировки и выборки по пользователю; вся запись лежит в data (JSON).
+# Водяной знак — поле, которое растёт при каждом изменении записи. У ключей (продление меняет
+# expiry_time) и подарков (is_used) такого поля нет, created_at правки не ловит — они синхронизируются
+# только целиком.
+TABLES = {table.name: table for table in (
+    Table("users", "/users/", ("tg_id",), "updated_at",
+          ("tg_id", "first_name", "username"),
+          ("tg_id", "first_name", "username", "balance", "trial", "created_at", "updated_at")),
+    Table("keys", "/keys/", ("email",), "",
+          ("email", "client_id", "tg_id"),
+          ("tg_id", "client_id", "email", "expiry_time", "server_id", "created_at")),
+    Table("payments", "/payments/", ("id",), "created_at",
+          ("id", "tg_id", "amount", "payment_system", "provider", "status"),
+          ("id", "tg_id", "amount", "provider", "created_at", "status")),
+    Table("gifts", "/gifts/", ("gift_id",), "",
+          ("gift_id", "sender_tg_id", "recipient_tg_id"),
+          ("gift_id", "sender_tg_id", "recipient_tg_id", "created_at", "selected_months", "tariff_id")),
+    Table("referrals", "/referrals/", ("referrer_tg_id", "referred_tg_id"), "created_at",
+          (), ("referrer_tg_id", "referred_tg_id", "created_at")),
+    Table("servers", "/servers/", ("server_name",), "", (), ("server_name",)),
+    Table("tariffs", "/tariffs/", ("name",), "", (), ("name",)),
+    Table("coupons", "/coupons/", ("code",), "",
+          ("id", "code", "amount", "days"),
+          ("id", "code", "amount", "usage_limit", "used_count")),
+)}
+TABLES_BY_PATH = {table.path: table for table in TABLES.values()}
+
+_local = threading.local()
+_ready: set = set()
+_dirty: set = set()
+# Одна синхронизация таблицы за раз: фоновая и по кнопке обновления не перетирают поколения друг друга.
+_sync_locks: dict = {}
+_wakeup: asyncio.Event | None = None
+_worker: asyncio.Task | None = None
+
+
+def enabled() -> bool:
+    return bool(MIRROR_PATH)
+
+
+def incremental(table: Table) -> bool:
+    """Таблицу можно досинхронизировать только изменёнными записями (MIRROR_SINCE_PARAM и водяной знак)."""
+    return bool(MIRROR_SINCE_PARAM and table.watermark)
+
+
+def ready(name: str) -> bool:
+    """Таблица хотя бы раз синхронизирована целиком — из неё можно читать вместо upstream."""
+    return name in _ready
+
+
+# --- SQLite: вызывается в потоках asyncio.to_thread, у каждого потока своё соединение ---
+
+def _connect() -> sqlite3.Connection:
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(MIRROR_PATH, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        _local.conn = conn
+    return conn
+
+
+def _init_schema():
+    conn = _connect()
+    with conn:
+        conn.execute("CREATE TABLE IF NOT EXISTS sync_state ("
+                     "name TEXT PRIMARY KEY, watermark, generation INTEGER NOT NULL DEFAULT 0, "
+                     "synced_at REAL, full_synced_at REAL)")
+        for table in TABLES.values():
+            columns = "".join(f", {column}" for column in table.columns)
+            conn.execute(f"CREATE TABLE IF NOT EXISTS {table.name} ("
+                         f"pk TEXT PRIMARY KEY, data TEXT NOT NULL, search TEXT, generation INTEGER{columns})")
+            existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table.name})")}
+            missing = [column for column in table.columns if column not in existing]
+            for column in missing:
+                conn.execute(f"ALTER TABLE {table.name} ADD COLUMN {column}")
+            if missing:
+                # Новая колонка в старом файле пуста — таблица не готова до следующей полной синхронизации.
+                conn.execute("DELETE FROM sync_state WHERE name = ?", (table.name,))
+            for column in table.columns:
+                conn.execute(f"CREATE INDEX IF NOT EXISTS {table.name}_{column} ON {table.name} ({column})")
+    return {name for (name,) in conn.execute("SELECT name FROM sync_state WHERE full_synced_at IS NOT NULL")}
+
+
+def _scalar(value):
+    if value is None or isinstance(value, (str, int, float)):
+        return value
+    return str(value)
+
+
+def _pk(table: Table, row: dict) -> str:
+    return "|".join(str(row.get(field)) for field in table.key)
+
+
+def _values(table: Table, row: dict, generation: int) -> tuple:
+    search = "\x1f".join(str(row.get(field) or "").lower() for field in table.search)
+    return (_pk(table, row), dumps_str(row), search, generation, *(_scalar(row.get(c)) for c in table.columns))
+
+
+def _upsert_sql(table: Table, only_changed: bool) -> str:
+    names = ("pk", "data", "search", "generation", *table.columns)
+    updates = ", ".join(f"{name}=excluded.{name}" for name in names[1:])
+    sql = (f"INSERT INTO {table.name} ({', '.join(names)}) VALUES ({', '.join('?' * len(names))}) "
+           f"ON CONFLICT(pk) DO UPDATE SET {updates}")
+    return sql + (f" WHERE {table.name}.data IS NOT excluded.data" if only_changed else "")
+
+
+def _write_batch(table: Table, rows: list, generation: int, only_changed: bool):
+    conn = _connect()
+    with conn:
+        conn.executemany(_upsert_sql(table, only_changed), [_values(table, row, generation) for row in rows])
+
+
+def _begin_sync(table: Table, full: bool) -> tuple:
+    conn = _connect()
+    with conn:
+        conn.execute("INSERT OR IGNORE INTO sync_state (name) VALUES (?)", (table.name,))
+        if full:
+            conn.execute("UPDATE sync_state SET generation = generation + 1 WHERE name = ?", (table.name,))
+        return conn.execute("SELECT watermark, generation FROM sync_state WHERE name = ?", (table.name,)).fetchone()
+
+
+def _finish_sync(table: Table, generation: int, watermark, full: bool) -> int:
+    """Сохраняет водяной знак; после полной синхронизации удаляет записи, которых нет в upstream."""
+    conn = _connect()
+    now = time.time()
+    removed = 0
+    with conn:
+        if full:
+            removed = conn.execute(f"DELETE FROM {table.name} WHERE generation IS NOT ?", (generation,)).rowcount
+            conn.execute("UPDATE sync_state SET full_synced_at = ? WHERE name = ?", (now, table.name))
+        conn.execute("UPDATE sync_state SET watermark = coalesce(?, watermark), synced_at = ? WHERE name = ?",
+                     (watermark, now, table.name))
+    return removed
+
+
+def _full_synced_at(table: Table):
+    row = _connect().execute("SELECT full_synced_at FROM sync_state WHERE name = ?", (table.name,)).fetchone()
+    return row[0] if row else None
+
+
+def _where(filters: dict, joiner: str = " AND ") -> tuple:
+    """Равенство по колонкам; список значений — IN (...). joiner — " OR " для совпадения по любой колонке."""
+    clauses, args = [], []
+    for column, value in filters.items():
+        if isinstance(value, (list, tuple, set)):
+            clauses.append(f"{column} IN ({', '.join('?' * len(value))})")
+            args.extend(value)
+        else:
+            clauses.append(f"{column} = ?")
+            args.append(value)
+    return (" WHERE " + joiner.join(clauses) if clauses else ""), args
+
+
+def _select(table: Table, filters: dict, joiner: str = " AND ") -> list:
+    where, args = _where(filters, joiner)
+    return [data for (data,) in _connect().execute(f"SELECT data FROM {table.name}{where} ORDER BY rowid", args)]
+
+
+def _select_greater(table: Table, column: str, value) -> list:
+    return [data for (data,) in _connect().execute(
+        f"SELECT data FROM {table.name} WHERE {column} > ? ORDER BY {column}", (value,)
+    )]
+
+
+def _select_after(table: Table, after: int, limit: int) -> list:
+    return _connect().execute(
+        f"SELECT rowid, data FROM {table.name} WHERE rowid > ? ORDER BY rowid LIMIT ?", (after, limit)
+    ).fetchall()
+
+
+def _count(table: Table) -> int:
+    return _connect().execute(f"SELECT count(*) FROM {table.name}").fetchone()[0]
+
+
+def _page(table: Table, needle: str, sort: str | None, desc: bool, page: int, limit: int) -> tuple:
+    conn = _connect()
+    where, args = (" WHERE instr(search, ?) > 0", [needle]) if needle and table.search else ("", [])
+    total = conn.execute(f"SELECT count(*) FROM {table.name}{where}", args).fetchone()[0]
+    pages = max(1, math.ceil(total / limit))
+    page = min(page, pages)
+    if sort:
+        # Как listing._sort_key: пустые значения в конце, при обратном порядке — в начале.
+        direction = "DESC" if desc else "ASC"
+        order = f" ORDER BY {sort} IS NULL {direction}, {sort} {direction}, rowid"
+    else:
+        order = " ORDER BY rowid"
+    rows = conn.execute(f"SELECT data FROM {table.name}{where}{order} LIMIT ? OFFSET ?",
+                        [*args, limit, (page - 1) * limit]).fetchall()
+    return [data for (data,) in rows], total, page, pages
+
+
+def _patch(table: Table, pk: str, fields: dict):
+    conn = _connect()
+    with conn:
+        row = conn.execute(f"SELECT data, generation FROM {table.name} WHERE pk = ?", (pk,)).fetchone()
+        if row is None:
+            return
+        data = {**loads(row[0]), **fields}
+        if _pk(table, data) != pk:
+            conn.execute(f"DELETE FROM {table.name} WHERE pk = ?", (pk,))
+        conn.execute(_upsert_sql(table, False), _values(table, data, row[1]))
+
+
+def _upsert_one(table: Table, row: dict):
+    conn = _connect()
+    with conn:
+        generation = conn.execute("SELECT generation FROM sync_state WHERE name = ?", (table.name,)).fetchone()
+        conn.execute(_upsert_sql(table, False), _values(table, row, generation[0] if generation else 0))
+
+
+def _delete(table: Table, filters: dict) -> int:
+    where, args = _where(filters)
+    conn = _connect()
+    with conn:
+        return conn.execute(f"DELETE FROM {table.name}{where}", args).rowcount
+
+
+# --- синхронизация ---
+
+async def sync_table(table: Table, full: bool = False):
+    """
+    Загружает таблицу из upstream потоком и пишет пачками по MIRROR_BATCH.
+    Неполная синхронизация просит у upstream только записи новее водяного знака
+    (MIRROR_SINCE_PARAM) и не удаляет записи; полная — помечает все записи поколением
+    и в конце удаляет те, что в upstream не пришли.
+    """
+    lock = _sync_locks.setdefault(table.name, asyncio.Lock())
+    async with lock:
+        return await _sync_table(table, full or not incremental(table))
+
+
+async def _sync_table(table: Table, full: bool):
+    watermark, generation = await asyncio.to_thread(_begin_sync, table, full)
+    params = {MIRROR_SINCE_PARAM: watermark} if not full and watermark is not None else None
+
+    newest = None
+    batch = []
+    count = 0
+    async with upstream.get_client().stream("GET", table.path, params=params) as response:
+        response.raise_for_status()
+        async for row in iter_json_array(response.aiter_bytes()):
+            if not isinstance(row, dict):
+                continue
+            mark = row.get(table.watermark) if table.watermark else None
+            if mark is not None and (newest is None or mark > newest):
+                newest = mark
+            batch.append(row)
+            count += 1
+            if len(batch) >= MIRROR_BATCH:
+                await asyncio.to_thread(_write_batch, table, batch, generation, not full)
+                batch = []
+    if batch:
+        await asyncio.to_thread(_write_batch, table, batch, generation, not full)
+    removed = await asyncio.to_thread(_finish_sync, table, generation, newest, full)
+    if full:
+        _ready.add(table.name)
+    return count, removed
+
+
+async def sync_all(names=None, full: bool = False):
+    for table in TABLES.values():
+        if names is not None and table.name not in names:
+            continue
+        try:
+            last_full = await asyncio.to_thread(_full_synced_at, table)
+            due = full or last_full is None or time.time() - last_full >= MIRROR_FULL_SYNC_INTERVAL
+            await sync_table(table, full=due)
+        except Exception as e:
+            print(f"[ERROR] Синхронизация зеркала {table.name}: {e}")
+
+
+async def _run():
+    while True:
+        names = set(_dirty) or None
+        _dirty.clear()
+        await sync_all(names)
+        try:
+            await asyncio.wait_for(_wakeup.wait(), MIRROR_SYNC_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        _wakeup.clear()
+
+
+def _on_invalidate(prefixes: tuple):
+    """
+    После записи через панель досинхронизировать затронутые таблицы, не дожидаясь интервала, —
+    только инкрементальные: сама запись уже применена к зеркалу (upsert/patch/delete), а полная
+    загрузка таблицы на каждую правку стоила бы upstream размер таблицы на каждую запись.
+    """
+    for table in TABLES.values():
+        if table.path.startswith(prefixes) and incremental(table):
+            _dirty.add(table.name)
+    if _dirty and _wakeup is not None:
+        _wakeup.set()
+
+
+async def sync_paths(*paths):
+    """Синхронизирует таблицы путей сейчас и дожидается конца (обновление дашборда); без зеркала — ничего."""
+    if _worker is None:
+        return
+    await sync_all({table.name for table in TABLES.values() if table.path in paths})
+
+
+async def start():
+    """Подключается в lifespan: создаёт схему и фоновую синхронизацию. Без MIRROR_PATH ничего не делает."""
+    global _wakeup, _worker
+    if not enabled() or _worker is not None:
+        return
+    synced = await asyncio.to_thread(_init_schema)
+    # Файл остаётся между перезапусками: синхронизированные раньше таблицы доступны сразу.
+    _ready.update(synced)
+    _wakeup = asyncio.Event()
+    upstream.on_invalidate(_on_invalidate)
+    _worker = asyncio.create_task(_run())
+
+
+async def stop():
+    global _worker
+    if _worker is not None:
+        _worker.cancel()
+        try:
+            await _worker
+        except asyncio.CancelledError:
+            pass
+        _worker = None
+
+
+# --- чтение ---
+
+async def page(name: str, params, sort_fields=(), record=None) -> dict | None:
+    """
+    Страница списка из зеркала в формате listing.paginate(): поиск, сортировка и LIMIT/OFFSET
+    выполняет SQLite по индексам. None — таблица ещё не готова, читать нужно из upstream.
+    """
+    if not ready(name):
+        return None
+    table = TABLES[name]
+    sort = params.sort if params.sort in sort_fields and params.sort in table.columns else None
+    rows, total, current, pages = await asyncio.to_thread(
+        _page, table, params.q, sort, params.desc, params.page, params.limit,
+    )
+    items = [loads(row) for row in rows]
+    return {
+        "items": record.from_list(items) if record else items,
+        "total": total,
+        "page": current,
+        "limit": params.limit,
+        "pages": pages,
+    }
+
+
+async def count(name: str) -> int | None:
+    if not ready(name):
+        return None
+    return await asyncio.to_thread(_count, TABLES[name])
+
+
+async def rows(name: str, /, **filters) -> list | None:
+    """Записи по равенству индексированных колонок (rows("keys", tg_id=...)); None — таблица не готова."""
+    if not ready(name):
+        return None
+    return [loads(data) for data in await asyncio.to_thread(_select, TABLES[name], filters)]
+
+
+async def rows_any(name: str, /, **filters) -> list | None:
+    """Записи, совпавшие хотя бы по одной колонке (подарки отправленные или полученные); None — таблица не готова."""
+    if not ready(name):
+        return None
+    return [loads(data) for data in await asyncio.to_thread(_select, TABLES[name], filters, " OR ")]
+
+
+async def since(name: str, column: str, value) -> list | None:
+    """Записи с column > value по индексу (новые платежи после известного id); None — таблица не готова."""
+    if not ready(name) or column not in TABLES[name].columns:
+        return None
+    return [loads(data) for data in await asyncio.to_thread(_select_greater, TABLES[name], column, value)]
+
+
+async def load(path: str):
+    """Весь список path: из зеркала, если оно готово, иначе get_json()."""
+    table = TABLES_BY_PATH.get(path)
+    if table is None or not ready(table.name):
+        return await upstream.get_json(path)
+    return await rows(table.name)
+
+
+async def stream(path: str, cache: bool = True):
+    """Записи path по одной: из зеркала пачками по rowid, иначе stream_json(path, cache=cache)."""
+    table = TABLES_BY_PATH.get(path)
+    if table is None or not ready(table.name):
+        async for item in upstream.stream_json(path, cache=cache):
+            yield item
+        return
+    after = 0
+    while True:
+        batch = await asyncio.to_thread(_select_after, table, after, MIRROR_READ_BATCH)
+        if not batch:
+            return
+        for rowid, data in batch:
+            yield loads(data)
+        after = batch[-1][0]
+
+
+# --- запись через панель ---
+
+async def upsert(name: str, row: dict):
+    """Запись, которую вернул upstream после создания или изменения (без ключевых полей — пропускается)."""
+    if ready(name) and isinstance(row, dict) and all(row.get(field) is not None for field in TABLES[name].key):
+        await asyncio.to_thread(_upsert_one, TABLES[name], row)
+
+
+async def patch(name: str, fields: dict, /, **key):
+    """Дописывает поля в запись по ключу (patch("users", payload, tg_id=...))."""
+    if ready(name) and isinstance(fields, dict):
+        await asyncio.to_thread(_patch, TABLES[name], _pk(TABLES[name], key), fields)
+
+
+async def delete(name: str, /, **filters):
+    """Удаляет записи по равенству колонок (delete("keys", tg_id=...), delete("keys", email=[...]))."""
+    if ready(name) and filters:
+        await asyncio.to_thread(_delete, TABLES[name], filters)
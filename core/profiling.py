@@ -0,0 +1,207 @@
+from collections import Counter
+from contextvars import ContextVar
+from datetime import datetime
+import asyncio
+import hmac
+import inspect
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.005"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(tempfile.gettempdir(), "web-profiles"))
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "50"))
+
+PROFILE_HEADER = "x-profile"
+PROFILE_QUERY = "_profile"
+
+_current: ContextVar["RequestProfile | None"] = ContextVar("profile", default=None)
+_active: list = []
+_previous_factory = None
+
+
+def authorized(request) -> bool:
+    """Запрос несёт PROFILE_TOKEN в заголовке X-Profile или параметре _profile. Без токена в env — выключено."""
+    if not PROFILE_TOKEN:
+        return False
+    supplied = request.headers.get(PROFILE_HEADER) or request.query_params.get(PROFILE_QUERY) or ""
+    return hmac.compare_digest(supplied.encode(), PROFILE_TOKEN.encode())
+
+
+def requested(request, route_path: str) -> bool:
+    """Профилировать ли запрос: есть токен, и это не выгрузка самих профилей."""
+    return not route_path.startswith("/profiles") and authorized(request)
+
+
+def _label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_qualname} ({os.path.basename(code.co_filename)})"
+
+
+def _running_stack(thread_id: int, root_frame) -> list:
+    """Кадры потока цикла событий начиная с корутины задачи (кадры самого цикла отбрасываются)."""
+    frame = sys._current_frames().get(thread_id)
+    frames = []
+    while frame is not None:
+        frames.append(frame)
+        if frame is root_frame:
+            break
+        frame = frame.f_back
+    return frames[::-1]
+
+
+def _await_stack(coro) -> tuple:
+    """Цепочка await приостановленной задачи: кадры корутин и подпись того, чего она ждёт."""
+    frames = []
+    while coro is not None:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "ag_frame", None) or getattr(coro, "gi_frame", None)
+        if frame is None:
+            return frames, f"[await {type(coro).__name__}]"
+        frames.append(frame)
+        awaited = getattr(coro, "cr_await", None) or getattr(coro, "ag_await", None) or getattr(coro, "gi_yieldfrom", None)
+        if awaited is None and inspect.iscoroutine(coro) and inspect.getcoroutinestate(coro) == inspect.CORO_CREATED:
+            return frames, "[scheduled]"  # задача создана, но цикл до неё ещё не дошёл
+        coro = awaited
+    return frames, None
+
+
+class RequestProfile:
+    """
+    Сэмплирующий профиль одного запроса: фоновый поток раз в PROFILE_INTERVAL снимает стеки
+    всех задач запроса — выполняющейся (код Python) и ждущих (цепочка await до Future).
+    Результат — folded stacks: строка "кадр;кадр;кадр количество" для flamegraph.pl/speedscope.
+    """
+
+    def __init__(self, name: str, anchor=None):
+        self.name = name
+        # Код обработчика запроса: кадры ниже него (ASGI-сервер, middleware) в профиль не идут.
+        self.anchor = anchor
+        self.tasks: list = []
+        self.samples = Counter()
+        self.active = True
+        self.started = time.perf_counter()
+        self.duration = 0.0
+        self._thread_id = threading.get_ident()
+        self._sampler = threading.Thread(target=self._run, name=f"profile {name}", daemon=True)
+
+    def _sample(self):
+        for task in list(self.tasks):
+            if task.done():
+                continue
+            coro = task.get_coro()
+            if getattr(coro, "cr_running", False):
+                frames, leaf = _running_stack(self._thread_id, coro.cr_frame), None
+            else:
+                frames, leaf = _await_stack(coro)
+            codes = [frame.f_code for frame in frames]
+            if self.anchor in codes:
+                frames = frames[codes.index(self.anchor):]
+            stack = [_label(frame) for frame in frames]
+            if leaf:
+                stack.append(leaf)
+            if stack:
+                self.samples[";".join([self.name, *stack])] += 1
+
+    def _run(self):
+        while self.active:
+            try:
+                self._sample()
+            except (RuntimeError, ValueError):
+                pass  # задача завершилась между проверкой и чтением кадров
+            time.sleep(PROFILE_INTERVAL)
+
+    def start(self):
+        self._sampler.start()
+
+    def stop(self):
+        if not self.active:
+            return
+        self.active = False
+        self.duration = time.perf_counter() - self.started
+        self._sampler.join()
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+
+def _task_factory(loop, coro, **kwargs):
+    if _previous_factory is not None:
+        task = _previous_factory(loop, coro, **kwargs)
+    else:
+        task = asyncio.Task(coro, loop=loop, **kwargs)
+    profile = _current.get()
+    if profile is not None and profile.active:
+        profile.tasks.append(task)
+    return task
+
+
+def start(name: str) -> RequestProfile:
+    """
+    Начинает профиль текущего запроса. Пока активен хотя бы один профиль, фабрика задач
+    цикла отмечает задачи, созданные внутри запроса (gather, объединённые запросы upstream,
+    потоковая отдача), — остальные запросы не сэмплируются.
+    """
+    global _previous_factory
+    loop = asyncio.get_running_loop()
+    if not _active:
+        _previous_factory = loop.get_task_factory()
+        loop.set_task_factory(_task_factory)
+    profile = RequestProfile(name, anchor=sys._getframe(1).f_code)
+    profile.tasks.append(asyncio.current_task())
+    _active.append(profile)
+    _current.set(profile)
+    profile.start()
+    return profile
+
+
+def _slug(value: str) -> str:
+    return re.sub(r"[^A-Za-z0-9]+", "-", value).strip("-")[:60] or "root"
+
+
+def _save(profile: RequestProfile) -> str | None:
+    name = f"{datetime.now():%Y%m%d-%H%M%S}-{_slug(profile.name)}-{uuid.uuid4().hex[:6]}.folded"
+    try:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        with open(os.path.join(PROFILE_DIR, name), "w", encoding="utf-8") as f:
+            f.write(profile.folded())
+        for old in saved()[PROFILE_KEEP:]:
+            os.remove(os.path.join(PROFILE_DIR, old))
+    except OSError as e:
+        print(f"[ERROR] Не удалось сохранить профиль {name}: {e}")
+        return None
+    print(f"[INFO] Профиль {profile.name}: {profile.duration * 1000:.0f} мс, "
+          f"{sum(profile.samples.values())} сэмплов -> {name}")
+    return name
+
+
+async def finish(profile: RequestProfile) -> str | None:
+    """Останавливает профиль и сохраняет его в PROFILE_DIR (запись файла — в потоке); возвращает имя файла."""
+    global _previous_factory
+    if profile not in _active:
+        return None  # уже закрыт
+    profile.stop()
+    _active.remove(profile)
+    if not _active:
+        asyncio.get_running_loop().set_task_factory(_previous_factory)
+        _previous_factory = None
+    return await asyncio.to_thread(_save, profile)
+
+
+def saved() -> list:
+    """Сохранённые профили, новые первыми."""
+    try:
+        return sorted((f for f in os.listdir(PROFILE_DIR) if f.endswith(".folded")), reverse=True)
+    except FileNotFoundError:
+        return []
+
+
+def load(name: str) -> str | None:
+    if name not in saved():
+        return None
+    with open(os.path.join(PROFILE_DIR, name), encoding="utf-8") as f:
+        return f.read()
@@ -0,0 +1,24 @@
+import asyncio
+import time
+
+
+class RateLimiter:
+    """
+    Равномерно распределяет запросы во времени: не больше rate вызовов acquire() в секунду.
+    rate <= 0 — без ограничения.
+    """
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate if rate > 0 else 0
+        self._next_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next_at - now
+            self._next_at = max(now, self._next_at) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
@@ -0,0 +1,231 @@
+from dataclasses import dataclass, fields
+from datetime import datetime
+from functools import lru_cache
+
+
+@lru_cache(maxsize=8192)
+def _expiry_texts(minute: int):
+    seconds = minute * 60
+    return (
+        datetime.fromtimestamp(seconds).strftime("%Y-%m-%d"),
+        datetime.utcfromtimestamp(seconds).strftime("%d.%m.%Y %H:%M"),
+    )
+
+
+def expiry_texts(expiry_ms):
+    """
+    (дата 'YYYY-MM-DD', 'ДД.ММ.ГГГГ ЧЧ:ММ') для метки времени в мс.
+    Результат кэшируется по минуте — ключи с близким сроком не форматируются заново.
+    """
+    if not isinstance(expiry_ms, (int, float)) or not expiry_ms:
+        return None, "—"
+    return _expiry_texts(int(expiry_ms) // 60000)
+
+
+@lru_cache(maxsize=8192)
+def _iso_human(prefix: str) -> str:
+    return datetime.fromisoformat(prefix).strftime("%d.%m.%Y %H:%M")
+
+
+def iso_human(value):
+    """'ДД.ММ.ГГГГ ЧЧ:ММ' для ISO-строки; нераспознанная строка возвращается как есть, пустая — '—'."""
+    if not value:
+        return "—"
+    try:
+        # В вывод попадают только дата и минуты — по ним и кэшируем.
+        return _iso_human(value[:16] if len(value) >= 16 else value)
+    except (TypeError, ValueError):
+        return value
+
+
+class Record:
+    """
+    База компактных записей upstream: поля хранятся в слотах, неизвестные ключи —
+    в extra (None, если их нет). Шаблоны читают поля как атрибуты, JSON — через to_dict().
+    """
+
+    __slots__ = ()
+
+    @classmethod
+    def _schema(cls):
+        schema = cls.__dict__.get("_schema_cache")
+        if schema is None:
+            names = tuple(field.name for field in fields(cls) if field.name != "extra")
+            schema = cls._schema_cache = (names, frozenset(names))
+        return schema
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        names, known = cls._schema()
+        record = cls(*[data.get(name) for name in names])
+        if not known.issuperset(data):
+            record.extra = {key: value for key, value in data.items() if key not in known}
+        return record
+
+    @classmethod
+    def from_list(cls, items) -> list:
+        return [cls.from_dict(item) for item in items]
+
+    @classmethod
+    def field_names(cls) -> tuple:
+        """Известные поля записи в порядке объявления (без extra)."""
+        return cls._schema()[0]
+
+    def __getitem__(self, name):
+        # Jinja пробует obj[name], если атрибута нет — так шаблонам доступны и поля из extra.
+        if name in self._schema()[1]:
+            return getattr(self, name)
+        if self.extra and name in self.extra:
+            return self.extra[name]
+        raise KeyError(name)
+
+    def get(self, name, default=None):
+        if name in self._schema()[1]:
+            value = getattr(self, name)
+        else:
+            value = (self.extra or {}).get(name)
+        return default if value is None else value
+
+    def to_dict(self) -> dict:
+        data = {name: getattr(self, name) for name in self._schema()[0]}
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+
+@dataclass(slots=True)
+class User(Record):
+    tg_id: int | None = None
+    username: str | None = None
+    first_name: str | None = None
+    last_name: str | None = None
+    balance: float | None = None
+    trial: int | None = None
+    created_at: str | None = None
+    updated_at: str | None = None
+    extra: dict | None = None
+
+    @property
+    def last_active(self):
+        return self.updated_at
+
+
+@dataclass(slots=True)
+class Key(Record):
+    tg_id: int | None = None
+    email: str | None = None
+    client_id: str | None = None
+    server_id: str | None = None
+    key: str | None = None
+    remnawave_link: str | None = None
+    alias: str | None = None
+    tariff_id: int | None = None
+    is_frozen: bool | None = None
+    expiry_time: int | None = None
+    created_at: int | str | None = None
+    extra: dict | None = None
+
+    @property
+    def expiry_date(self):
+        return expiry_texts(self.expiry_time)[0]
+
+    @property
+    def expiry_time_human(self):
+        return expiry_texts(self.expiry_time)[1]
+
+    def to_dict(self) -> dict:
+        data = Record.to_dict(self)
+        data["expiry_date"], data["expiry_time_human"] = expiry_texts(self.expiry_time)
+        return data
+
+
+@dataclass(slots=True)
+class Payment(Record):
+    id: int | None = None
+    tg_id: int | None = None
+    amount: float | None = None
+    provider: str | None = None
+    payment_system: str | None = None
+    status: str | None = None
+    created_at: str | None = None
+    extra: dict | None = None
+
+
+@dataclass(slots=True)
+class Gift(Record):
+    gift_id: str | None = None
+    sender_tg_id: int | None = None
+    recipient_tg_id: int | None = None
+    selected_months: int | None = None
+    tariff_id: int | None = None
+    max_usages: int | None = None
+    gift_link: str | None = None
+    comment: str | None = None
+    is_used: bool | None = None
+    is_unlimited: bool | None = None
+    expiry_time: str | None = None
+    created_at: str | None = None
+    extra: dict | None = None
+
+    @property
+    def created_at_human(self):
+        return iso_human(self.created_at)
+
+    def to_dict(self) -> dict:
+        data = Record.to_dict(self)
+        data["created_at_human"] = self.created_at_human
+        return data
+
+
+@dataclass(slots=True)
+class Referral(Record):
+    id: int | None = None
+    referrer_tg_id: int | None = None
+    referred_tg_id: int | None = None
+    reward_issued: bool | None = None
+    bonus: float | None = None
+    created_at: str | None = None
+    extra: dict | None = None
+
+
+@dataclass(slots=True)
+class Server(Record):
+    id: int | None = None
+    server_name: str | None = None
+    cluster_name: str | None = None
+    api_url: str | None = None
+    subscription_url: str | None = None
+    inbound_id: str | None = None
+    panel_type: str | None = None
+    tariff_group: str | None = None
+    max_keys: int | None = None
+    enabled: bool | None = None
+    extra: dict | None = None
+
+
+@dataclass(slots=True)
+class Tariff(Record):
+    id: int | None = None
+    name: str | None = None
+    group_code: str | None = None
+    subgroup_title: str | None = None
+    price_rub: float | None = None
+    duration_days: int | None = None
+    traffic_limit: int | None = None
+    device_limit: int | None = None
+    is_active: bool | None = None
+    extra: dict | None = None
+
+
+@dataclass(slots=True)
+class Coupon(Record):
+    id: int | None = None
+    code: str | None = None
+    amount: float | None = None
+    days: int | None = None
+    usage_limit: int | None = None
+    usage_count: int | None = None
+    used_count: int | None = None
+    is_used: bool | None = None
+    link: str | None = None
+    extra: dict | None = None
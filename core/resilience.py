@@ -0,0 +1,140 @@
+import asyncio
+import httpx
+import random
+import time
+
+RETRY_STATUSES = (502, 503, 504)
+IDEMPOTENT_METHODS = ("GET", "HEAD")
+
+
+class CircuitOpenError(httpx.TransportError):
+    """Запрос не отправлен: upstream недавно отказывал подряд, ждём reset_timeout."""
+
+
+class CircuitBreaker:
+    """
+    После threshold отказов подряд перестаёт пропускать запросы на reset_timeout секунд,
+    затем пропускает один пробный: удачный закрывает цепь, неудачный снова открывает.
+    threshold <= 0 — выключен.
+    """
+
+    def __init__(self, threshold: int, reset_timeout: float):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: float | None = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.reset_timeout:
+            return "open"
+        return "half-open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "open" or self._probing:
+            return False
+        self._probing = True
+        return True
+
+    def release(self):
+        """Пробный запрос завершился без ответа upstream: следующий запрос станет новым пробным."""
+        self._probing = False
+
+    def success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def failure(self):
+        self.failures += 1
+        self._probing = False
+        if self.threshold > 0 and (self.failures >= self.threshold or self.opened_at is not None):
+            if self.opened_at is None:
+                print(f"[WARN] upstream: {self.failures} отказов подряд, запросы приостановлены на {self.reset_timeout:g} сек")
+            self.opened_at = time.monotonic()
+
+
+class RetryBudget:
+    """
+    Повторы не чаще ratio от числа запросов: каждый запрос добавляет ratio жетона,
+    повтор тратит один. capacity — запас на редкие сбои при малом трафике.
+    """
+
+    def __init__(self, ratio: float, capacity: float):
+        self.ratio = ratio
+        self.capacity = capacity
+        self._tokens = capacity
+
+    def deposit(self):
+        self._tokens = min(self.capacity, self._tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+
+class ResilientTransport(httpx.AsyncBaseTransport):
+    """
+    Обёртка транспорта общего upstream-клиента: таймауты по пути запроса (timeout_for),
+    повторы идемпотентных запросов с jitter в пределах бюджета и автомат отключения.
+    Ошибкой upstream считаются сетевые сбои и ответы 502/503/504.
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, timeout_for, breaker: CircuitBreaker,
+                 budget: RetryBudget, retries: int, backoff: float):
+        self.transport = transport
+        self.timeout_for = timeout_for
+        self.breaker = breaker
+        self.budget = budget
+        self.retries = retries
+        self.backoff = backoff
+
+    def _may_retry(self, request: httpx.Request, attempt: int) -> bool:
+        return (
+            request.method in IDEMPOTENT_METHODS
+            and attempt < self.retries
+            and self.breaker.state == "closed"
+            and self.budget.withdraw()
+        )
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        request.extensions["timeout"] = self.timeout_for(request.url.path).as_dict()
+        self.budget.deposit()
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                raise CircuitOpenError(f"upstream недоступен, запрос {request.method} {request.url.path} не отправлен", request=request)
+            try:
+                response = await self.transport.handle_async_request(request)
+            except httpx.TransportError:
+                self.breaker.failure()
+                if not self._may_retry(request, attempt):
+                    raise
+            except BaseException:
+                # Отмена (клиент ушёл, wait_for) или чужое исключение ничего не говорят о upstream:
+                # не считаем отказом, но освобождаем место пробного запроса — иначе цепь
+                # осталась бы полуоткрытой навсегда.
+                self.breaker.release()
+                raise
+            else:
+                if response.status_code not in RETRY_STATUSES:
+                    self.breaker.success()
+                    return response
+                self.breaker.failure()
+                if not self._may_retry(request, attempt):
+                    return response
+                await response.aclose()
+            attempt += 1
+            # Full jitter: повторы разных запросов не приходят в upstream одной волной.
+            await asyncio.sleep(random.uniform(0, self.backoff * 2 ** attempt))
+
+    async def aclose(self):
+        await self.transport.aclose()
@@ -0,0 +1,217 @@
+from datetime import date, datetime
+from app.core import mirror, upstream
+from app.core.columns import EPOCH_ORDINAL, NO_DAY, day_number, day_of, to_float, to_int
+from app.core.snapshot import Snapshot
+import heapq
+import os
+import time
+
+ROLLUP_REFRESH_INTERVAL = float(os.getenv("ROLLUP_REFRESH_INTERVAL", "60"))
+ROLLUP_FULL_INTERVAL = float(os.getenv("ROLLUP_FULL_INTERVAL", "86400"))
+# Статусы платежей, которые считаются выручкой (и на дашборде); пусто — все платежи.
+# Со списком статусов новые платежи по id не добираются: платёж, пропущенный по статусу,
+# может позже стать успешным с тем же id, поэтому корзины каждый раз пересобираются целиком.
+REVENUE_STATUSES = frozenset(s.strip() for s in os.getenv("REVENUE_STATUSES", "").split(",") if s.strip())
+# Параметр /payments/, с которым upstream отдаёт только платежи с id больше значения (например after_id).
+# Пусто — без зеркала новые платежи не выбрать: корзины каждые ROLLUP_REFRESH_INTERVAL собираются
+# заново потоком по всему /payments/ (как дашборд считал платежи до корзин).
+ROLLUP_SINCE_PARAM = os.getenv("ROLLUP_SINCE_PARAM", "")
+
+GRANULARITIES = ("day", "week", "month")
+
+
+def _date(day: int) -> date:
+    return date.fromordinal(day + EPOCH_ORDINAL)
+
+
+def month_of(day: int) -> int:
+    d = _date(day)
+    return d.year * 12 + d.month - 1
+
+
+def period_of(day: int, granularity: str) -> int:
+    """Ключ периода: день, понедельник недели (номер дня) или месяц (год * 12 + месяц - 1)."""
+    if granularity == "week":
+        return day - (day + 3) % 7  # 1970-01-01 — четверг
+    if granularity == "month":
+        return month_of(day)
+    return day
+
+
+def period_label(key: int, granularity: str) -> str:
+    if granularity == "month":
+        return f"{key // 12:04d}-{key % 12 + 1:02d}"
+    return _date(key).isoformat()
+
+
+def _add(buckets: dict, key: int, amount: float):
+    bucket = buckets.get(key)
+    if bucket is None:
+        buckets[key] = [1, amount]
+    else:
+        bucket[0] += 1
+        bucket[1] += amount
+
+
+def _sum(buckets: dict, low: int, high: int) -> list:
+    """[число, сумма] по ключам low..high включительно — перебирается меньшее из диапазона и корзин."""
+    count, amount = 0, 0.0
+    if high - low + 1 <= len(buckets):
+        for key in range(low, high + 1):
+            bucket = buckets.get(key)
+            if bucket is not None:
+                count += bucket[0]
+                amount += bucket[1]
+    else:
+        for key, bucket in buckets.items():
+            if low <= key <= high:
+                count += bucket[0]
+                amount += bucket[1]
+    return [count, amount]
+
+
+class RevenueRollup:
+    """
+    Выручка и число платежей в корзинах: по дням, по дням для каждой кассы и по месяцам для
+    каждого пользователя. Новые платежи добавляются в корзины (fold) — история не пересчитывается,
+    поэтому сумма за любой диапазон дат считается по нескольким сотням корзин, а не по платежам.
+    Изменённые задним числом платежи учитываются при полной пересборке раз в ROLLUP_FULL_INTERVAL.
+    """
+
+    def __init__(self):
+        self.days: dict = {}
+        self.systems: dict = {}
+        self.users: dict = {}
+        self.count = 0
+        self.amount = 0.0
+        # Наибольший id учтённого платежа: платежи с большим id — новые.
+        self.watermark = -1
+        self.created = time.time()
+        self.updated = self.created
+
+    def add(self, payment: dict):
+        if REVENUE_STATUSES and payment.get("status") not in REVENUE_STATUSES:
+            return
+        amount = to_float(payment.get("amount"))
+        self.count += 1
+        self.amount += amount
+        day = day_number(payment.get("created_at"))
+        if day == NO_DAY:
+            return
+        _add(self.days, day, amount)
+        system = payment.get("payment_system") or payment.get("provider") or "—"
+        _add(self.systems.setdefault(system, {}), day, amount)
+        tg_id = to_int(payment.get("tg_id"))
+        if tg_id != -1:
+            _add(self.users.setdefault(tg_id, {}), month_of(day), amount)
+
+    def fold(self, payments) -> int:
+        """Добавляет платежи новее watermark; возвращает, сколько добавлено."""
+        known = self.watermark
+        added = 0
+        for payment in payments:
+            payment_id = to_int(payment.get("id"))
+            if payment_id <= known:
+                continue
+            self.add(payment)
+            self.watermark = max(self.watermark, payment_id)
+            added += 1
+        self.updated = time.time()
+        return added
+
+    def totals(self, low: int, high: int) -> dict:
+        count, amount = _sum(self.days, low, high)
+        return {"count": count, "amount": round(amount, 2)}
+
+    def series(self, low: int, high: int, granularity: str) -> list:
+        """Все периоды диапазона по порядку, пустые — с нулями (для графика); за пределы данных не заходит."""
+        if not self.days:
+            return []  # без данных диапазон не ограничить — иначе перебор всех дней запроса
+        low = max(low, min(self.days))
+        high = min(high, max(max(self.days), day_of(datetime.utcnow().date())))
+        periods = {}
+        for day in range(low, high + 1):
+            bucket = self.days.get(day)
+            period = periods.setdefault(period_of(day, granularity), [0, 0.0])
+            if bucket is not None:
+                period[0] += bucket[0]
+                period[1] += bucket[1]
+        return [
+            {"period": period_label(key, granularity), "count": count, "amount": round(amount, 2)}
+            for key, (count, amount) in periods.items()
+        ]
+
+    def by_system(self, low: int, high: int) -> list:
+        rows = []
+        for system, buckets in self.systems.items():
+            count, amount = _sum(buckets, low, high)
+            if count:
+                rows.append({"system": system, "count": count, "amount": round(amount, 2)})
+        return sorted(rows, key=lambda row: row["amount"], reverse=True)
+
+    def top_users(self, low: int, high: int, limit: int) -> list:
+        """Пользователи с наибольшей выручкой; диапазон округляется до целых месяцев."""
+        first, last = month_of(low), month_of(high)
+        ranked = []
+        for tg_id, buckets in self.users.items():
+            count, amount = _sum(buckets, first, last)
+            if count:
+                ranked.append((amount, count, tg_id))
+        return [
+            {"tg_id": tg_id, "count": count, "amount": round(amount, 2)}
+            for amount, count, tg_id in heapq.nlargest(limit, ranked)
+        ]
+
+
+async def _new_payments(watermark: int) -> list | None:
+    """
+    Платежи с id > watermark: из зеркала по индексу или из upstream с ROLLUP_SINCE_PARAM.
+    None — выбрать только новые платежи нельзя (зеркало не готово, параметра нет).
+    """
+    found = await mirror.since("payments", "id", watermark)
+    if found is not None:
+        return found
+    if not ROLLUP_SINCE_PARAM:
+        return None
+    # Если upstream параметр не поддерживает, он вернёт весь список — лишнее отсеивается по id.
+    return [payment async for payment in upstream.stream_json("/payments/", {ROLLUP_SINCE_PARAM: watermark}, cache=False)
+            if isinstance(payment, dict) and to_int(payment.get("id")) > watermark]
+
+
+async def _build_revenue() -> RevenueRollup:
+    rollup = RevenueRollup()
+    async for payment in mirror.stream("/payments/"):
+        if isinstance(payment, dict):
+            rollup.add(payment)
+            rollup.watermark = max(rollup.watermark, to_int(payment.get("id")))
+    rollup.updated = time.time()
+    return rollup
+
+
+async def update_revenue() -> RevenueRollup:
+    """
+    Загрузчик снимка revenue: первый раз и раз в ROLLUP_FULL_INTERVAL строит корзины заново,
+    в остальное время только добавляет новые платежи в текущие. Если новые платежи выбрать
+    нельзя (нет зеркала и ROLLUP_SINCE_PARAM), корзины пересобираются потоком каждый раз —
+    иначе выручка на дашборде замерла бы до следующей полной пересборки.
+    """
+    rollup = revenue.value
+    if rollup is None or time.time() - rollup.created >= ROLLUP_FULL_INTERVAL:
+        return await _build_revenue()
+    # Со статусами id-водяной знак ненадёжен (см. REVENUE_STATUSES) — только полная пересборка.
+    payments = None if REVENUE_STATUSES else await _new_payments(rollup.watermark)
+    if payments is None:
+        return await _build_revenue()
+    rollup.fold(payments)
+    return rollup
+
+
+revenue = Snapshot(update_revenue, ROLLUP_REFRESH_INTERVAL)
+
+
+def _on_invalidate(prefixes: tuple):
+    if "/payments/".startswith(prefixes):
+        revenue.expire()
+
+
+upstream.on_invalidate(_on_invalidate)
@@ -0,0 +1,221 @@
+from fastapi import Request
+from fastapi.exceptions import RequestValidationError
+from fastapi.routing import APIRoute
+from starlette.exceptions import HTTPException
+from starlette.responses import Response, StreamingResponse
+from app.core import metrics, profiling
+import hashlib
+import os
+import time
+import zlib
+
+try:
+    import brotli
+except ImportError:  # brotli необязателен: без него ответы сжимаются только gzip
+    brotli = None
+
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "1024"))
+COMPRESS_GZIP_LEVEL = int(os.getenv("COMPRESS_GZIP_LEVEL", "6"))
+COMPRESS_BROTLI_QUALITY = int(os.getenv("COMPRESS_BROTLI_QUALITY", "4"))
+
+COMPRESSIBLE_TYPES = ("text/", "application/json", "application/javascript", "application/x-ndjson", "image/svg+xml")
+
+
+class _Gzip:
+    def __init__(self):
+        self._compressor = zlib.compressobj(COMPRESS_GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        # SYNC_FLUSH — чтобы порции потокового ответа доходили до клиента сразу, а не копились.
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+class _Brotli:
+    def __init__(self):
+        self._compressor = brotli.Compressor(quality=COMPRESS_BROTLI_QUALITY)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data) + self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+def _accepted_encodings(header: str) -> dict:
+    """Accept-Encoding -> {кодировка: q}; q по умолчанию 1, q=0 — кодировка не принимается."""
+    weights = {}
+    for item in header.split(","):
+        coding, _, params = item.partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        weights[coding] = q
+    return weights
+
+
+def _choose_encoding(request: Request):
+    """Кодировка с наибольшим q из поддерживаемых; при равных q brotli предпочтительнее gzip."""
+    weights = _accepted_encodings(request.headers.get("accept-encoding", ""))
+    default = weights.get("*", 0.0)
+    best = None
+    for encoding, encoder in (("br", _Brotli), ("gzip", _Gzip)):
+        if encoding == "br" and brotli is None:
+            continue
+        q = weights.get(encoding, default)
+        if q > 0 and (best is None or q > best[0]):
+            best = (q, encoding, encoder)
+    return (best[1], best[2]) if best else (None, None)
+
+
+def _compressible(response: Response) -> bool:
+    content_type = response.headers.get("content-type", "")
+    return (
+        response.status_code not in (204, 304)
+        and "content-encoding" not in response.headers
+        and content_type.startswith(COMPRESSIBLE_TYPES)
+        # SSE не сжимаем: события мелкие, а часть прокси и WebView буферизует сжатый поток.
+        and not content_type.startswith("text/event-stream")
+    )
+
+
+def make_etag(body: bytes) -> str:
+    # Слабый ETag: одно значение для сжатого и несжатого варианта одного содержимого.
+    return f'W/"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in if_none_match.split(","))
+
+
+async def _compress_stream(body_iterator, encoder, charset):
+    async for chunk in body_iterator:
+        if isinstance(chunk, str):
+            chunk = chunk.encode(charset)
+        data = encoder.compress(chunk)
+        if data:
+            yield data
+    yield encoder.finish()
+
+
+def optimize_response(request: Request, response: Response) -> Response:
+    """
+    ETag/304 для готовых ответов GET и сжатие gzip/brotli по Accept-Encoding
+    для ответов больше COMPRESS_MIN_SIZE. Потоковые ответы сжимаются по мере отдачи, без ETag.
+    """
+    compressible = _compressible(response)
+    if compressible:
+        response.headers.setdefault("vary", "Accept-Encoding")
+    encoding, encoder = _choose_encoding(request) if compressible else (None, None)
+
+    if isinstance(response, StreamingResponse):
+        if encoder is not None:
+            response.body_iterator = _compress_stream(response.body_iterator, encoder(), response.charset)
+            response.headers["content-encoding"] = encoding
+            if "content-length" in response.headers:
+                del response.headers["content-length"]
+        return response
+
+    body = getattr(response, "body", None)
+    if body is None:
+        return response
+
+    if request.method in ("GET", "HEAD") and response.status_code == 200 and "etag" not in response.headers:
+        etag = make_etag(body)
+        response.headers["etag"] = etag
+        response.headers.setdefault("cache-control", "private, no-cache")
+        if etag_matches(request.headers.get("if-none-match", ""), etag):
+            headers = {key: value for key, value in response.headers.items()
+                       if key in ("etag", "cache-control", "vary")}
+            return Response(status_code=304, headers=headers)
+
+    if encoder is not None and len(body) >= COMPRESS_MIN_SIZE:
+        encoded = encoder()
+        response.body = encoded.compress(body) + encoded.finish()
+        response.headers["content-encoding"] = encoding
+        response.headers["content-length"] = str(len(response.body))
+    return response
+
+
+class _ProfiledStream(Response):
+    """
+    Потоковый ответ под профилем: профиль закрывается после отдачи тела, а также если
+    тело так и не начали отдавать (клиент ушёл) или отправка оборвалась ошибкой.
+    """
+
+    def __init__(self, response: StreamingResponse, profile):
+        self.response = response
+        self.profile = profile
+        self.status_code = response.status_code
+        self.raw_headers = response.raw_headers
+        self.background = None
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await self.response(scope, receive, send)
+        finally:
+            await profiling.finish(self.profile)
+
+
+class PanelRoute(APIRoute):
+    """
+    Маршрут панели: постобработка ответов всех роутеров (сжатие, ETag), метрики запроса,
+    заголовок Server-Timing с фазами upstream/decode/render/app и профилирование
+    отдельного запроса по токену (app.core.profiling).
+    Подключается через APIRouter(route_class=PanelRoute).
+    """
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+
+        async def route_handler(request: Request) -> Response:
+            timings = metrics.start_timings()
+            profile = profiling.start(f"{request.method} {self.path}") if profiling.requested(request, self.path) else None
+            metrics.http_inflight.inc()
+            started = time.perf_counter()
+            status = "500"
+            try:
+                response = optimize_response(request, await handler(request))
+                status = str(response.status_code)
+            except BaseException as e:
+                # Ошибку из обработчика в ответ превращают обработчики исключений FastAPI — в метрике их код.
+                if isinstance(e, HTTPException):
+                    status = str(e.status_code)
+                elif isinstance(e, RequestValidationError):
+                    status = "422"
+                if profile is not None:
+                    await profiling.finish(profile)
+                raise
+            finally:
+                elapsed = time.perf_counter() - started
+                metrics.http_inflight.dec()
+                metrics.http_duration.observe(self.path, request.method, status, value=elapsed)
+            # Для потоковых ответов здесь только то, что было до начала отдачи тела.
+            timings["app"] = elapsed
+            response.headers["server-timing"] = metrics.server_timing(timings)
+
+            if profile is not None:
+                # Профиль потокового ответа закрывается после отдачи тела, поэтому его имя
+                # известно заранее только для обычных ответов; для потоковых — в /profiles.
+                if isinstance(response, StreamingResponse):
+                    response = _ProfiledStream(response, profile)
+                else:
+                    name = await profiling.finish(profile)
+                    if name:
+                        response.headers["x-profile-id"] = name
+            return response
+
+        return route_handler
@@ -0,0 +1,188 @@
+from array import array
+from app.core import mirror, upstream
+from app.core.snapshot import Snapshot
+import heapq
+import os
+
+SEARCH_INDEX_TTL = float(os.getenv("SEARCH_INDEX_TTL", "300"))
+SEARCH_LIMIT_DEFAULT = 20
+
+_SEPARATOR = "\x1f"
+# Ранги совпадения: значение поля целиком, начало значения, подстрока.
+_EXACT, _PREFIX, _SUBSTRING = 0, 1, 2
+
+
+def _trigrams(text: str) -> set:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class TrigramIndex:
+    """
+    Триграммный индекс по полям записей для поиска подстрокой. Для запроса из трёх и более
+    символов кандидаты берутся из самого редкого списка его триграмм и проверяются подстрокой;
+    короткие запросы проверяются по всем записям. Поля записи хранятся одной строкой
+    в нижнем регистре через разделитель, которого не бывает в запросе.
+    Удалённые и изменённые записи остаются в списках триграмм до следующей пересборки.
+    """
+
+    def __init__(self, key: str, fields: tuple):
+        self.key = key
+        self.fields = fields
+        self.items: list = []
+        self.texts: list = []
+        self.ids: dict = {}
+        self.postings: dict = {}
+        self.count = 0
+
+    def add(self, item: dict):
+        key = str(item.get(self.key))
+        if key in self.ids:
+            self._drop(self.ids[key])
+        doc = len(self.items)
+        text = _SEPARATOR.join(str(item.get(field) or "").lower() for field in self.fields)
+        self.items.append(item)
+        self.texts.append(text)
+        self.ids[key] = doc
+        self.count += 1
+        for gram in _trigrams(text):
+            posting = self.postings.get(gram)
+            if posting is None:
+                posting = self.postings[gram] = array("i")
+            posting.append(doc)
+
+    def _drop(self, doc: int):
+        if self.items[doc] is not None:
+            self.items[doc] = None
+            self.texts[doc] = None
+            self.count -= 1
+
+    def remove(self, key):
+        doc = self.ids.pop(str(key), None)
+        if doc is not None:
+            self._drop(doc)
+
+    def remove_where(self, field: str, value):
+        for item in list(self.items):
+            if item is not None and item.get(field) == value:
+                self.remove(item.get(self.key))
+
+    def patch(self, key, fields: dict):
+        doc = self.ids.get(str(key))
+        if doc is not None and self.items[doc] is not None:
+            self.add({**self.items[doc], **fields})
+            if str(self.items[-1].get(self.key)) != str(key):
+                self.remove(key)
+
+    def _candidates(self, needle: str):
+        if len(needle) < 3:
+            return range(len(self.items))
+        postings = []
+        for gram in _trigrams(needle):
+            posting = self.postings.get(gram)
+            if posting is None:
+                return ()
+            postings.append(posting)
+        return min(postings, key=len)
+
+    def matches(self, needle: str) -> list:
+        """Все записи, в которых needle — подстрока одного из полей, в порядке загрузки."""
+        found = []
+        texts = self.texts
+        for doc in self._candidates(needle):
+            text = texts[doc]
+            if text is not None and needle in text:
+                found.append(self.items[doc])
+        return found
+
+    def search(self, needle: str, limit: int) -> list:
+        """
+        Лучшие limit записей: сначала точное совпадение поля, затем начало значения, затем
+        подстрока; при равенстве выше поле, раньше стоящее в fields, и более короткое значение.
+        """
+        ranked = []
+        for doc in self._candidates(needle):
+            text = self.texts[doc]
+            if text is None or needle not in text:
+                continue
+            best = None
+            for position, value in enumerate(text.split(_SEPARATOR)):
+                at = value.find(needle)
+                if at < 0:
+                    continue
+                kind = _EXACT if value == needle else _PREFIX if at == 0 else _SUBSTRING
+                rank = (kind, position, len(value), doc)
+                if best is None or rank < best:
+                    best = rank
+            if best is not None:
+                ranked.append(best)
+        return [self.items[rank[3]] for rank in heapq.nsmallest(limit, ranked)]
+
+
+class SearchIndex:
+    """Индекс одной коллекции upstream: строится из зеркала или потока path и живёт как Snapshot."""
+
+    def __init__(self, path: str, key: str, fields: tuple):
+        self.path = path
+        self.key = key
+        self.fields = fields
+        self.snapshot = Snapshot(self.build_index, SEARCH_INDEX_TTL)
+
+    async def build_index(self) -> TrigramIndex:
+        index = TrigramIndex(self.key, self.fields)
+        async for item in mirror.stream(self.path):
+            if isinstance(item, dict):
+                index.add(item)
+        return index
+
+    async def get(self) -> TrigramIndex | None:
+        return await self.snapshot.get()
+
+
+# Поля — те же, что USER_/KEY_/PAYMENT_SEARCH_FIELDS в роутерах: поиск по индексу и без него совпадает.
+INDEXES = {
+    "users": SearchIndex("/users/", "tg_id", ("tg_id", "first_name", "username")),
+    "keys": SearchIndex("/keys/", "email", ("email", "client_id", "tg_id")),
+    "payments": SearchIndex("/payments/", "id", ("id", "tg_id", "amount", "payment_system", "provider", "status")),
+}
+
+
+def _on_invalidate(prefixes: tuple):
+    for index in INDEXES.values():
+        if index.path.startswith(prefixes):
+            index.snapshot.expire()
+
+
+upstream.on_invalidate(_on_invalidate)
+
+
+async def matches(name: str, needle: str) -> tuple:
+    """(записи с подстрокой needle, всего записей в коллекции); (None, None) — индекс не построился."""
+    index = await INDEXES[name].get()
+    if index is None:
+        return None, None
+    return index.matches(needle), index.count
+
+
+async def search(name: str, needle: str, limit: int = SEARCH_LIMIT_DEFAULT) -> list | None:
+    index = await INDEXES[name].get()
+    return None if index is None else index.search(needle, limit)
+
+
+# --- запись через панель: правки видны в поиске сразу, до пересборки индекса ---
+
+def patch(name: str, key, fields: dict):
+    index = INDEXES[name].snapshot.value
+    if index is not None and isinstance(fields, dict):
+        index.patch(key, fields)
+
+
+def delete(name: str, key):
+    index = INDEXES[name].snapshot.value
+    if index is not None:
+        index.remove(key)
+
+
+def delete_where(name: str, field: str, value):
+    index = INDEXES[name].snapshot.value
+    if index is not None:
+        index.remove_where(field, value)
@@ -0,0 +1,60 @@
+import asyncio
+
+
+class SingleFlight:
+    """
+    Объединение одинаковых запросов в полёте: пока вызов по ключу не завершён,
+    остальные вызывающие ждут его результат, а не делают свой. Ключ — как у TTLCache.
+    Вызов выполняется отдельной задачей: отмена одного ожидающего (клиент закрыл
+    страницу) не прерывает запрос для остальных.
+    """
+
+    def __init__(self):
+        self._calls: dict = {}
+
+    def __len__(self):
+        return len(self._calls)
+
+    def get(self, key):
+        """Future текущего вызова по ключу или None."""
+        return self._calls.get(key)
+
+    async def do(self, key, fn):
+        """Результат fn() — общий для всех, кто пришёл с тем же ключом, пока она выполняется."""
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._register(key, task)
+        return await asyncio.shield(task)
+
+    def claim(self, key) -> asyncio.Future | None:
+        """
+        Регистрирует вызов, который ведёт сам вызывающий (например, потоковое чтение).
+        Возвращает Future для release() или None, если по ключу уже кто-то ходит.
+        """
+        if key in self._calls:
+            return None
+        future = asyncio.get_running_loop().create_future()
+        self._register(key, future)
+        return future
+
+    def release(self, future: asyncio.Future, result=None):
+        """Завершает вызов из claim(); None — ожидающие пойдут в upstream сами."""
+        if not future.done():
+            future.set_result(result)
+
+    def forget(self, *prefixes: str):
+        """Новые вызовы по путям с этими префиксами больше не присоединяются к текущим."""
+        for key in [key for key in self._calls if key[0].startswith(prefixes)]:
+            del self._calls[key]
+
+    def _register(self, key, future: asyncio.Future):
+        self._calls[key] = future
+
+        def done(finished):
+            if self._calls.get(key) is finished:
+                del self._calls[key]
+            if not finished.cancelled():
+                finished.exception()  # ошибку получат ожидающие; без них не пишем "never retrieved"
+
+        future.add_done_callback(done)
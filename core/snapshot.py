@@ -0,0 +1,101 @@
+import asyncio
+import time
+
+_snapshots = []
+
+
+class Snapshot:
+    """
+    Результат loader() в памяти, фоновая задача перестраивает его раз в interval секунд.
+    Пока строится новое значение, запросы получают предыдущее (stale-while-revalidate).
+    Подписчики (subscribe()) получают каждое новое значение — так один опрос upstream
+    обслуживает всех, кто смотрит страницу в реальном времени.
+    """
+
+    def __init__(self, loader, interval: float):
+        self.loader = loader
+        self.interval = interval
+        self.value = None
+        self.built_at: float | None = None
+        self._expired = False
+        self._rebuilding: asyncio.Task | None = None
+        self._worker: asyncio.Task | None = None
+        self._subscribers: set[asyncio.Queue] = set()
+        _snapshots.append(self)
+
+    @property
+    def age(self) -> float | None:
+        if self.built_at is None:
+            return None
+        return time.time() - self.built_at
+
+    async def get(self):
+        self.start()
+        if self.value is None:
+            return await self.refresh()
+        if self._expired or self.age > self.interval:
+            self._schedule_rebuild()
+        return self.value
+
+    async def refresh(self):
+        """Принудительно перестраивает снимок; параллельные вызовы ждут одну и ту же сборку."""
+        return await asyncio.shield(self._schedule_rebuild())
+
+    def _schedule_rebuild(self) -> asyncio.Task:
+        if self._rebuilding is None or self._rebuilding.done():
+            self._rebuilding = asyncio.create_task(self._rebuild())
+        return self._rebuilding
+
+    def expire(self):
+        """Данные устарели (была запись): следующий get() отдаст текущее значение и запустит пересборку."""
+        self._expired = True
+
+    async def _rebuild(self):
+        self._expired = False
+        try:
+            self.value = await self.loader()
+            self.built_at = time.time()
+            self._publish()
+        except Exception as e:
+            print(f"[ERROR] Не удалось обновить снимок {self.loader.__name__}: {e}")
+        return self.value
+
+    def subscribe(self) -> asyncio.Queue:
+        """Очередь новых значений снимка; в ней хранится только последнее непрочитанное."""
+        queue = asyncio.Queue(maxsize=1)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.discard(queue)
+
+    def _publish(self):
+        for queue in self._subscribers:
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(self.value)
+
+    async def _run(self):
+        while True:
+            await self.refresh()
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        for task in (self._worker, self._rebuilding):
+            if task is not None and not task.done():
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._worker = None
+        self._rebuilding = None
+
+
+async def stop_all():
+    for snapshot in _snapshots:
+        await snapshot.stop()
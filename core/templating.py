@@ -0,0 +1,181 @@
+from fastapi.responses import Response, StreamingResponse
+from fastapi.templating import Jinja2Templates
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
+from markupsafe import Markup
+from app.core import assets
+from app.core.assets import MANIFEST_PATH
+from app.core.fastjson import dumps, dumps_str
+from app.core.metrics import add_timing, render_duration
+from app.core.routing import etag_matches, make_etag
+import asyncio
+import os
+import tempfile
+import time
+
+TEMPLATES_DIR = "app/views"
+TEMPLATE_CACHE_DIR = os.getenv("TEMPLATE_CACHE_DIR", os.path.join(tempfile.gettempdir(), "web-jinja-cache"))
+TEMPLATE_STREAM_CHUNK = int(os.getenv("TEMPLATE_STREAM_CHUNK", "16384"))
+TEMPLATE_DEFER_WAIT = float(os.getenv("TEMPLATE_DEFER_WAIT", "0.05"))
+
+
+def _bytecode_cache(pattern: str = "__jinja2_%s.cache"):
+    try:
+        os.makedirs(TEMPLATE_CACHE_DIR, exist_ok=True)
+        return FileSystemBytecodeCache(TEMPLATE_CACHE_DIR, pattern)
+    except OSError as e:
+        print(f"[WARN] Кэш байткода шаблонов отключён ({TEMPLATE_CACHE_DIR}): {e}")
+        return None
+
+
+class _TimedTemplates(Jinja2Templates):
+    def TemplateResponse(self, *args, **kwargs):
+        started = time.perf_counter()
+        response = super().TemplateResponse(*args, **kwargs)
+        elapsed = time.perf_counter() - started
+        add_timing("render", elapsed)
+        render_duration.observe(response.template.name, value=elapsed)
+        return response
+
+
+# Общий экземпляр шаблонов для всех роутеров. Скомпилированные шаблоны сохраняются
+# на диск и переживают перезапуск процесса — воркеры не компилируют их заново.
+templates = _TimedTemplates(env=Environment(
+    loader=FileSystemLoader(TEMPLATES_DIR),
+    autoescape=True,
+    bytecode_cache=_bytecode_cache(),
+))
+# tojson в шаблонах сериализует через fastjson — так в разметку можно отдавать записи из app.core.records.
+templates.env.policies["json.dumps_function"] = dumps_str
+templates.env.policies["json.dumps_kwargs"] = {}
+assets.install(templates.env)
+
+# Асинхронный двойник окружения: общие загрузчик и фильтры, копия глобальных переменных.
+# Байткод async-шаблонов другой, поэтому он лежит в отдельных файлах кэша.
+async_env = templates.env.overlay(enable_async=True, bytecode_cache=_bytecode_cache("__jinja2_async_%s.cache"))
+
+# {{ stream_flush() }} в base.html: при потоковом рендеринге всё, что накоплено до этого места
+# (head, стили, меню), уходит клиенту сразу, не дожидаясь данных страницы. В других окружениях
+# функции нет, и base.html её пропускает.
+_FLUSH = "<!-- flush -->"
+async_env.globals = {**templates.env.globals, "stream_flush": lambda: Markup(_FLUSH)}
+
+
+class Deferred:
+    """
+    Значение контекста, которое ещё загружается. Шаблон вызывает его — {{ page() }} — и async-Jinja
+    дожидается результата именно в этом месте, поэтому шапка страницы уходит раньше данных.
+    """
+
+    def __init__(self, future: asyncio.Future, index: int | None = None):
+        self.future = future
+        self.index = index
+
+    async def __call__(self):
+        await self.future
+        return self.result()
+
+    def result(self):
+        value = self.future.result()
+        return value if self.index is None else value[self.index]
+
+
+def defer(awaitable, count: int | None = None):
+    """
+    Запускает загрузку данных страницы сразу и возвращает Deferred для контекста stream_template;
+    count — результат-кортеж из count значений: page, total = defer(page_data(params), 2).
+    """
+    future = asyncio.ensure_future(awaitable)
+    if count is None:
+        return Deferred(future)
+    return tuple(Deferred(future, index) for index in range(count))
+
+
+async def _chunks(template, context):
+    # Время рендеринга потоковой страницы попадает только в метрику: заголовки уже отправлены.
+    # Оно включает ожидание асинхронных итераторов из context (чтение upstream по ходу страницы).
+    started = time.perf_counter()
+    buffer = []
+    size = 0
+    async for part in template.generate_async(context):
+        if part == _FLUSH:
+            if buffer:
+                yield "".join(buffer).encode("utf-8")
+                buffer = []
+                size = 0
+            continue
+        buffer.append(part)
+        size += len(part)
+        if size >= TEMPLATE_STREAM_CHUNK:
+            yield "".join(buffer).encode("utf-8")
+            buffer = []
+            size = 0
+    if buffer:
+        yield "".join(buffer).encode("utf-8")
+    render_duration.observe(template.name, value=time.perf_counter() - started)
+
+
+def _views_version() -> str:
+    # Меняется при деплое новых шаблонов или статики; считается один раз при старте.
+    mtimes = []
+    for directory, _, files in os.walk(TEMPLATES_DIR):
+        mtimes.extend(os.stat(os.path.join(directory, f)).st_mtime_ns for f in files)
+    mtimes.append(os.stat(MANIFEST_PATH).st_mtime_ns if os.path.exists(MANIFEST_PATH) else 0)
+    return str(max(mtimes, default=0))
+
+
+VIEWS_VERSION = _views_version()
+
+
+async def _settle(context: dict, request) -> bool:
+    """
+    Ждёт Deferred из context: условный GET — до конца (возможно, хватит 304), остальные —
+    не дольше TEMPLATE_DEFER_WAIT, чтобы медленные данные не задерживали шапку. True — всё загружено.
+    """
+    futures = {value.future for value in context.values() if isinstance(value, Deferred)}
+    if not futures:
+        return True
+    conditional = request is not None and "if-none-match" in request.headers
+    _, pending = await asyncio.wait(futures, timeout=None if conditional else TEMPLATE_DEFER_WAIT)
+    return not pending
+
+
+def _context_etag(name: str, context: dict):
+    """ETag по данным страницы: тот же шаблон с теми же данными даёт тот же HTML."""
+    values = {}
+    for key, value in context.items():
+        if key == "request":
+            continue
+        if isinstance(value, Deferred):
+            if not value.future.done() or value.future.cancelled() or value.future.exception() is not None:
+                return None  # данные ещё грузятся, а заголовки уходят до них
+            value = value.result()
+        values[key] = value
+    try:
+        data = dumps(values)
+    except TypeError:
+        return None  # в контексте потоки или объекты без сериализации — ETag не считаем
+    return make_etag(f"{name}|{VIEWS_VERSION}|".encode("utf-8") + data)
+
+
+async def stream_template(name: str, context: dict, status_code: int = 200) -> Response:
+    """
+    Рендерит шаблон потоком: клиент получает шапку страницы, пока строится остальное,
+    а ответ целиком в памяти не собирается. В context можно передавать асинхронные
+    итераторы — {% for %} читает их по мере поступления данных — и Deferred из defer():
+    шаблон дожидается их там, где вызывает, а шапка до stream_flush() уходит сразу.
+    Если данные страницы не изменились (If-None-Match), отвечает 304 без рендеринга.
+    ETag считается по загруженным Deferred: если они не успели за TEMPLATE_DEFER_WAIT,
+    страница уходит потоком без ETag (быстрая шапка важнее повторной проверки).
+    """
+    headers = {}
+    request = context.get("request")
+    etag = None
+    if status_code == 200 and await _settle(context, request):
+        etag = _context_etag(name, context)
+    if etag is not None:
+        headers = {"etag": etag, "cache-control": "private, no-cache"}
+        if request is not None and etag_matches(request.headers.get("if-none-match", ""), etag):
+            return Response(status_code=304, headers=headers)
+
+    template = async_env.get_template(name)
+    return StreamingResponse(_chunks(template, context), status_code=status_code, media_type="text/html", headers=headers)
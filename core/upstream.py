@@ -0,0 +1,283 @@
+from app.core.cache import MISSING, TTLCache
+from app.core.fastjson import loads
+from app.core.jsonstream import iter_json_array
+from app.core.metrics import MeteredTransport, add_timing, decode_duration, endpoint_label, upstream_bytes
+from app.core.resilience import CircuitBreaker, CircuitOpenError, ResilientTransport, RetryBudget
+from app.core.singleflight import SingleFlight
+import asyncio
+import httpx
+import os
+import time
+
+API_BASE_URL = os.getenv("API_BASE_URL", "")
+if not API_BASE_URL:
+    # Старые роутеры расходились в умолчании (:8000 и :3003) — берём большинство и предупреждаем.
+    API_BASE_URL = "http://localhost:8000/api"
+    print(f"[WARN] API_BASE_URL не задан — используется {API_BASE_URL}")
+ADMIN_TG_ID = os.getenv("ADMIN_TG_ID", "0")
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "your_admin_token")
+
+UPSTREAM_TIMEOUT = float(os.getenv("UPSTREAM_TIMEOUT", "10"))
+UPSTREAM_CONNECT_TIMEOUT = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", "3"))
+# Таймауты по префиксу пути: "/servers/=5,/users/=20"; остальные пути — UPSTREAM_TIMEOUT.
+UPSTREAM_TIMEOUTS = os.getenv("UPSTREAM_TIMEOUTS", "/servers/=5,/tariffs/=5,/coupons/=5")
+UPSTREAM_RETRIES = int(os.getenv("UPSTREAM_RETRIES", "2"))
+UPSTREAM_RETRY_BACKOFF = float(os.getenv("UPSTREAM_RETRY_BACKOFF", "0.2"))
+UPSTREAM_RETRY_RATIO = float(os.getenv("UPSTREAM_RETRY_RATIO", "0.2"))
+UPSTREAM_RETRY_CAPACITY = float(os.getenv("UPSTREAM_RETRY_CAPACITY", "10"))
+UPSTREAM_BREAKER_THRESHOLD = int(os.getenv("UPSTREAM_BREAKER_THRESHOLD", "5"))
+UPSTREAM_BREAKER_RESET = float(os.getenv("UPSTREAM_BREAKER_RESET", "30"))
+UPSTREAM_MAX_CONNECTIONS = int(os.getenv("UPSTREAM_MAX_CONNECTIONS", "100"))
+UPSTREAM_MAX_KEEPALIVE = int(os.getenv("UPSTREAM_MAX_KEEPALIVE", "20"))
+UPSTREAM_KEEPALIVE_EXPIRY = float(os.getenv("UPSTREAM_KEEPALIVE_EXPIRY", "30"))
+UPSTREAM_HTTP2 = os.getenv("UPSTREAM_HTTP2", "0") == "1"
+UPSTREAM_FANOUT_LIMIT = int(os.getenv("UPSTREAM_FANOUT_LIMIT", "6"))
+UPSTREAM_CACHE_TTL = float(os.getenv("UPSTREAM_CACHE_TTL", "30"))
+UPSTREAM_CACHE_REFERENCE_TTL = float(os.getenv("UPSTREAM_CACHE_REFERENCE_TTL", "300"))
+UPSTREAM_CACHE_SIZE = int(os.getenv("UPSTREAM_CACHE_SIZE", "256"))
+UPSTREAM_CACHE_MAX_RECORDS = int(os.getenv("UPSTREAM_CACHE_MAX_RECORDS", "50000"))
+
+# Справочники меняются редко и только через эту панель — их можно держать дольше.
+REFERENCE_PATHS = ("/tariffs/", "/servers/")
+
+_client: httpx.AsyncClient | None = None
+breaker = CircuitBreaker(UPSTREAM_BREAKER_THRESHOLD, UPSTREAM_BREAKER_RESET)
+retry_budget = RetryBudget(UPSTREAM_RETRY_RATIO, UPSTREAM_RETRY_CAPACITY)
+response_cache = TTLCache(UPSTREAM_CACHE_SIZE, UPSTREAM_CACHE_TTL)
+inflight = SingleFlight()
+# Растёт при каждой записи: чтение, начатое до неё, не должно попасть в кэш после неё.
+_generation = 0
+_invalidate_listeners: list = []
+
+
+def _http2_available() -> bool:
+    if not UPSTREAM_HTTP2:
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        print("[WARN] UPSTREAM_HTTP2=1, но пакет h2 не установлен — используется HTTP/1.1")
+        return False
+    return True
+
+
+def _parse_timeouts(value: str) -> dict:
+    timeouts = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        prefix, _, seconds = item.partition("=")
+        timeouts[prefix.strip()] = float(seconds)
+    return timeouts
+
+
+_endpoint_timeouts = _parse_timeouts(UPSTREAM_TIMEOUTS)
+_base_path = httpx.URL(API_BASE_URL).path.rstrip("/")
+
+
+def timeout_for(url_path: str) -> httpx.Timeout:
+    """Таймаут запроса по самому длинному подходящему префиксу из UPSTREAM_TIMEOUTS."""
+    path = url_path.removeprefix(_base_path)
+    matches = [prefix for prefix in _endpoint_timeouts if path.startswith(prefix)]
+    seconds = _endpoint_timeouts[max(matches, key=len)] if matches else UPSTREAM_TIMEOUT
+    return httpx.Timeout(seconds, connect=UPSTREAM_CONNECT_TIMEOUT)
+
+
+def _build_client() -> httpx.AsyncClient:
+    transport = httpx.AsyncHTTPTransport(
+        limits=httpx.Limits(
+            max_connections=UPSTREAM_MAX_CONNECTIONS,
+            max_keepalive_connections=UPSTREAM_MAX_KEEPALIVE,
+            keepalive_expiry=UPSTREAM_KEEPALIVE_EXPIRY,
+        ),
+        http2=_http2_available(),
+    )
+    return httpx.AsyncClient(
+        base_url=API_BASE_URL,
+        params={"tg_id": ADMIN_TG_ID},
+        headers={"X-Token": ADMIN_TOKEN},
+        timeout=httpx.Timeout(UPSTREAM_TIMEOUT, connect=UPSTREAM_CONNECT_TIMEOUT),
+        transport=ResilientTransport(
+            MeteredTransport(transport, _base_path), timeout_for, breaker, retry_budget,
+            retries=UPSTREAM_RETRIES, backoff=UPSTREAM_RETRY_BACKOFF,
+        ),
+    )
+
+
+def get_client() -> httpx.AsyncClient:
+    """
+    Общий клиент к API_BASE_URL с пулом keep-alive соединений.
+    Создаётся при первом обращении, если lifespan приложения его ещё не открыл.
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        _client = _build_client()
+    return _client
+
+
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def _ttl_for(path: str) -> float:
+    return UPSTREAM_CACHE_REFERENCE_TTL if path.startswith(REFERENCE_PATHS) else UPSTREAM_CACHE_TTL
+
+
+def invalidate(*prefixes: str):
+    """Сбрасывает кэш чтений для путей с указанными префиксами (вызывается после записи)."""
+    global _generation
+    _generation += 1
+    response_cache.invalidate(*prefixes)
+    inflight.forget(*prefixes)
+    for listener in _invalidate_listeners:
+        listener(prefixes)
+
+
+def on_invalidate(listener):
+    """listener(prefixes) вызывается после каждого invalidate() — так зеркало узнаёт о записях."""
+    if listener not in _invalidate_listeners:
+        _invalidate_listeners.append(listener)
+
+
+async def _fetch_json(path: str, params: dict | None, key):
+    generation = _generation
+    started = time.perf_counter()
+    response = await get_client().get(path, params=params)
+    add_timing("upstream", time.perf_counter() - started)
+    response.raise_for_status()
+    started = time.perf_counter()
+    data = loads(response.content)
+    elapsed = time.perf_counter() - started
+    add_timing("decode", elapsed)
+    endpoint = endpoint_label(path)
+    decode_duration.observe(endpoint, value=elapsed)
+    upstream_bytes.observe(endpoint, value=len(response.content))
+    if generation == _generation:
+        response_cache.set(key, data, _ttl_for(path))
+    return data
+
+
+async def get_json(path: str, params: dict | None = None):
+    """
+    GET path с read-through кэшем: повторные чтения в пределах TTL не ходят в upstream.
+    Одновременные одинаковые промахи кэша объединяются в один запрос (inflight).
+    Ошибки не кэшируются и пробрасываются всем ожидающим. Возвращаемый объект общий
+    для всех читателей: дополнять его можно, менять исходные поля — нет.
+    Пока upstream отключён автоматом (CircuitOpenError), отдаётся устаревшая копия из кэша, если она есть.
+    """
+    key = TTLCache.key(path, params)
+    data = response_cache.get(key)
+    if data is not MISSING:
+        return data
+    joined = inflight.get(key) is not None
+    started = time.perf_counter()
+    try:
+        data = await inflight.do(key, lambda: _fetch_json(path, params, key))
+        if joined:
+            # Своё время ожидания: фазы чужого запроса записаны в Server-Timing того, кто его начал.
+            add_timing("upstream", time.perf_counter() - started)
+        if data is None:
+            # Присоединились к потоковому чтению stream_json(), а оно не дочитало список.
+            data = await _fetch_json(path, params, key)
+    except CircuitOpenError:
+        data = response_cache.get_stale(key)
+        if data is MISSING:
+            raise
+    return data
+
+
+async def fetch_many(paths: dict, defaults: dict | None = None, limit: int = UPSTREAM_FANOUT_LIMIT) -> dict:
+    """
+    Параллельно выполняет GET для {имя: путь}, не более limit запросов одновременно.
+    Ошибка или пустой ответ одного источника заменяется его значением из defaults
+    (по умолчанию []), остальные результаты не страдают.
+    """
+    defaults = defaults or {}
+    semaphore = asyncio.Semaphore(limit)
+
+    async def fetch_one(name, path):
+        async with semaphore:
+            try:
+                data = await get_json(path)
+            except Exception as e:
+                print(f"[ERROR] {name}: {e}")
+                data = None
+        if not data:
+            return defaults.get(name, [])
+        return data
+
+    results = await asyncio.gather(*(fetch_one(name, path) for name, path in paths.items()))
+    return dict(zip(paths, results))
+
+
+async def _metered_chunks(response: httpx.Response, endpoint: str):
+    """Тело ответа порциями; ожидание сети идёт в фазу upstream, размер — в метрику."""
+    size = 0
+    chunks = response.aiter_bytes().__aiter__()
+    try:
+        while True:
+            started = time.perf_counter()
+            try:
+                chunk = await chunks.__anext__()
+            except StopAsyncIteration:
+                break
+            finally:
+                add_timing("upstream", time.perf_counter() - started)
+            size += len(chunk)
+            yield chunk
+    finally:
+        upstream_bytes.observe(endpoint, value=size)
+
+
+async def stream_json(path: str, params: dict | None = None, cache: bool = True):
+    """
+    GET path с потоковым разбором JSON-массива: элементы отдаются по мере чтения ответа,
+    без загрузки всего тела в память. Списки до UPSTREAM_CACHE_MAX_RECORDS записей
+    попадают в тот же кэш, что и get_json(); более длинные не кэшируются.
+    Если такой же запрос уже в полёте, ждёт его результат; если тот оборвался
+    или оказался слишком длинным для кэша — читает upstream сам.
+    При отключённом автоматом upstream отдаёт устаревшую копию из кэша, если она есть.
+    cache=False — для полных выгрузок: готовый кэш используется, но прочитанное не копится.
+    """
+    key = TTLCache.key(path, params)
+    cached = response_cache.get(key)
+    if cached is MISSING and inflight.get(key) is not None:
+        cached = await asyncio.shield(inflight.get(key))
+    if cached is not MISSING and cached is not None:
+        for item in cached:
+            yield item
+        return
+
+    generation = _generation
+    flight = inflight.claim(key) if cache else None
+    collected = [] if cache else None
+    complete = False
+    try:
+        started = time.perf_counter()
+        async with get_client().stream("GET", path, params=params) as response:
+            add_timing("upstream", time.perf_counter() - started)
+            response.raise_for_status()
+            chunks = _metered_chunks(response, endpoint_label(path))
+            try:
+                async for item in iter_json_array(chunks):
+                    if collected is not None:
+                        collected.append(item)
+                        if len(collected) > UPSTREAM_CACHE_MAX_RECORDS:
+                            collected = None
+                    yield item
+            finally:
+                await chunks.aclose()
+        complete = collected is not None
+        if complete and generation == _generation:
+            response_cache.set(key, collected, _ttl_for(path))
+    except CircuitOpenError:
+        stale = response_cache.get_stale(key)
+        if stale is MISSING:
+            raise
+        for item in stale:
+            yield item
+    finally:
+        # Ожидающие получают список, только если он дочитан целиком.
+        if flight is not None:
+            inflight.release(flight, collected if complete else None)
@@ -0,0 +1,136 @@
+from datetime import datetime
+from app.core import expiry, mirror, upstream
+from app.core.columns import timestamp_ms, to_int
+from app.core.snapshot import Snapshot
+import asyncio
+import os
+import time
+
+UTILIZATION_TTL = float(os.getenv("UTILIZATION_TTL", "60"))
+
+NO_GROUP = ""
+
+
+def count_keys(keys, now: int) -> dict:
+    """server_id -> [активных, истёкших] за один проход по ключам."""
+    counts = {}
+    for key in keys:
+        if not isinstance(key, dict):
+            continue
+        target = key.get("server_id") or None
+        bucket = counts.get(target)
+        if bucket is None:
+            bucket = counts[target] = [0, 0]
+        expiry = timestamp_ms(key.get("expiry_time"))
+        bucket[1 if 0 < expiry < now else 0] += 1
+    return counts
+
+
+class Utilization:
+    """
+    Загрузка серверов ключами: hash-join счётчиков count_keys (по server_id) с серверами.
+    server_id ключа — имя сервера или имя кластера; ключ кластера занимает место на каждом
+    его сервере, поэтому на сервер приходятся его собственные ключи и ключи его кластера.
+    Группы — tariff_group серверов (group_code тарифов); ёмкость группы — сумма max_keys
+    включённых серверов. Наименее загруженный сервер каждой группы выбирается при сборке.
+    """
+
+    def __init__(self, servers: list, counts: dict):
+        self.created = time.time()
+        self.servers: list = []
+        self.by_name: dict = {}
+        self.groups: dict = {}
+        self.least_loaded_by_group: dict = {}
+
+        names = set()
+        for server in servers:
+            if not isinstance(server, dict):
+                continue
+            name = server.get("server_name")
+            cluster = server.get("cluster_name")
+            names.add(name)
+            names.add(cluster)
+            active, expired = counts.get(name, (0, 0))
+            if cluster and cluster != name:
+                cluster_active, cluster_expired = counts.get(cluster, (0, 0))
+                active += cluster_active
+                expired += cluster_expired
+            max_keys = to_int(server.get("max_keys"), 0)
+            row = {
+                "server_name": name,
+                "cluster_name": cluster,
+                "tariff_group": server.get("tariff_group") or NO_GROUP,
+                "enabled": bool(server.get("enabled")),
+                "max_keys": max_keys,
+                "active": active,
+                "expired": expired,
+                "total": active + expired,
+                "free": max(max_keys - active, 0),
+                "load": round(active / max_keys, 4) if max_keys > 0 else None,
+            }
+            self.servers.append(row)
+            self.by_name[name] = row
+            self._add_to_group(row)
+
+        names.discard(None)
+        for group in self.groups.values():
+            # Занятые места — лимит минус свободные: серверы без лимита и сверх лимита долю не искажают.
+            group["load"] = round(1 - group["free"] / group["max_keys"], 4) if group["max_keys"] > 0 else None
+        self.unassigned = sum(active + expired for target, (active, expired) in counts.items() if target not in names)
+        self.servers.sort(key=lambda row: (row["tariff_group"], row["cluster_name"] or "", row["server_name"] or ""))
+
+    def _add_to_group(self, row: dict):
+        group = self.groups.get(row["tariff_group"])
+        if group is None:
+            group = self.groups[row["tariff_group"]] = {
+                "tariff_group": row["tariff_group"], "servers": 0, "enabled": 0,
+                "max_keys": 0, "active": 0, "expired": 0, "free": 0,
+            }
+        group["servers"] += 1
+        if not row["enabled"]:
+            return
+        group["enabled"] += 1
+        group["max_keys"] += row["max_keys"]
+        group["active"] += row["active"]
+        group["expired"] += row["expired"]
+        group["free"] += row["free"]
+        if row["free"] > 0:
+            best = self.least_loaded_by_group.get(row["tariff_group"])
+            if best is None or (row["load"], -row["free"]) < (best["load"], -best["free"]):
+                self.least_loaded_by_group[row["tariff_group"]] = row
+
+    def least_loaded(self, group: str) -> dict | None:
+        """Включённый сервер группы с наименьшей долей занятых мест; None — свободных мест нет."""
+        return self.least_loaded_by_group.get(group or NO_GROUP)
+
+    def available(self) -> int:
+        """Включённые серверы, на которых ещё есть свободные места."""
+        return sum(1 for row in self.servers if row["enabled"] and row["free"] > 0)
+
+    def to_dict(self) -> dict:
+        return {
+            "servers": self.servers,
+            "groups": sorted(self.groups.values(), key=lambda group: group["tariff_group"]),
+            "least_loaded": {group: row["server_name"] for group, row in self.least_loaded_by_group.items()},
+            "unassigned": self.unassigned,
+            "updated_at": datetime.utcfromtimestamp(self.created).isoformat(timespec="seconds"),
+        }
+
+
+async def build_utilization() -> Utilization:
+    # Ключи — из индекса app.core.expiry (он уже держит их все), а не отдельным проходом по /keys/.
+    servers, index = await asyncio.gather(mirror.load("/servers/"), expiry.keys_index.get())
+    if index is None:
+        raise RuntimeError("индекс ключей недоступен")
+    return Utilization(servers, count_keys(index.keys.values(), int(time.time() * 1000)))
+
+
+utilization = Snapshot(build_utilization, UTILIZATION_TTL)
+
+
+def _on_invalidate(prefixes: tuple):
+    if "/keys/".startswith(prefixes) or "/servers/".startswith(prefixes):
+        utilization.expire()
+
+
+upstream.on_invalidate(_on_invalidate)
@@ -1,94 +1,90 @@
-from fastapi import APIRouter, Request, Body
+from fastapi import APIRouter, Request, Body, Depends
 from fastapi.responses import HTMLResponse, JSONResponse
-from fastapi.templating import Jinja2Templates
+from app.core import mirror
+from app.core.fastjson import FastJSONResponse
+from app.core.listing import ListParams, paginate
+from app.core.records import Coupon
+from app.core.routing import PanelRoute
+from app.core.templating import templates
+from app.core.upstream import ADMIN_TG_ID, ADMIN_TOKEN, get_client, get_json, invalidate
 import httpx
-import os
 
-router = APIRouter()
-templates = Jinja2Templates(directory="app/views")
+router = APIRouter(route_class=PanelRoute)
 
-API_BASE_URL = os.getenv("API_BASE_URL", "http://localhost:8000/api")
-ADMIN_TG_ID   = os.getenv("ADMIN_TG_ID", "0")
-ADMIN_TOKEN   = os.getenv("ADMIN_TOKEN", "your_admin_token")
+COUPON_SEARCH_FIELDS = ("id", "code", "amount", "days")
+COUPON_SORT_FIELDS = ("id", "code", "amount", "usage_limit", "used_count")
+
+async def load_coupons():
+    try:
+        return await get_json("/coupons/")
+    except Exception as e:
+        print(f"[ERROR] Не удалось получить купоны: {e}")
+        return []
+
+async def coupons_page_data(params: ListParams):
+    page = await mirror.page("coupons", params, COUPON_SORT_FIELDS, record=Coupon)
+    if page is not None:
+        return page, await mirror.count("coupons")
+    coupons_data = await load_coupons()
+    return paginate(coupons_data, params, COUPON_SEARCH_FIELDS, COUPON_SORT_FIELDS, record=Coupon), len(coupons_data)
 
 @router.get("/coupons", response_class=HTMLResponse)
-async def coupons_page(request: Request):
-    total_coupons = 0
-    coupons_data = []
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.get(
-                f"{API_BASE_URL}/coupons/",
-                params={"tg_id": ADMIN_TG_ID},
-                headers={"X-Token": ADMIN_TOKEN},
-                timeout=10
-            )
-            response.raise_for_status()
-            coupons_data = response.json()
-            total_coupons = len(coupons_data)
-        except Exception as e:
-            print(f"[ERROR] Не удалось получить купоны: {e}")
+async def coupons_page(request: Request, params: ListParams = Depends()):
+    page, total = await coupons_page_data(params)
 
     return templates.TemplateResponse("coupons.html", {
         "request": request,
-        "coupons": coupons_data,
-        "total_coupons": total_coupons,
+        "page": page,
+        "total_coupons": total,
         "token": ADMIN_TOKEN,
         "tg_id": ADMIN_TG_ID,
     })
 
+@router.get("/coupons/rows")
+async def coupons_rows(params: ListParams = Depends()):
+    page, _ = await coupons_page_data(params)
+    return FastJSONResponse(content=page)
+
 @router.post("/coupons")
 async def create_coupon(data: dict = Body(...)):
-
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.post(
-                f"{API_BASE_URL}/coupons/",
-                headers={"X-Token": ADMIN_TOKEN},
-                params={"tg_id": ADMIN_TG_ID},
-                json=data,
-                timeout=10
-            )
-            response.raise_for_status()
-            created = response.json()
-            return JSONResponse(status_code=200, content=created)
-        except httpx.HTTPStatusError as e:
-            return JSONResponse(status_code=e.response.status_code, content={"error": e.response.text})
-        except Exception as e:
-            return JSONResponse(status_code=500, content={"error": str(e)})
+    client = get_client()
+    try:
+        response = await client.post("/coupons/", json=data)
+        response.raise_for_status()
+        created = response.json()
+        await mirror.upsert("coupons", created)
+        invalidate("/coupons/")
+        return JSONResponse(status_code=200, content=created)
+    except httpx.HTTPStatusError as e:
+        return JSONResponse(status_code=e.response.status_code, content={"error": e.response.text})
+    except Exception as e:
+        return JSONResponse(status_code=500, content={"error": str(e)})
 
 @router.patch("/coupons/{code}")
 async def patch_coupon(code: str, data: dict = Body(...)):
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.patch(
-                f"{API_BASE_URL}/coupons/{code}",
-                headers={"X-Token": ADMIN_TOKEN},
-                params={"tg_id": ADMIN_TG_ID},
-                json=data,
-                timeout=10
-            )
-            response.raise_for_status()
-            updated = response.json()
-            return JSONResponse(status_code=200, content=updated)
-        except httpx.HTTPStatusError as e:
-            return JSONResponse(status_code=e.response.status_code, content={"error": e.response.text})
-        except Exception as e:
-            return JSONResponse(status_code=500, content={"error": str(e)})
+    client = get_client()
+    try:
+        response = await client.patch(f"/coupons/{code}", json=data)
+        response.raise_for_status()
+        updated = response.json()
+        await mirror.patch("coupons", updated if isinstance(updated, dict) else data, code=code)
+        invalidate("/coupons/")
+        return JSONResponse(status_code=200, content=updated)
+    except httpx.HTTPStatusError as e:
+        return JSONResponse(status_code=e.response.status_code, content={"error": e.response.text})
+    except Exception as e:
+        return JSONResponse(status_code=500, content={"error": str(e)})
 
 @router.delete("/coupons/{code}")
 async def delete_coupon(code: str):
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.delete(
-                f"{API_BASE_URL}/coupons/{code}",
-                headers={"X-Token": ADMIN_TOKEN},
-                params={"tg_id": ADMIN_TG_ID},
-                timeout=10
-            )
-            response.raise_for_status()
-            return JSONResponse(status_code=200, content={"status": "deleted"})
-        except httpx.HTTPStatusError as e:
-            return JSONResponse(status_code=e.response.status_code, content={"error": e.response.text})
-        except Exception as e:
-            return JSONResponse(status_code=500, content={"error": str(e)})
+    client = get_client()
+    try:
+        response = await client.delete(f"/coupons/{code}")
+        response.raise_for_status()
+        await mirror.delete("coupons", code=code)
+        invalidate("/coupons/")
+        return JSONResponse(status_code=200, content={"status": "deleted"})
+    except httpx.HTTPStatusError as e:
+        return JSONResponse(status_code=e.response.status_code, content={"error": e.response.text})
+    except Exception as e:
+        return JSONResponse(status_code=500, content={"error": str(e)})
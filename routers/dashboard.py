@@ -1,146 +1,179 @@
 from fastapi import APIRouter, Request
-from fastapi.responses import HTMLResponse
-from fastapi.templating import Jinja2Templates
-from datetime import datetime, date, timedelta
-import httpx
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse
+from datetime import datetime, timedelta
+from app.core import expiry, mirror, rollups, utilization
+from app.core.columns import Columns, day_number, day_of, histogram, to_int
+from app.core.fastjson import dumps_str
+from app.core.routing import PanelRoute
+from app.core.snapshot import Snapshot
+from app.core.templating import templates
+from app.core.upstream import fetch_many, invalidate
+import asyncio
 import os
+import time
 
-router = APIRouter()
-templates = Jinja2Templates(directory="app/views")
+router = APIRouter(route_class=PanelRoute)
 
-API_BASE_URL = os.getenv("API_BASE_URL", "http://localhost:8000/api")
-ADMIN_TG_ID   = os.getenv("ADMIN_TG_ID", "0")
-ADMIN_TOKEN   = os.getenv("ADMIN_TOKEN", "your_admin_token")
+DASHBOARD_REFRESH_INTERVAL = float(os.getenv("DASHBOARD_REFRESH_INTERVAL", "60"))
+DASHBOARD_LIVE_HEARTBEAT = float(os.getenv("DASHBOARD_LIVE_HEARTBEAT", "15"))
+DASHBOARD_SOURCES = ("/users/", "/payments/", "/keys/", "/referrals/", "/servers/", "/gifts/")
 
-@router.get("/dashboard", response_class=HTMLResponse)
-async def dashboard_view(request: Request):
+
+async def load_columns(path: str, columns: Columns, row) -> Columns:
+    """Читает path потоком (из зеркала, если оно готово) и складывает в колонки row(item); при ошибке — пустые колонки."""
+    try:
+        async for item in mirror.stream(path):
+            columns.append(*row(item))
+    except Exception as e:
+        print(f"[ERROR] {path}: {e}")
+        columns = Columns(**{name: column.typecode for name, column in columns.columns.items()})
+    return columns
+
+
+def load_users():
+    return load_columns("/users/", Columns(tg_id='q', day='q'), lambda u: (
+        to_int(u.get('tg_id')), day_number(u.get('created_at')),
+    ))
+
+
+def subs_columns(index) -> Columns:
+    """Колонки ключей из индекса app.core.expiry: он уже держит все ключи, второй проход по /keys/ не нужен."""
+    columns = Columns(tg_id='q', day='q')
+    for key in (index.keys.values() if index else ()):
+        columns.append(to_int(key.get('tg_id')), day_number(key.get('created_at')))
+    return columns
+
+
+def load_refs():
+    return load_columns("/referrals/", Columns(day='q'), lambda r: (day_number(r.get('created_at')),))
+
+
+def load_gifts():
+    return load_columns("/gifts/", Columns(day='q', used='b', unlimited='b'), lambda g: (
+        day_number(g.get('created_at')), bool(g.get('is_used')), bool(g.get('is_unlimited')),
+    ))
+
+
+async def build_stats():
+    today = datetime.utcnow().date()
+    last_30_days = [today - timedelta(days=i) for i in reversed(range(30))]
+    day_keys = [day_of(d) for d in last_30_days]
+    today_key = day_of(today)
+
+    users, revenue, expiring, refs, gifts, servers, usage = await asyncio.gather(
+        load_users(), rollups.revenue.get(), expiry.keys_index.get(), load_refs(), load_gifts(),
+        fetch_many({"servers": "/servers/"}), utilization.utilization.get(),
+    )
+    servers = servers["servers"]
+    subs = subs_columns(expiring)
     stats = {}
-    async with httpx.AsyncClient() as client:
-        try:
-            users_resp = await client.get(
-                f"{API_BASE_URL}/users/",
-                params={"tg_id": ADMIN_TG_ID},
-                headers={"X-Token": ADMIN_TOKEN}
-            )
-            users = users_resp.json() if users_resp.status_code == 200 else []
-        except Exception as e:
-            print(f"[ERROR] users: {e}")
-            users = []
-        stats['total_users'] = len(users)
-        stats['users_today'] = sum(1 for u in users if u.get('created_at', '').startswith(str(date.today())))
-
-        try:
-            payments_resp = await client.get(
-                f"{API_BASE_URL}/payments/",
-                params={"tg_id": ADMIN_TG_ID},
-                headers={"X-Token": ADMIN_TOKEN}
-            )
-            payments = payments_resp.json() if payments_resp.status_code == 200 else []
-        except Exception as e:
-            print(f"[ERROR] payments: {e}")
-            payments = []
-        stats['total_payments'] = len(payments)
-        stats['payments_today'] = sum(1 for p in payments if p.get('created_at', '').startswith(str(date.today())))
-        stats['payments_sum'] = sum(float(p.get('amount', 0)) for p in payments)
-        stats['payments_sum_today'] = sum(float(p.get('amount', 0)) for p in payments if p.get('created_at', '').startswith(str(date.today())))
-
-        try:
-            subs_resp = await client.get(
-                f"{API_BASE_URL}/keys/",
-                params={"tg_id": ADMIN_TG_ID},
-                headers={"X-Token": ADMIN_TOKEN}
-            )
-            subs = subs_resp.json() if subs_resp.status_code == 200 else []
-        except Exception as e:
-            print(f"[ERROR] subs: {e}")
-            subs = []
-        stats['total_subs'] = len(subs)
-        now = datetime.utcnow().timestamp()
-        stats['expired_subs'] = sum(1 for s in subs if s.get('expiry_time', 0) and float(s['expiry_time']) < now)
-
-        try:
-            refs_resp = await client.get(
-                f"{API_BASE_URL}/referrals/",
-                params={"tg_id": ADMIN_TG_ID},
-                headers={"X-Token": ADMIN_TOKEN}
-            )
-            refs = refs_resp.json() if refs_resp.status_code == 200 else []
-        except Exception as e:
-            print(f"[ERROR] refs: {e}")
-            refs = []
-        stats['total_refs'] = len(refs)
-        stats['refs_today'] = sum(
-            1 for r in refs if r.get('created_at', '').startswith(str(date.today()))
-        )
-
-        try:
-            servers_resp = await client.get(
-                f"{API_BASE_URL}/servers/",
-                params={"tg_id": ADMIN_TG_ID},
-                headers={"X-Token": ADMIN_TOKEN}
-            )
-            servers = servers_resp.json() if servers_resp.status_code == 200 else []
-        except Exception as e:
-            print(f"[ERROR] servers: {e}")
-            servers = []
-
-        stats['servers_used'] = sum(1 for s in servers if s.get('enabled'))
+
+    stats['total_users'] = len(users)
+    stats['users_today'] = users['day'].count(today_key)
+    stats['users_growth_month'] = histogram(users['day'], day_keys)
+
+    # Платежи — из корзин rollups.revenue: сумма за сегодня не требует обхода всех платежей.
+    revenue_today = revenue.totals(today_key, today_key) if revenue else {"count": 0, "amount": 0.0}
+    stats['total_payments'] = revenue.count if revenue else 0
+    stats['payments_today'] = revenue_today['count']
+    stats['payments_sum'] = round(revenue.amount, 2) if revenue else 0.0
+    stats['payments_sum_today'] = revenue_today['amount']
+
+    # Истёкшие — два bisect по индексу app.core.expiry вместо сортировки всех сроков.
+    stats['total_subs'] = len(subs)
+    stats['expired_subs'] = expiring.expired(expiry.now_ms()) if expiring else 0
+    stats['subs_growth_month'] = histogram(subs['day'], day_keys)
+
+    with_subs = set(subs['tg_id'])
+    stats['users_without_subs'] = len(users) - sum(map(with_subs.__contains__, users['tg_id']))
+
+    stats['total_refs'] = len(refs)
+    stats['refs_today'] = refs['day'].count(today_key)
+
+    stats['servers_used'] = sum(1 for s in servers if s.get('enabled'))
+    # Доступные — включённые серверы, где активных ключей меньше max_keys (app.core.utilization).
+    if usage:
+        stats['servers_available'] = usage.available()
+    else:
         stats['servers_available'] = sum(1 for s in servers if s.get('enabled') and (s.get('max_keys') or 0) > 0)
-        stats['servers_disabled'] = sum(1 for s in servers if not s.get('enabled'))
-
-        user_ids_with_subs = set(s.get('tg_id') for s in subs)
-        stats['users_without_subs'] = sum(1 for u in users if u.get('tg_id') not in user_ids_with_subs)
-
-        today = datetime.utcnow().date()
-        last_30_days = [(today - timedelta(days=i)).isoformat() for i in reversed(range(30))]
-
-        users_by_date = {d: 0 for d in last_30_days}
-        for u in users:
-            reg_date = u.get('created_at', '')[:10]
-            if reg_date in users_by_date:
-                users_by_date[reg_date] += 1
-        stats['users_growth_month'] = list(users_by_date.values())
-        stats['last_30_days'] = last_30_days
-
-        subs_by_date = {d: 0 for d in last_30_days}
-        for s in subs:
-            created = s.get('created_at')
-            sub_date = None
-            if created:
-                try:
-                    if isinstance(created, (int, float)):
-                        sub_date = datetime.utcfromtimestamp(float(created) / 1000).date().isoformat()
-                    elif isinstance(created, str):
-                        if len(created) >= 10 and created[:10].count('-') == 2:
-                            sub_date = created[:10]
-                        else:
-                            sub_date = datetime.utcfromtimestamp(float(created) / 1000).date().isoformat()
-                except Exception:
-                    sub_date = None
-            if sub_date and sub_date in subs_by_date:
-                subs_by_date[sub_date] += 1
-        stats['subs_growth_month'] = list(subs_by_date.values())
-
-        try:
-            gifts_resp = await client.get(
-                f"{API_BASE_URL}/gifts/",
-                params={"tg_id": ADMIN_TG_ID},
-                headers={"X-Token": ADMIN_TOKEN}
-            )
-            gifts = gifts_resp.json() if gifts_resp.status_code == 200 else []
-        except Exception as e:
-            print(f"[ERROR] gifts: {e}")
-            gifts = []
-        stats['total_gifts'] = len(gifts)
-        stats['gifts_today'] = sum(1 for g in gifts if g.get('created_at', '').startswith(str(date.today())))
-        stats['gifts_used'] = sum(1 for g in gifts if g.get('is_used'))
-        stats['gifts_unlimited'] = sum(1 for g in gifts if g.get('is_unlimited'))
-
-    for key in [
-        'total_users', 'users_today', 'total_payments', 'payments_today', 'payments_sum',
-        'total_subs', 'expired_subs', 'total_refs', 'users_without_subs'
-    ]:
-        if key not in stats or stats[key] is None:
-            stats[key] = 0
-
-    return templates.TemplateResponse("dashboard.html", {"request": request, "stats": stats})
+    stats['servers_disabled'] = sum(1 for s in servers if not s.get('enabled'))
+
+    stats['total_gifts'] = len(gifts)
+    stats['gifts_today'] = gifts['day'].count(today_key)
+    stats['gifts_used'] = gifts['used'].count(1)
+    stats['gifts_unlimited'] = gifts['unlimited'].count(1)
+
+    stats['last_30_days'] = [d.isoformat() for d in last_30_days]
+    return stats
+
+
+stats_snapshot = Snapshot(build_stats, DASHBOARD_REFRESH_INTERVAL)
+
+
+@router.get("/dashboard", response_class=HTMLResponse)
+async def dashboard_view(request: Request):
+    stats = await stats_snapshot.get() or {}
+    return templates.TemplateResponse("dashboard.html", {
+        "request": request,
+        "stats": stats,
+        "snapshot_age": int(stats_snapshot.age or 0),
+    })
+
+
+@router.post("/dashboard/refresh")
+async def refresh_dashboard():
+    invalidate(*DASHBOARD_SOURCES)
+    # Сначала зеркало (если включено) — снимки ниже читают из него; затем вложенные снимки:
+    # invalidate() только помечает их устаревшими, а build_stats взял бы старые значения.
+    await mirror.sync_paths(*DASHBOARD_SOURCES)
+    await asyncio.gather(rollups.revenue.refresh(), expiry.keys_index.refresh())
+    await utilization.utilization.refresh()  # считается по свежему индексу ключей
+    await stats_snapshot.refresh()
+    return JSONResponse(content={"success": True, "snapshot_age": int(stats_snapshot.age or 0)})
+
+
+def stats_delta(previous: dict, current: dict) -> dict:
+    return {key: value for key, value in current.items() if previous.get(key) != value}
+
+
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {dumps_str(data)}\n\n"
+
+
+async def live_stats(request: Request):
+    """
+    События для открытой панели: сначала текущий снимок, затем только изменившиеся поля
+    после пересборки, если что-то изменилось. Сами данные собирает общий фоновый опрос stats_snapshot,
+    поэтому число открытых панелей не влияет на нагрузку на upstream.
+    """
+    queue = stats_snapshot.subscribe()
+    try:
+        sent = await stats_snapshot.get() or {}
+        yield sse_event("snapshot", {"stats": sent, "age": int(stats_snapshot.age or 0)})
+        # Heartbeat отсчитывается от последней записи в поток: пустые пересборки событий не дают.
+        written = time.monotonic()
+        while not await request.is_disconnected():
+            try:
+                wait = max(0.0, DASHBOARD_LIVE_HEARTBEAT - (time.monotonic() - written))
+                stats = await asyncio.wait_for(queue.get(), wait)
+            except asyncio.TimeoutError:
+                yield ": ping\n\n"
+                written = time.monotonic()
+                continue
+            delta = stats_delta(sent, stats or {})
+            sent = stats or {}
+            if not delta:
+                continue
+            yield sse_event("delta", {"stats": delta, "age": int(stats_snapshot.age or 0)})
+            written = time.monotonic()
+    finally:
+        stats_snapshot.unsubscribe(queue)
+
+
+@router.get("/dashboard/live")
+async def dashboard_live(request: Request):
+    return StreamingResponse(
+        live_stats(request),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -1,83 +1,90 @@
-from fastapi import APIRouter, Request
-from fastapi.responses import HTMLResponse, JSONResponse
-from fastapi.templating import Jinja2Templates
+from fastapi import APIRouter, Request, Depends, Body
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, StreamingResponse
+from app.core import mirror
+from app.core.fastjson import FastJSONResponse
 from datetime import datetime, timedelta
 from dateutil import parser
-import httpx
+from app.core.cache import MISSING, TTLCache
+from app.core.listing import ListParams, paginate
+from app.core.ratelimit import RateLimiter
+from app.core.records import Gift, Tariff
+from app.core.routing import PanelRoute
+from app.core.templating import defer, stream_template
+from app.core.upstream import ADMIN_TG_ID, ADMIN_TOKEN, get_client, get_json, invalidate
+import asyncio
+import json
 import os
+import uuid
 
-router = APIRouter()
-templates = Jinja2Templates(directory="app/views")
+router = APIRouter(route_class=PanelRoute)
 
-API_BASE_URL = os.getenv("API_BASE_URL", "http://localhost:3003/api")
-ADMIN_TG_ID = os.getenv("ADMIN_TG_ID", "0")
-ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "your_admin_token")
+
+GIFT_SEARCH_FIELDS = ("gift_id", "sender_tg_id", "recipient_tg_id")
+GIFT_SORT_FIELDS = ("gift_id", "sender_tg_id", "recipient_tg_id", "created_at", "selected_months", "tariff_id")
+GIFTS_BATCH_MAX = int(os.getenv("GIFTS_BATCH_MAX", "10000"))
+GIFTS_BATCH_CONCURRENCY = int(os.getenv("GIFTS_BATCH_CONCURRENCY", "8"))
+GIFTS_BATCH_RATE = float(os.getenv("GIFTS_BATCH_RATE", "50"))
+GIFTS_BATCH_PROGRESS_EVERY = int(os.getenv("GIFTS_BATCH_PROGRESS_EVERY", "50"))
+
+# Коды завершённых кампаний для скачивания: батч живёт час, хранится не больше 20 последних.
+gift_batches = TTLCache(20, 3600)
+# Идущие кампании — вне кэша, чтобы их не вытеснили более новые; по завершении переходят в gift_batches.
+running_gift_batches: dict = {}
+
+
+async def load_gifts():
+    try:
+        return await get_json("/gifts/")
+    except Exception as e:
+        print(f"[ERROR] Не удалось получить подарки: {e}")
+        return []
+
+
+async def load_tariffs() -> list:
+    try:
+        return Tariff.from_list(await mirror.load("/tariffs/"))
+    except Exception as e:
+        print(f"[ERROR] Не удалось получить тарифы: {e}")
+        return []
+
+
+async def gifts_page_data(params: ListParams):
+    """Страница подарков и их общее число: из зеркала, если оно готово, иначе из /gifts/."""
+    page = await mirror.page("gifts", params, GIFT_SORT_FIELDS, record=Gift)
+    if page is not None:
+        return page, await mirror.count("gifts")
+    gifts_data = await load_gifts()
+    return paginate(gifts_data, params, GIFT_SEARCH_FIELDS, GIFT_SORT_FIELDS, record=Gift), len(gifts_data)
 
 
 @router.get("/gifts", response_class=HTMLResponse)
-async def gifts_page(request: Request):
-    gifts_data = []
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.get(
-                f"{API_BASE_URL}/gifts/",
-                params={"tg_id": ADMIN_TG_ID},
-                headers={"X-Token": ADMIN_TOKEN},
-                timeout=10
-            )
-            response.raise_for_status()
-            gifts_data = response.json()
-            for gift in gifts_data:
-                created = gift.get("created_at")
-                if created:
-                    try:
-                        dt = datetime.fromisoformat(created.replace("Z", "+00:00"))
-                        gift["created_at_human"] = dt.strftime('%d.%m.%Y %H:%M')
-                    except Exception:
-                        gift["created_at_human"] = created
-                else:
-                    gift["created_at_human"] = "—"
-        except Exception as e:
-            print(f"[ERROR] Не удалось получить подарки: {e}")
-
-    tariffs_data = []
-    async with httpx.AsyncClient() as client:
-        try:
-            resp = await client.get(
-                f"{API_BASE_URL}/tariffs/",
-                params={"tg_id": ADMIN_TG_ID},
-                headers={"X-Token": ADMIN_TOKEN},
-                timeout=10
-            )
-            resp.raise_for_status()
-            tariffs_data = resp.json()
-        except Exception as e:
-            print(f"[ERROR] Не удалось получить тарифы: {e}")
-
-    return templates.TemplateResponse("gifts.html", {
+async def gifts_page(request: Request, params: ListParams = Depends()):
+    page, total = defer(gifts_page_data(params), 2)
+
+    return await stream_template("gifts.html", {
         "request": request,
-        "gifts": gifts_data,
-        "tariffs": tariffs_data,
-        "tg_id": ADMIN_TG_ID,     
-        "token": ADMIN_TOKEN      
+        "page": page,
+        "total_gifts": total,
+        "tariffs": defer(load_tariffs()),
+        "tg_id": ADMIN_TG_ID,
+        "token": ADMIN_TOKEN
     })
 
 
+@router.get("/gifts/rows")
+async def gifts_rows(params: ListParams = Depends()):
+    page, _ = await gifts_page_data(params)
+    return FastJSONResponse(content=page)
+
+
 @router.patch("/gifts/{gift_id}")
 async def patch_gift(gift_id: str, request: Request):
     try:
         payload = await request.json()
-        async with httpx.AsyncClient() as client:
-            response = await client.patch(
-                f"{API_BASE_URL}/gifts/{gift_id}",
-                params={"tg_id": ADMIN_TG_ID},
-                headers={
-                    "X-Token": ADMIN_TOKEN,
-                    "Content-Type": "application/json"
-                },
-                json=payload
-            )
+        response = await get_client().patch(f"/gifts/{gift_id}", json=payload)
         response.raise_for_status()
+        await mirror.patch("gifts", payload, gift_id=gift_id)
+        invalidate("/gifts/")
         return JSONResponse(content={"success": True})
     except Exception as e:
         print(f"[ERROR] Ошибка при обновлении подарка {gift_id}: {e}")
@@ -87,13 +94,10 @@ async def patch_gift(gift_id: str, request: Request):
 @router.delete("/gifts/{gift_id}")
 async def delete_gift(gift_id: str):
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.delete(
-                f"{API_BASE_URL}/gifts/{gift_id}",
-                params={"tg_id": ADMIN_TG_ID},
-                headers={"X-Token": ADMIN_TOKEN}
-            )
+        response = await get_client().delete(f"/gifts/{gift_id}")
         response.raise_for_status()
+        await mirror.delete("gifts", gift_id=gift_id)
+        invalidate("/gifts/")
         return JSONResponse(content={"success": True})
     except Exception as e:
         print(f"[ERROR] Ошибка при удалении подарка {gift_id}: {e}")
@@ -106,30 +110,169 @@ def make_naive(dt: datetime) -> datetime:
     return dt
 
 
+def normalize_expiry(expiry_raw) -> str:
+    """Приводит время истечения к naive 'YYYY-MM-DD HH:MM:SS'; по умолчанию — через 30 дней."""
+    if expiry_raw:
+        dt = make_naive(parser.parse(expiry_raw))
+    else:
+        dt = datetime.utcnow() + timedelta(days=30)
+    return dt.isoformat(sep=' ')
+
+
 @router.post("/gifts")
 async def create_gift(request: Request):
     try:
         payload = await request.json()
-        expiry_raw = payload.get("expiry_time")
-        if expiry_raw:
-            dt = parser.parse(expiry_raw)
-            if dt.tzinfo:
-                dt = dt.replace(tzinfo=None)
-            payload["expiry_time"] = dt.isoformat(sep=' ')
-        else:
-            payload["expiry_time"] = (datetime.utcnow() + timedelta(days=30)).isoformat(sep=' ')
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{API_BASE_URL}/gifts/",
-                params={"tg_id": ADMIN_TG_ID},
-                headers={
-                    "X-Token": ADMIN_TOKEN,
-                    "Content-Type": "application/json"
-                },
-                json=payload
-            )
+        payload["expiry_time"] = normalize_expiry(payload.get("expiry_time"))
+        response = await get_client().post("/gifts/", json=payload)
         response.raise_for_status()
-        return JSONResponse(content=response.json())
+        created = response.json()
+        await mirror.upsert("gifts", created)
+        invalidate("/gifts/")
+        return JSONResponse(content=created)
     except Exception as e:
         print(f"[ERROR] Ошибка при создании подарка: {e}")
-        return JSONResponse(status_code=500, content={"error": "Create failed"})
\ No newline at end of file
+        return JSONResponse(status_code=500, content={"error": "Create failed"})
+
+
+# Задачи идущих кампаний: ссылка держит их до конца, даже если клиент уже отключился.
+_gift_batch_tasks: set = set()
+
+
+async def run_gift_batch(batch_id: str, template: dict, count: int, finished: asyncio.Queue):
+    """
+    Создаёт count подарков по шаблону: GIFTS_BATCH_CONCURRENCY воркеров разбирают очередь,
+    общий RateLimiter держит темп не выше GIFTS_BATCH_RATE запросов в секунду.
+    Результат каждого подарка (True/False) кладётся в finished; созданные коды копятся
+    в running_gift_batches, после завершения батч переходит в gift_batches.
+    """
+    batch = running_gift_batches[batch_id]
+    client = get_client()
+    limiter = RateLimiter(GIFTS_BATCH_RATE)
+    pending = asyncio.Queue()
+    for _ in range(count):
+        pending.put_nowait(str(uuid.uuid4()))
+
+    async def worker():
+        while not pending.empty():
+            gift_id = pending.get_nowait()
+            await limiter.acquire()
+            try:
+                response = await client.post("/gifts/", json={**template, "gift_id": gift_id})
+                response.raise_for_status()
+            except Exception as e:
+                print(f"[ERROR] Ошибка при создании подарка {gift_id}: {e}")
+                batch["failed"] += 1
+                finished.put_nowait(False)
+                continue
+            # Любой 2xx — подарок создан; тело ответа не обязано быть записью подарка.
+            try:
+                created = response.json() if response.content else None
+            except ValueError:
+                created = None
+            code = created.get("gift_id") if isinstance(created, dict) else None
+            batch["codes"].append(code or gift_id)
+            finished.put_nowait(True)
+
+    try:
+        await asyncio.gather(*(worker() for _ in range(min(GIFTS_BATCH_CONCURRENCY, count))))
+    finally:
+        gift_batches.set(batch_id, running_gift_batches.pop(batch_id))
+        if batch["codes"]:
+            invalidate("/gifts/")
+
+
+def start_gift_batch(template: dict, count: int) -> tuple:
+    """Запускает кампанию фоновой задачей; возвращает её id и очередь результатов для прогресса."""
+    batch_id = uuid.uuid4().hex
+    running_gift_batches[batch_id] = {"codes": [], "failed": 0, "total": count}
+    finished = asyncio.Queue()
+    task = asyncio.create_task(run_gift_batch(batch_id, template, count, finished))
+    _gift_batch_tasks.add(task)
+    task.add_done_callback(_gift_batch_tasks.discard)
+    return batch_id, finished
+
+
+async def gift_batch_progress(batch_id: str, count: int, finished: asyncio.Queue):
+    """
+    События прогресса кампании (NDJSON-строки). Отключение клиента останавливает только
+    этот поток: кампания дорабатывает в фоне, коды — по ссылке из первого события.
+    """
+    download_url = f"/gifts/batch/{batch_id}/codes"
+    yield json.dumps({"event": "started", "batch_id": batch_id, "total": count, "download_url": download_url}) + "\n"
+    created = 0
+    for done in range(1, count + 1):
+        created += await finished.get()
+        if done % GIFTS_BATCH_PROGRESS_EVERY == 0 or done == count:
+            yield json.dumps({
+                "event": "progress",
+                "done": done,
+                "created": created,
+                "failed": done - created,
+                "total": count,
+            }) + "\n"
+
+    yield json.dumps({
+        "event": "done",
+        "batch_id": batch_id,
+        "created": created,
+        "failed": count - created,
+        "download_url": download_url,
+    }) + "\n"
+
+
+@router.post("/gifts/batch")
+async def create_gift_batch(
+    count: int = Body(..., ge=1),
+    tariff_id: int = Body(...),
+    expiry_time: str | None = Body(None),
+    max_usages: int = Body(0, ge=0),
+    is_unlimited: bool = Body(False),
+    selected_months: int = Body(0, ge=0),
+    recipient_tg_id: int | None = Body(None),
+    gift_link: str = Body(""),
+    is_used: bool = Body(False),
+):
+    """
+    Массовое создание подарков для кампаний. Ответ — поток NDJSON с прогрессом; первая
+    и последняя строки содержат ссылку на файл с кодами. Кампания идёт в фоне и доводится
+    до конца, даже если клиент отключился. Коды кампании ничьи и не использованы:
+    получатель, ссылка и is_used для батча отклоняются, а не теряются молча.
+    """
+    if count > GIFTS_BATCH_MAX:
+        return JSONResponse(status_code=400, content={"error": f"Не более {GIFTS_BATCH_MAX} подарков за раз"})
+    if recipient_tg_id is not None or gift_link or is_used:
+        return JSONResponse(status_code=400, content={
+            "error": "Для нескольких подарков нельзя указать получателя, ссылку или «Использован»"
+        })
+    try:
+        expiry = normalize_expiry(expiry_time)
+    except (ValueError, OverflowError):
+        return JSONResponse(status_code=400, content={"error": "Некорректное время истечения"})
+
+    template = {
+        "sender_tg_id": ADMIN_TG_ID,
+        "selected_months": selected_months,
+        "tariff_id": tariff_id,
+        "max_usages": max_usages,
+        "gift_link": "",
+        "is_used": False,
+        "is_unlimited": is_unlimited,
+        "expiry_time": expiry,
+    }
+    batch_id, finished = start_gift_batch(template, count)
+    return StreamingResponse(
+        gift_batch_progress(batch_id, count, finished),
+        media_type="application/x-ndjson",
+    )
+
+
+@router.get("/gifts/batch/{batch_id}/codes")
+async def download_gift_batch(batch_id: str):
+    batch = running_gift_batches.get(batch_id) or gift_batches.get(batch_id)
+    if batch is MISSING:
+        return JSONResponse(status_code=404, content={"error": "Кампания не найдена или устарела"})
+    return PlainTextResponse(
+        "\n".join(batch["codes"]) + "\n",
+        headers={"Content-Disposition": f'attachment; filename="gifts-{batch_id}.txt"'},
+    )
@@ -1,93 +1,207 @@
-from fastapi import APIRouter, Request, Path, Body
+from fastapi import APIRouter, Request, Path, Body, Depends, Query
 from fastapi.responses import HTMLResponse, JSONResponse
-from fastapi.templating import Jinja2Templates
-from datetime import datetime
+from app.core import expiry, mirror, search
+from app.core.export import export_response
+from app.core.fastjson import FastJSONResponse
+from app.core.listing import ListParams, paginate, paginate_stream
+from app.core.records import Key
+from app.core.routing import PanelRoute
+from app.core.templating import defer, stream_template
+from app.core.upstream import ADMIN_TG_ID, ADMIN_TOKEN, get_client, invalidate, stream_json
+import asyncio
 import httpx
 import os
 
-router = APIRouter()
-templates = Jinja2Templates(directory="app/views")
+router = APIRouter(route_class=PanelRoute)
 
-API_BASE_URL = os.getenv("API_BASE_URL", "http://localhost:3003/api")
-ADMIN_TG_ID = os.getenv("ADMIN_TG_ID", "0")
-ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "your_admin_token")
+
+KEY_SEARCH_FIELDS = ("email", "client_id", "tg_id")
+KEY_SORT_FIELDS = ("tg_id", "client_id", "email", "expiry_time", "server_id", "created_at")
+KEYS_BULK_CONCURRENCY = int(os.getenv("KEYS_BULK_CONCURRENCY", "8"))
+KEYS_BULK_MAX = int(os.getenv("KEYS_BULK_MAX", "5000"))
+EXPIRING_MODES = ("soon", "expired")
+EXPIRING_DAYS_DEFAULT = 7
+
+
+async def keys_page_data(params: ListParams):
+    """
+    Ключи читаются из /keys/ потоком: в памяти остаётся только запрошенная страница.
+    С готовым зеркалом страницу выбирает SQLite, поиск без зеркала идёт по индексу app.core.search.
+    """
+    page = await mirror.page("keys", params, KEY_SORT_FIELDS, record=Key)
+    if page is not None:
+        return page, await mirror.count("keys")
+    if params.q:
+        found, total = await search.matches("keys", params.q)
+        if found is not None:
+            return paginate(found, params, (), KEY_SORT_FIELDS, record=Key), total
+
+    counter = {"total": 0}
+
+    def count(key):
+        counter["total"] += 1
+
+    try:
+        page = await paginate_stream(
+            stream_json("/keys/"), params, KEY_SEARCH_FIELDS, KEY_SORT_FIELDS, on_item=count, record=Key
+        )
+    except Exception as e:
+        print(f"[ERROR] Не удалось получить ключи: {e}")
+        page = paginate([], params)
+    return page, counter["total"]
 
 
 @router.get("/keys", response_class=HTMLResponse)
-async def keys_page(request: Request):
-    total = 0
-    keys_data = []
-
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.get(
-                f"{API_BASE_URL}/keys/",
-                params={"tg_id": ADMIN_TG_ID},
-                headers={"X-Token": ADMIN_TOKEN},
-                timeout=10
-            )
-            response.raise_for_status()
-            keys_data = response.json()
-            total = len(keys_data)
-
-            for key in keys_data:
-                expiry_raw = key.get("expiry_time")
-                if isinstance(expiry_raw, (int, float)):
-                    key["expiry_date"] = datetime.fromtimestamp(expiry_raw / 1000).strftime("%Y-%m-%d")
-                else:
-                    key["expiry_date"] = None
-
-                if key['expiry_time']:
-                    key['expiry_time_human'] = datetime.utcfromtimestamp(key['expiry_time'] // 1000).strftime('%d.%m.%Y %H:%M')
-                else:
-                    key['expiry_time_human'] = '—'
-
-        except Exception as e:
-            print(f"[ERROR] Не удалось получить ключи: {e}")
-
-    return templates.TemplateResponse("keys.html", {
+async def keys_page(request: Request, params: ListParams = Depends()):
+    page, total = defer(keys_page_data(params), 2)
+
+    return await stream_template("keys.html", {
         "request": request,
         "total_keys": total,
-        "keys": keys_data,
+        "page": page,
         "tg_id": ADMIN_TG_ID,
         "token": ADMIN_TOKEN
     })
 
 
+@router.get("/keys/rows")
+async def keys_rows(params: ListParams = Depends()):
+    page, _ = await keys_page_data(params)
+    return FastJSONResponse(content=page)
+
+
+async def expiring_page_data(params: ListParams, mode: str, days: int):
+    """
+    Ключи, истекающие в ближайшие days дней (mode=soon) или истёкшие за последние days дней
+    (mode=expired), и счётчики по окнам EXPIRY_WINDOWS — всё из индекса app.core.expiry без обхода ключей.
+    """
+    index = await expiry.keys_index.get()
+    if index is None:
+        return paginate([], params), {}
+    now = expiry.now_ms()
+    items = index.expiring(days, now) if mode == "soon" else index.recently_expired(days, now)
+    return paginate(items, params, KEY_SEARCH_FIELDS, KEY_SORT_FIELDS, record=Key), index.counters(now)
+
+
+@router.get("/keys/expiring", response_class=HTMLResponse)
+async def keys_expiring_page(
+    request: Request,
+    params: ListParams = Depends(),
+    mode: str = Query("soon"),
+    days: int = Query(EXPIRING_DAYS_DEFAULT, ge=1, le=3650),
+):
+    if mode not in EXPIRING_MODES:
+        mode = "soon"
+    page, counters = await expiring_page_data(params, mode, days)
+
+    return await stream_template("keys_expiring.html", {
+        "request": request,
+        "page": page,
+        "counters": counters,
+        "mode": mode,
+        "days": days,
+        "windows": expiry.EXPIRY_WINDOWS,
+    })
+
+
+@router.get("/keys/expiring/rows")
+async def keys_expiring_rows(
+    params: ListParams = Depends(),
+    mode: str = Query("soon"),
+    days: int = Query(EXPIRING_DAYS_DEFAULT, ge=1, le=3650),
+):
+    if mode not in EXPIRING_MODES:
+        return JSONResponse(status_code=400, content={"error": f"mode: {', '.join(EXPIRING_MODES)}"})
+    page, counters = await expiring_page_data(params, mode, days)
+    return FastJSONResponse(content={**page, "counters": counters})
+
+
+@router.get("/keys/export")
+async def keys_export(
+    format: str = Query("csv"),
+    fields: str | None = Query(None),
+    date_from: str | None = Query(None, alias="from"),
+    date_to: str | None = Query(None, alias="to"),
+):
+    """Полная выгрузка ключей в CSV/NDJSON потоком: ?format=csv|ndjson&fields=...&from=2025-01-01&to=2025-01-31."""
+    return export_response("keys", mirror.stream("/keys/", cache=False), format, fields, date_from, date_to,
+                           default_fields=Key.field_names())
+
+
 @router.patch("/keys/edit/by_email/{email}")
 async def edit_key_by_email(
     email: str = Path(..., description="Email клиента"),
     request: Request = None,
     body: dict = Body(...)
 ):
-    async with httpx.AsyncClient() as client:
-        try:
-            resp = await client.patch(
-                f"{API_BASE_URL}/keys/edit/by_email/{email}",
-                params={"tg_id": ADMIN_TG_ID},
-                headers={"X-Token": ADMIN_TOKEN, "Content-Type": "application/json"},
-                json=body,
-                timeout=10
-            )
-            return JSONResponse(status_code=resp.status_code, content=resp.json())
-        except Exception as e:
-            return JSONResponse(status_code=500, content={"error": f"Ошибка при обновлении ключа: {e}"})
+    client = get_client()
+    try:
+        resp = await client.patch(f"/keys/edit/by_email/{email}", json=body)
+        if resp.is_success:
+            await mirror.patch("keys", body, email=email)
+            search.patch("keys", email, body)
+            expiry.patch(email, body)
+        invalidate("/keys/")
+        return JSONResponse(status_code=resp.status_code, content=resp.json())
+    except Exception as e:
+        return JSONResponse(status_code=500, content={"error": f"Ошибка при обновлении ключа: {e}"})
 
 
 @router.delete("/keys/by_email/{email}")
 async def delete_key_by_email(
     email: str = Path(..., description="Email клиента"),
 ):
-    async with httpx.AsyncClient() as client:
-        try:
-            resp = await client.delete(
-                f"{API_BASE_URL}/keys/by_email/{email}",
-                params={"tg_id": ADMIN_TG_ID},
-                headers={"X-Token": ADMIN_TOKEN},
-                timeout=10
-            )
-            return JSONResponse(status_code=resp.status_code, content=resp.json() or {})
-        except httpx.HTTPStatusError as e:
-            return JSONResponse(status_code=e.response.status_code, content=e.response.json())
-        except Exception as e:
-            return JSONResponse(status_code=500, content={"error": f"Ошибка при удалении ключа: {e}"})
+    client = get_client()
+    try:
+        resp = await client.delete(f"/keys/by_email/{email}")
+        if resp.is_success:
+            await mirror.delete("keys", email=email)
+            search.delete("keys", email)
+            expiry.delete(email)
+        invalidate("/keys/")
+        return JSONResponse(status_code=resp.status_code, content=resp.json() or {})
+    except httpx.HTTPStatusError as e:
+        return JSONResponse(status_code=e.response.status_code, content=e.response.json())
+    except Exception as e:
+        return JSONResponse(status_code=500, content={"error": f"Ошибка при удалении ключа: {e}"})
+
+
+@router.post("/keys/bulk_delete")
+async def bulk_delete_keys(emails: list[str] = Body(..., embed=True)):
+    """
+    Удаляет ключи по списку email, не более KEYS_BULK_CONCURRENCY запросов к upstream
+    одновременно. Ошибка по одному email не прерывает остальные — в ответе отчёт по каждому.
+    """
+    emails = list(dict.fromkeys(email.strip() for email in emails if email and email.strip()))
+    if len(emails) > KEYS_BULK_MAX:
+        return JSONResponse(status_code=400, content={"error": f"Не более {KEYS_BULK_MAX} email за один запрос"})
+
+    client = get_client()
+    semaphore = asyncio.Semaphore(KEYS_BULK_CONCURRENCY)
+
+    async def delete_one(email):
+        async with semaphore:
+            try:
+                resp = await client.delete(f"/keys/by_email/{email}")
+            except Exception as e:
+                print(f"[ERROR] bulk delete {email}: {e}")
+                return {"email": email, "success": False, "status": None, "error": str(e)}
+        if resp.is_success:
+            return {"email": email, "success": True, "status": resp.status_code}
+        return {"email": email, "success": False, "status": resp.status_code, "error": resp.text}
+
+    results = await asyncio.gather(*(delete_one(email) for email in emails))
+    deleted = sum(result["success"] for result in results)
+    if deleted:
+        removed = [result["email"] for result in results if result["success"]]
+        await mirror.delete("keys", email=removed)
+        for email in removed:
+            search.delete("keys", email)
+            expiry.delete(email)
+        invalidate("/keys/")
+    return JSONResponse(content={
+        "total": len(results),
+        "deleted": deleted,
+        "failed": len(results) - deleted,
+        "results": results,
+    })
@@ -0,0 +1,48 @@
+from fastapi import APIRouter, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
+from app.core import metrics, profiling
+from app.core.routing import PanelRoute
+from app.core.upstream import breaker, inflight, response_cache
+
+router = APIRouter(route_class=PanelRoute)
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def state_lines() -> list:
+    """Текущее состояние общих структур upstream — считается в момент запроса."""
+    return [
+        "# HELP panel_upstream_cache_entries Записей в кэше ответов upstream",
+        "# TYPE panel_upstream_cache_entries gauge",
+        f"panel_upstream_cache_entries {len(response_cache)}",
+        "# HELP panel_upstream_coalesced_in_flight Объединённых запросов к upstream в полёте",
+        "# TYPE panel_upstream_coalesced_in_flight gauge",
+        f"panel_upstream_coalesced_in_flight {len(inflight)}",
+        "# HELP panel_upstream_circuit_open Автомат upstream разомкнут (1) или нет (0)",
+        "# TYPE panel_upstream_circuit_open gauge",
+        f"panel_upstream_circuit_open {int(breaker.state != 'closed')}",
+    ]
+
+
+@router.get("/metrics")
+async def metrics_page():
+    body = metrics.render() + "\n".join(state_lines()) + "\n"
+    return PlainTextResponse(body, media_type=PROMETHEUS_CONTENT_TYPE)
+
+
+@router.get("/profiles")
+async def profiles_list(request: Request):
+    if not profiling.authorized(request):
+        return JSONResponse(content={"error": "Профилирование недоступно"}, status_code=403)
+    return JSONResponse(content={"profiles": profiling.saved()})
+
+
+@router.get("/profiles/{name}")
+async def profile_download(request: Request, name: str):
+    """Профиль в формате folded stacks: flamegraph.pl profile.folded > profile.svg или speedscope."""
+    if not profiling.authorized(request):
+        return JSONResponse(content={"error": "Профилирование недоступно"}, status_code=403)
+    folded = profiling.load(name)
+    if folded is None:
+        return JSONResponse(content={"error": "Профиль не найден"}, status_code=404)
+    return PlainTextResponse(folded, headers={"Content-Disposition": f'attachment; filename="{name}"'})
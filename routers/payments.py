@@ -1,27 +1,125 @@
-from fastapi import APIRouter, Request
-from fastapi.responses import HTMLResponse
-from fastapi.templating import Jinja2Templates
-import httpx
-import os
+from fastapi import APIRouter, Request, Depends, Query
+from fastapi.responses import HTMLResponse, JSONResponse
+from datetime import date, datetime, timedelta
+from app.core import mirror, rollups, search
+from app.core.columns import day_of
+from app.core.export import export_response
+from app.core.fastjson import FastJSONResponse
+from app.core.listing import ListParams, paginate, paginate_stream
+from app.core.records import Payment
+from app.core.routing import PanelRoute
+from app.core.templating import defer, stream_template, templates
+from app.core.upstream import stream_json
 
-router = APIRouter()
-templates = Jinja2Templates(directory="app/views")
+router = APIRouter(route_class=PanelRoute)
+
+PAYMENT_SEARCH_FIELDS = ("id", "tg_id", "amount", "payment_system", "provider", "status")
+PAYMENT_SORT_FIELDS = ("id", "tg_id", "amount", "provider", "created_at", "status")
+ANALYTICS_DAYS_DEFAULT = 30
+ANALYTICS_TOP_USERS = 20
+
+
+async def payments_page_data(params: ListParams):
+    """
+    Платежи читаются из /payments/ потоком: в памяти остаётся только запрошенная страница.
+    С готовым зеркалом страницу выбирает SQLite, поиск без зеркала идёт по индексу app.core.search.
+    """
+    page = await mirror.page("payments", params, PAYMENT_SORT_FIELDS, record=Payment)
+    if page is not None:
+        return page, await mirror.count("payments")
+    if params.q:
+        found, total = await search.matches("payments", params.q)
+        if found is not None:
+            return paginate(found, params, (), PAYMENT_SORT_FIELDS, record=Payment), total
+
+    counter = {"total": 0}
+
+    def count(payment):
+        counter["total"] += 1
+
+    try:
+        page = await paginate_stream(
+            stream_json("/payments/"), params, PAYMENT_SEARCH_FIELDS, PAYMENT_SORT_FIELDS,
+            on_item=count, record=Payment,
+        )
+    except Exception as e:
+        print(f"[ERROR] payments: {e}")
+        page = paginate([], params)
+    return page, counter["total"]
 
-API_BASE_URL = os.getenv("API_BASE_URL", "http://localhost:8000/api")
-ADMIN_TG_ID = os.getenv("ADMIN_TG_ID", "0")
-ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "your_admin_token")
 
 @router.get("/payments", response_class=HTMLResponse)
-async def payments_view(request: Request):
-    async with httpx.AsyncClient() as client:
-        try:
-            resp = await client.get(
-                f"{API_BASE_URL}/payments/",
-                params={"tg_id": ADMIN_TG_ID},
-                headers={"X-Token": ADMIN_TOKEN}
-            )
-            payments = resp.json() if resp.status_code == 200 else []
-        except Exception as e:
-            print(f"[ERROR] payments: {e}")
-            payments = []
-    return templates.TemplateResponse("payments.html", {"request": request, "payments": payments})
\ No newline at end of file
+async def payments_view(request: Request, params: ListParams = Depends()):
+    page, total = defer(payments_page_data(params), 2)
+    return await stream_template("payments.html", {
+        "request": request,
+        "page": page,
+        "total_payments": total,
+    })
+
+
+@router.get("/payments/rows")
+async def payments_rows(params: ListParams = Depends()):
+    page, _ = await payments_page_data(params)
+    return FastJSONResponse(content=page)
+
+
+@router.get("/payments/export")
+async def payments_export(
+    format: str = Query("csv"),
+    fields: str | None = Query(None),
+    date_from: str | None = Query(None, alias="from"),
+    date_to: str | None = Query(None, alias="to"),
+):
+    """Полная выгрузка платежей в CSV/NDJSON потоком: ?format=csv|ndjson&fields=...&from=2025-01-01&to=2025-01-31."""
+    return export_response("payments", mirror.stream("/payments/", cache=False), format, fields, date_from, date_to,
+                           default_fields=Payment.field_names())
+
+
+async def analytics_data(date_from: str | None, date_to: str | None, by: str, users: int) -> dict:
+    """Выручка за диапазон дат из корзин rollups.revenue; ValueError для некорректной даты."""
+    rollup = await rollups.revenue.get()
+    end = date.fromisoformat(date_to) if date_to else datetime.utcnow().date()
+    start = date.fromisoformat(date_from) if date_from else end - timedelta(days=ANALYTICS_DAYS_DEFAULT - 1)
+    if start > end:
+        start, end = end, start
+    low, high = day_of(start), day_of(end)
+    if rollup is None:
+        return {"from": start.isoformat(), "to": end.isoformat(), "by": by, "total": {"count": 0, "amount": 0},
+                "series": [], "systems": [], "users": [], "updated_at": None}
+    return {
+        "from": start.isoformat(),
+        "to": end.isoformat(),
+        "by": by,
+        "total": rollup.totals(low, high),
+        "series": rollup.series(low, high, by),
+        "systems": rollup.by_system(low, high),
+        "users": rollup.top_users(low, high, users),
+        "updated_at": datetime.utcfromtimestamp(rollup.updated).isoformat(timespec="seconds"),
+    }
+
+
+@router.get("/payments/analytics", response_class=HTMLResponse)
+async def payments_analytics(request: Request):
+    return templates.TemplateResponse("payments_analytics.html", {
+        "request": request,
+        "data": await analytics_data(None, None, "day", ANALYTICS_TOP_USERS),
+        "granularities": rollups.GRANULARITIES,
+    })
+
+
+@router.get("/payments/analytics/data")
+async def payments_analytics_json(
+    date_from: str | None = Query(None, alias="from"),
+    date_to: str | None = Query(None, alias="to"),
+    by: str = Query("day"),
+    users: int = Query(ANALYTICS_TOP_USERS, ge=0, le=500),
+):
+    """Выручка и число платежей по дням/неделям/месяцам, по кассам и по пользователям за ?from=&to=."""
+    if by not in rollups.GRANULARITIES:
+        return JSONResponse(status_code=400, content={"error": f"by: {', '.join(rollups.GRANULARITIES)}"})
+    try:
+        data = await analytics_data(date_from, date_to, by, users)
+    except ValueError:
+        return JSONResponse(status_code=400, content={"error": "Некорректная дата: нужен формат 2025-01-31"})
+    return FastJSONResponse(content=data)
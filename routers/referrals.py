@@ -1,37 +1,32 @@
 from fastapi import FastAPI
 from fastapi import APIRouter, Request
-from fastapi.templating import Jinja2Templates
-import httpx
-import os
+from app.core import mirror
+from app.core.records import Referral
+from app.core.routing import PanelRoute
+from app.core.templating import stream_template
+from app.core.upstream import ADMIN_TG_ID, ADMIN_TOKEN, get_client, invalidate
 
 app = FastAPI()
 
-router = APIRouter()
-templates = Jinja2Templates(directory="app/views")
+router = APIRouter(route_class=PanelRoute)
 
-API_BASE_URL = os.getenv("API_BASE_URL", "http://localhost:8000/api")
-ADMIN_TG_ID = os.getenv("ADMIN_TG_ID", "0")
-ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "your_admin_token")
+
+async def iter_referrals():
+    """Рефералы из /referrals/ (или зеркала) по мере чтения — строки таблицы уходят клиенту сразу."""
+    try:
+        async for item in mirror.stream("/referrals/"):
+            yield Referral.from_dict(item)
+    except Exception as e:
+        print(f"[ERROR] referrals: {e}")
 
 
 @router.get("/referrals")
 async def referrals_page(request: Request):
-    async with httpx.AsyncClient() as client:
-        try:
-            resp = await client.get(
-                f"{API_BASE_URL}/referrals/",
-                params={"tg_id": ADMIN_TG_ID},
-                headers={"X-Token": ADMIN_TOKEN}
-            )
-            referrals = resp.json() if resp.status_code == 200 else []
-        except Exception as e:
-            print(f"[ERROR] referrals: {e}")
-            referrals = []
-    return templates.TemplateResponse(
+    return await stream_template(
         "referrals.html",
         {
             "request": request,
-            "referrals": referrals,
+            "referrals": iter_referrals(),
             "tg_id": ADMIN_TG_ID,
             "token": ADMIN_TOKEN
         }
@@ -48,22 +43,22 @@ async def delete_referral_one(
     """
     Удаляет одну запись о реферале через внешний API.
     """
-    async with httpx.AsyncClient() as client:
-        try:
-            resp = await client.delete(
-                f"{API_BASE_URL}/referrals/one",
-                params={
-                    "referrer_tg_id": referrer_tg_id,
-                    "referred_tg_id": referred_tg_id,
-                    "tg_id": tg_id
-                },
-                headers={"X-Token": ADMIN_TOKEN}
-            )
-            if resp.status_code == 200:
-                return {"success": True}
-            return {"success": False, "detail": resp.text}
-        except Exception as e:
-            return {"success": False, "detail": str(e)}
+    try:
+        resp = await get_client().delete(
+            "/referrals/one",
+            params={
+                "referrer_tg_id": referrer_tg_id,
+                "referred_tg_id": referred_tg_id,
+                "tg_id": tg_id
+            }
+        )
+        if resp.status_code == 200:
+            await mirror.delete("referrals", referrer_tg_id=referrer_tg_id, referred_tg_id=referred_tg_id)
+            invalidate("/referrals/")
+            return {"success": True}
+        return {"success": False, "detail": resp.text}
+    except Exception as e:
+        return {"success": False, "detail": str(e)}
 
 
 @app.get("/")
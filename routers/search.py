@@ -0,0 +1,31 @@
+from fastapi import APIRouter, Query
+from app.core import search
+from app.core.fastjson import FastJSONResponse
+from app.core.routing import PanelRoute
+import asyncio
+import time
+
+router = APIRouter(route_class=PanelRoute)
+
+
+@router.get("/search")
+async def search_all(
+    q: str = Query(""),
+    collections: str = Query(",".join(search.INDEXES)),
+    limit: int = Query(search.SEARCH_LIMIT_DEFAULT, ge=1, le=100),
+):
+    """
+    Поиск подстрокой по пользователям (tg_id, имя, username), ключам (email, UUID, tg_id)
+    и платежам (id, tg_id, сумма, система, статус) через триграммные индексы в памяти.
+    Ответ: {"users": [...], "keys": [...], "payments": [...], "took_ms"}; лучшие совпадения первыми.
+    """
+    needle = q.strip().lower()
+    names = [name for name in collections.split(",") if name in search.INDEXES]
+    started = time.perf_counter()
+    if not needle:
+        return FastJSONResponse(content={**{name: [] for name in names}, "took_ms": 0.0})
+
+    results = await asyncio.gather(*(search.search(name, needle, limit) for name in names))
+    content = {name: result or [] for name, result in zip(names, results)}
+    content["took_ms"] = round((time.perf_counter() - started) * 1000, 2)
+    return FastJSONResponse(content=content)
@@ -1,107 +1,111 @@
-from fastapi import APIRouter, Request, Body
+from fastapi import APIRouter, Request, Body, Query
 from fastapi.responses import HTMLResponse, JSONResponse
-from fastapi.templating import Jinja2Templates
-import httpx, os
+from app.core import mirror
+from app.core.fastjson import FastJSONResponse
+from app.core.records import Server
+from app.core.routing import PanelRoute
+from app.core.templating import templates
+from app.core.upstream import ADMIN_TG_ID, ADMIN_TOKEN, get_client, invalidate
+from app.core.utilization import utilization
+import httpx
 
-router = APIRouter()
-templates = Jinja2Templates(directory="app/views")
-
-API_BASE_URL = os.getenv("API_BASE_URL", "http://localhost:3003/api")
-ADMIN_TG_ID   = os.getenv("ADMIN_TG_ID", "0")
-ADMIN_TOKEN   = os.getenv("ADMIN_TOKEN", "your_admin_token")
+router = APIRouter(route_class=PanelRoute)
 
 
 @router.get("/servers", response_class=HTMLResponse)
 async def servers_page(request: Request):
-    async with httpx.AsyncClient() as client:
-        try:
-            r1 = await client.get(
-                f"{API_BASE_URL}/servers/",
-                params={"tg_id": ADMIN_TG_ID},
-                headers={"X-Token": ADMIN_TOKEN},
-                timeout=10
-            )
-            r1.raise_for_status()
-            servers = r1.json()
-        except Exception as e:
-            print(f"[ERROR] GET /servers: {e}")
-            servers = []
-
-        try:
-            r2 = await client.get(
-                f"{API_BASE_URL}/tariffs/",
-                params={"tg_id": ADMIN_TG_ID},
-                headers={"X-Token": ADMIN_TOKEN},
-                timeout=10
-            )
-            r2.raise_for_status()
-            tariffs = r2.json()
-            group_codes = sorted({t.get("group_code") or "" for t in tariffs})
-        except Exception as e:
-            print(f"[ERROR] GET /tariffs: {e}")
-            group_codes = []
+    try:
+        servers = await mirror.load("/servers/")
+    except Exception as e:
+        print(f"[ERROR] GET /servers: {e}")
+        servers = []
+
+    try:
+        tariffs = await mirror.load("/tariffs/")
+        group_codes = sorted({t.get("group_code") or "" for t in tariffs})
+    except Exception as e:
+        print(f"[ERROR] GET /tariffs: {e}")
+        group_codes = []
+
+    usage = await utilization.get()
 
     return templates.TemplateResponse("servers.html", {
         "request":       request,
-        "servers":       servers,
+        "servers":       Server.from_list(servers),
         "total_servers": len(servers),
         "group_codes":   group_codes,
+        "usage":         usage.by_name if usage else {},
         "token":         ADMIN_TOKEN,
         "tg_id":         ADMIN_TG_ID,
     })
 
 
+async def capacity_data() -> dict:
+    """Загрузка серверов и групп из снимка app.core.utilization."""
+    usage = await utilization.get()
+    if usage is None:
+        return {"servers": [], "groups": [], "least_loaded": {}, "unassigned": 0, "updated_at": None}
+    return usage.to_dict()
+
+
+@router.get("/servers/capacity", response_class=HTMLResponse)
+async def servers_capacity_page(request: Request):
+    return templates.TemplateResponse("servers_capacity.html", {
+        "request": request,
+        "data":    await capacity_data(),
+    })
+
+
+@router.get("/servers/capacity/data")
+async def servers_capacity_data():
+    return FastJSONResponse(content=await capacity_data())
+
+
+@router.get("/servers/least_loaded")
+async def least_loaded_server(group: str = Query("")):
+    """Включённый сервер группы тарифов с наименьшей загрузкой: {"group", "server"}; server — null, если мест нет."""
+    usage = await utilization.get()
+    return JSONResponse(content={"group": group, "server": usage.least_loaded(group) if usage else None})
+
+
 @router.post("/servers")
 async def create_server(data: dict = Body(...)):
-    async with httpx.AsyncClient() as client:
-        try:
-            resp = await client.post(
-                f"{API_BASE_URL}/servers/",
-                headers={"X-Token": ADMIN_TOKEN},
-                params={"tg_id": ADMIN_TG_ID},
-                json=data,
-                timeout=10
-            )
-            resp.raise_for_status()
-            return JSONResponse(status_code=200, content=resp.json())
-        except httpx.HTTPStatusError as e:
-            return JSONResponse(status_code=e.response.status_code, content={"error": e.response.text})
-        except Exception as e:
-            return JSONResponse(status_code=500, content={"error": str(e)})
+    try:
+        resp = await get_client().post("/servers/", json=data)
+        resp.raise_for_status()
+        created = resp.json()
+        await mirror.upsert("servers", created)
+        invalidate("/servers/")
+        return JSONResponse(status_code=200, content=created)
+    except httpx.HTTPStatusError as e:
+        return JSONResponse(status_code=e.response.status_code, content={"error": e.response.text})
+    except Exception as e:
+        return JSONResponse(status_code=500, content={"error": str(e)})
 
 
 @router.patch("/servers/{server_name}")
 async def patch_server(server_name: str, data: dict = Body(...)):
-    async with httpx.AsyncClient() as client:
-        try:
-            resp = await client.patch(
-                f"{API_BASE_URL}/servers/{server_name}",
-                headers={"X-Token": ADMIN_TOKEN},
-                params={"tg_id": ADMIN_TG_ID},
-                json=data,
-                timeout=10
-            )
-            resp.raise_for_status()
-            return JSONResponse(status_code=200, content=resp.json())
-        except httpx.HTTPStatusError as e:
-            return JSONResponse(status_code=e.response.status_code, content={"error": e.response.text})
-        except Exception as e:
-            return JSONResponse(status_code=500, content={"error": str(e)})
+    try:
+        resp = await get_client().patch(f"/servers/{server_name}", json=data)
+        resp.raise_for_status()
+        await mirror.patch("servers", data, server_name=server_name)
+        invalidate("/servers/")
+        return JSONResponse(status_code=200, content=resp.json())
+    except httpx.HTTPStatusError as e:
+        return JSONResponse(status_code=e.response.status_code, content={"error": e.response.text})
+    except Exception as e:
+        return JSONResponse(status_code=500, content={"error": str(e)})
 
 
 @router.delete("/servers/{server_name}")
 async def delete_server(server_name: str):
-    async with httpx.AsyncClient() as client:
-        try:
-            resp = await client.delete(
-                f"{API_BASE_URL}/servers/{server_name}",
-                headers={"X-Token": ADMIN_TOKEN},
-                params={"tg_id": ADMIN_TG_ID},
-                timeout=10
-            )
-            resp.raise_for_status()
-            return JSONResponse(status_code=200, content={"status": "deleted"})
-        except httpx.HTTPStatusError as e:
-            return JSONResponse(status_code=e.response.status_code, content={"error": e.response.text})
-        except Exception as e:
-            return JSONResponse(status_code=500, content={"error": str(e)})
\ No newline at end of file
+    try:
+        resp = await get_client().delete(f"/servers/{server_name}")
+        resp.raise_for_status()
+        await mirror.delete("servers", server_name=server_name)
+        invalidate("/servers/")
+        return JSONResponse(status_code=200, content={"status": "deleted"})
+    except httpx.HTTPStatusError as e:
+        return JSONResponse(status_code=e.response.status_code, content={"error": e.response.text})
+    except Exception as e:
+        return JSONResponse(status_code=500, content={"error": str(e)})
@@ -1,144 +1,115 @@
-from fastapi import APIRouter, Request
+from fastapi import APIRouter, Request, Depends, Query
 from fastapi.responses import HTMLResponse, JSONResponse
-from fastapi.templating import Jinja2Templates
-import httpx
-import os
+from app.core import expiry, mirror, search
+from app.core.export import export_response
+from app.core.fastjson import FastJSONResponse
+from app.core.listing import ListParams, paginate
+from app.core.records import Gift, Key, Payment, Referral, User
+from app.core.routing import PanelRoute
+from app.core.templating import defer, stream_template, templates
+from app.core.upstream import API_BASE_URL, ADMIN_TG_ID, ADMIN_TOKEN, fetch_many, get_client, get_json, invalidate
 
-router = APIRouter()
-templates = Jinja2Templates(directory="app/views")
+router = APIRouter(route_class=PanelRoute)
 
-API_BASE_URL = os.getenv("API_BASE_URL", "http://localhost:3003/api")
-ADMIN_TG_ID = os.getenv("ADMIN_TG_ID", "0")
-ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "your_admin_token")
 
+USER_SEARCH_FIELDS = ("tg_id", "first_name", "username")
+USER_SORT_FIELDS = ("tg_id", "first_name", "username", "balance", "trial", "created_at")
 
-def format_dt(dt):
-    if not dt:
-        return None
-    if isinstance(dt, str):
-        return dt
-    return dt.strftime("%d.%m.%Y %H:%M")
+
+async def load_users():
+    try:
+        return await get_json("/users/")
+    except Exception as e:
+        print(f"[ERROR] Не удалось получить пользователей: {e}")
+        return []
+
+
+async def users_page_data(params: ListParams):
+    """
+    Страница пользователей и их общее число: из зеркала, если оно готово; поиск без зеркала —
+    по индексу app.core.search; иначе из /users/.
+    """
+    page = await mirror.page("users", params, USER_SORT_FIELDS, record=User)
+    if page is not None:
+        return page, await mirror.count("users")
+    if params.q:
+        found, total = await search.matches("users", params.q)
+        if found is not None:
+            return paginate(found, params, (), USER_SORT_FIELDS, record=User), total
+    users = await load_users()
+    return paginate(users, params, USER_SEARCH_FIELDS, USER_SORT_FIELDS, record=User), len(users)
 
 
 @router.get("/users", response_class=HTMLResponse)
-async def users_page(request: Request):
-    users = []
-
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.get(
-                f"{API_BASE_URL}/users/",
-                params={"tg_id": ADMIN_TG_ID},
-                headers={"X-Token": ADMIN_TOKEN},
-                timeout=10
-            )
-            response.raise_for_status()
-            users = response.json()
-        except Exception as e:
-            print(f"[ERROR] Не удалось получить пользователей: {e}")
-
-    return templates.TemplateResponse("users.html", {
+async def users_page(request: Request, params: ListParams = Depends()):
+    page, total = defer(users_page_data(params), 2)
+
+    return await stream_template("users.html", {
         "request": request,
-        "users": users,
-        "total_users": len(users),
+        "page": page,
+        "total_users": total,
         "token": ADMIN_TOKEN,
         "api_base_url": API_BASE_URL,
         "admin_tg_id": ADMIN_TG_ID,
     })
 
 
+@router.get("/users/rows")
+async def users_rows(params: ListParams = Depends()):
+    page, _ = await users_page_data(params)
+    return FastJSONResponse(content=page)
+
+
+@router.get("/users/export")
+async def users_export(
+    format: str = Query("csv"),
+    fields: str | None = Query(None),
+    date_from: str | None = Query(None, alias="from"),
+    date_to: str | None = Query(None, alias="to"),
+):
+    """Полная выгрузка пользователей в CSV/NDJSON потоком: ?format=csv|ndjson&fields=...&from=2025-01-01&to=2025-01-31."""
+    return export_response("users", mirror.stream("/users/", cache=False), format, fields, date_from, date_to,
+                           default_fields=User.field_names())
+
+
+async def load_user_detail(tg_id: int) -> dict:
+    """
+    Карточка пользователя из зеркала (выборки по индексу tg_id). Пока зеркало не готово
+    или пользователя в нём ещё нет — из upstream.
+    """
+    users = await mirror.rows("users", tg_id=tg_id)
+    local = {
+        "user": users[0] if users else None,
+        "payments": await mirror.rows("payments", tg_id=tg_id),
+        "subscriptions": await mirror.rows("keys", tg_id=tg_id),
+        # Как /gifts/by_tg_id и /referrals/all: и отправленные/полученные подарки, и обе стороны реферала.
+        "gifts": await mirror.rows_any("gifts", sender_tg_id=tg_id, recipient_tg_id=tg_id),
+        "referrals": await mirror.rows_any("referrals", referrer_tg_id=tg_id, referred_tg_id=tg_id),
+    }
+    if None not in local.values():
+        return local
+    return await fetch_many({
+        "user": f"/users/{tg_id}",
+        "payments": f"/payments/by_tg_id/{tg_id}",
+        "subscriptions": f"/keys/all/{tg_id}",
+        "gifts": f"/gifts/by_tg_id/{tg_id}",
+        "referrals": f"/referrals/all/{tg_id}",
+    }, defaults={"user": None})
+
+
 @router.get("/users/{tg_id}", response_class=HTMLResponse)
 async def user_detail_page(request: Request, tg_id: int):
-    user = None
-    payments = []
-    subscriptions = []
-
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.get(
-                f"{API_BASE_URL}/users/{tg_id}",
-                params={"tg_id": ADMIN_TG_ID},
-                headers={"X-Token": ADMIN_TOKEN},
-                timeout=10
-            )
-            response.raise_for_status()
-            user = response.json()
-            user['created_at'] = format_dt(user.get('created_at'))
-            user['last_active'] = format_dt(user.get('updated_at'))
-        except Exception as e:
-            print(f"[ERROR] Не удалось получить пользователя {tg_id}: {e}")
-
-        try:
-            payments_response = await client.get(
-                f"{API_BASE_URL}/payments/by_tg_id/{tg_id}",
-                params={"tg_id": ADMIN_TG_ID},
-                headers={
-                    "X-Token": ADMIN_TOKEN
-                },
-                timeout=10
-            )
-            payments_response.raise_for_status()
-            payments = payments_response.json() or []
-        except Exception as e:
-            print(f"[ERROR] Не удалось получить платежи пользователя {tg_id}: {e}")
-
-        try:
-            subs_response = await client.get(
-                f"{API_BASE_URL}/keys/all/{tg_id}",
-                params={"tg_id": ADMIN_TG_ID},
-                headers={
-                    "X-Token": ADMIN_TOKEN
-                },
-                timeout=10
-            )
-            subs_response.raise_for_status()
-            subs_data = subs_response.json()
-            subscriptions = subs_data if subs_data else []
-        except Exception as e:
-            print(f"[ERROR] Не удалось получить подписки пользователя {tg_id}: {e}")
-
-        gifts = []
-        try:
-            gifts_response = await client.get(
-                f"{API_BASE_URL}/gifts/by_tg_id/{tg_id}",
-                params={"tg_id": ADMIN_TG_ID},
-                headers={
-                    "X-Token": ADMIN_TOKEN
-                },
-                timeout=10
-            )
-            gifts_response.raise_for_status()
-            gifts_data = gifts_response.json()
-            gifts = gifts_data if gifts_data else []
-        except Exception as e:
-            print(f"[ERROR] Не удалось получить подарки пользователя {tg_id}: {e}")
-
-        referrals = []
-        try:
-            referrals_response = await client.get(
-                f"{API_BASE_URL}/referrals/all/{tg_id}",
-                params={"tg_id": ADMIN_TG_ID},
-                headers={
-                    "X-Token": ADMIN_TOKEN
-                },
-                timeout=10
-            )
-            referrals_response.raise_for_status()
-            referrals_data = referrals_response.json()
-            referrals = referrals_data if referrals_data else []
-        except Exception as e:
-            print(f"[ERROR] Не удалось получить рефералов пользователя {tg_id}: {e}")
-
-    if not user:
+    data = await load_user_detail(tg_id)
+    if not data["user"]:
         return HTMLResponse(content="Пользователь не найден", status_code=404)
 
     return templates.TemplateResponse("user_detail.html", {
         "request": request,
-        "user": user,
-        "payments": payments,
-        "subscriptions": subscriptions,
-        "referrals": referrals,
-        "gifts": gifts,
+        "user": User.from_dict(data["user"]),
+        "payments": Payment.from_list(data["payments"]),
+        "subscriptions": Key.from_list(data["subscriptions"]),
+        "referrals": Referral.from_list(data["referrals"]),
+        "gifts": Gift.from_list(data["gifts"]),
         "token": ADMIN_TOKEN,
         "api_base_url": API_BASE_URL,
         "admin_tg_id": ADMIN_TG_ID,
@@ -149,17 +120,11 @@ async def user_detail_page(request: Request, tg_id: int):
 async def patch_user(tg_id: int, request: Request):
     try:
         payload = await request.json()
-        async with httpx.AsyncClient() as client:
-            response = await client.patch(
-                f"{API_BASE_URL}/users/{tg_id}",
-                params={"tg_id": ADMIN_TG_ID},
-                headers={
-                    "X-Token": ADMIN_TOKEN,
-                    "Content-Type": "application/json"
-                },
-                json=payload
-            )
+        response = await get_client().patch(f"/users/{tg_id}", json=payload)
         response.raise_for_status()
+        await mirror.patch("users", payload, tg_id=tg_id)
+        search.patch("users", tg_id, payload)
+        invalidate("/users/")
         return JSONResponse(content={"success": True})
     except Exception as e:
         print(f"[ERROR] Ошибка при обновлении пользователя {tg_id}: {e}")
@@ -169,13 +134,18 @@ async def patch_user(tg_id: int, request: Request):
 @router.delete("/users/{tg_id}")
 async def delete_user(tg_id: int):
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.delete(
-                f"{API_BASE_URL}/users/{tg_id}",
-                params={"tg_id": ADMIN_TG_ID},
-                headers={"X-Token": ADMIN_TOKEN}
-            )
+        response = await get_client().delete(f"/users/{tg_id}")
         response.raise_for_status()
+        await mirror.delete("users", tg_id=tg_id)
+        await mirror.delete("keys", tg_id=tg_id)
+        await mirror.delete("payments", tg_id=tg_id)
+        await mirror.delete("gifts", sender_tg_id=tg_id)
+        await mirror.delete("referrals", referrer_tg_id=tg_id)
+        search.delete("users", tg_id)
+        search.delete_where("keys", "tg_id", tg_id)
+        expiry.delete_where("tg_id", tg_id)
+        search.delete_where("payments", "tg_id", tg_id)
+        invalidate("/users/", "/keys/", "/payments/", "/gifts/", "/referrals/")
         return JSONResponse(content={"success": True})
     except Exception as e:
         print(f"[ERROR] Ошибка при удалении пользователя {tg_id}: {e}")
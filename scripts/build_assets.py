@@ -0,0 +1,207 @@
+"""
+Сборка статики: бандлы CSS/JS из app.core.assets.BUNDLES, минификация, имена с хэшем
+содержимого, предсжатые .gz/.br и static/dist/manifest.json для шаблонов.
+
+    python scripts/build_assets.py [--fontawesome PATH]
+
+--fontawesome — распакованный пакет @fortawesome/fontawesome-free (css/all.min.css, webfonts/):
+в сборку попадут только иконки, которые встречаются в шаблонах и скриптах, и шрифты к ним.
+Без него иконки по-прежнему грузятся с CDN.
+
+Необязательные пакеты: rcssmin/rjsmin (минификация лучше встроенной), brotli (.br),
+fonttools (урезание шрифтов иконок до используемых глифов).
+"""
+from pathlib import Path
+import argparse
+import gzip
+import hashlib
+import importlib.util
+import io
+import json
+import re
+import shutil
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def _load_assets_module():
+    # Каталог проекта в деплое называется app/, но скрипт должен работать из любого клона.
+    spec = importlib.util.spec_from_file_location("assets", ROOT / "core" / "assets.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+assets = _load_assets_module()
+BUNDLES = assets.BUNDLES
+DIST_DIR = assets.DIST_DIR
+
+STATIC = ROOT / "static"
+DIST = STATIC / DIST_DIR
+SCAN_GLOBS = ("views/*.html", "static/js/*.js")
+# Иконки, имена которых собираются в JS динамически (см. showToast в app.js).
+EXTRA_ICONS = {"check", "times", "exclamation-triangle", "info-circle"}
+COMPRESSIBLE = {".css", ".js", ".svg", ".json", ".ttf"}
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import rcssmin
+except ImportError:
+    rcssmin = None
+
+try:
+    import rjsmin
+except ImportError:
+    rjsmin = None
+
+
+def minify_css(text: str) -> str:
+    if rcssmin is not None:
+        return rcssmin.cssmin(text)
+    text = re.sub(r"/\*.*?\*/", "", text, flags=re.S)
+    lines = (line.strip() for line in text.splitlines())
+    return "\n".join(line for line in lines if line)
+
+
+def minify_js(text: str) -> str:
+    # Без rjsmin JS не трогаем: надёжно сжать его регулярками нельзя, а gzip/brotli всё равно помогут.
+    if rjsmin is not None:
+        return rjsmin.jsmin(text)
+    return text
+
+
+def minify(name: str, text: str) -> str:
+    return minify_css(text) if name.endswith(".css") else minify_js(text)
+
+
+def write_asset(name: str, data: bytes, manifest: dict):
+    """Пишет dist/<stem>.<hash><ext> и его сжатые варианты, добавляет запись в манифест."""
+    path = Path(name)
+    digest = hashlib.sha256(data).hexdigest()[:10]
+    built = DIST / path.parent / f"{path.stem}.{digest}{path.suffix}"
+    built.parent.mkdir(parents=True, exist_ok=True)
+    built.write_bytes(data)
+    if path.suffix in COMPRESSIBLE:
+        built.with_name(built.name + ".gz").write_bytes(gzip.compress(data, 9, mtime=0))
+        if brotli is not None:
+            built.with_name(built.name + ".br").write_bytes(brotli.compress(data, quality=11))
+    manifest[name] = built.relative_to(STATIC).as_posix()
+    return built
+
+
+def used_icons() -> set:
+    icons = set(EXTRA_ICONS)
+    for pattern in SCAN_GLOBS:
+        for path in ROOT.glob(pattern):
+            icons.update(re.findall(r"\bfa-([a-z0-9]+(?:-[a-z0-9]+)*)", path.read_text(encoding="utf-8")))
+    return icons
+
+
+def top_level_rules(css: str):
+    """Разбивает CSS на блоки верхнего уровня: (prelude, body) — вложенные @media/@keyframes целиком."""
+    depth = 0
+    start = 0
+    for i, char in enumerate(css):
+        if char == "{":
+            if depth == 0:
+                prelude_end = i
+            depth += 1
+        elif char == "}":
+            depth -= 1
+            if depth == 0:
+                yield css[start:prelude_end].strip(), css[prelude_end + 1:i]
+                start = i + 1
+
+
+ICON_SELECTOR = re.compile(r"\.fa-([a-z0-9-]+)::?before")
+
+
+def subset_icons_css(css: str, icons: set):
+    """Оставляет правила иконок только для icons; возвращает CSS и набор кодовых точек."""
+    out = []
+    codepoints = set()
+    for prelude, body in top_level_rules(css):
+        selectors = [s.strip() for s in prelude.split(",")]
+        matches = [ICON_SELECTOR.fullmatch(s) for s in selectors]
+        if selectors and all(matches):
+            kept = [s for s, m in zip(selectors, matches) if m.group(1) in icons]
+            if not kept:
+                continue
+            prelude = ",".join(kept)
+            content = re.search(r'content:\s*"\\([0-9a-f]+)', body)
+            if content:
+                codepoints.add(int(content.group(1), 16))
+        out.append(f"{prelude}{{{body}}}")
+    return "".join(out), codepoints
+
+
+def subset_font(source: Path, codepoints: set) -> bytes:
+    """Шрифт только с нужными глифами; без fonttools (или brotli для woff2) — исходный файл."""
+    try:
+        from fontTools import subset
+    except ImportError:
+        return source.read_bytes()
+    if source.suffix == ".woff2" and brotli is None:
+        return source.read_bytes()
+    options = subset.Options()
+    options.flavor = "woff2" if source.suffix == ".woff2" else None
+    font = subset.load_font(str(source), options)
+    subsetter = subset.Subsetter(options)
+    subsetter.populate(unicodes=codepoints)
+    subsetter.subset(font)
+    out = io.BytesIO()
+    subset.save_font(font, out, options)
+    return out.getvalue()
+
+
+def build_icons(fontawesome: Path, manifest: dict):
+    css = (fontawesome / "css" / "all.min.css").read_text(encoding="utf-8")
+    css, codepoints = subset_icons_css(css, used_icons())
+    fonts = {}
+    for font_ref in sorted(set(re.findall(r"url\(\.\./webfonts/([^)]+)\)", css))):
+        built = write_asset(f"webfonts/{font_ref}", subset_font(fontawesome / "webfonts" / font_ref, codepoints), manifest)
+        # icons.css лежит в dist/css/, шрифты — в dist/webfonts/.
+        fonts[font_ref] = f"../{built.relative_to(DIST).as_posix()}"
+    css = re.sub(r"url\(\.\./webfonts/([^)]+)\)", lambda m: f"url({fonts[m.group(1)]})", css)
+    write_asset("css/icons.css", css.encode("utf-8"), manifest)
+    print(f"icons: {len(codepoints)} glyphs, fonts: {', '.join(fonts) or '-'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--fontawesome", type=Path, help="каталог пакета fontawesome-free")
+    args = parser.parse_args()
+
+    if DIST.exists():
+        shutil.rmtree(DIST)
+    DIST.mkdir(parents=True)
+    manifest = {}
+
+    bundled = set()
+    for name, sources in BUNDLES.items():
+        separator = "\n" if name.endswith(".css") else ";\n"
+        parts = [minify(source, (STATIC / source).read_text(encoding="utf-8")) for source in sources]
+        write_asset(name, separator.join(parts).encode("utf-8"), manifest)
+        bundled.update(sources)
+
+    for path in sorted([*STATIC.glob("css/*.css"), *STATIC.glob("js/*.js")]):
+        name = path.relative_to(STATIC).as_posix()
+        if name not in bundled:
+            write_asset(name, minify(name, path.read_text(encoding="utf-8")).encode("utf-8"), manifest)
+
+    if args.fontawesome:
+        build_icons(args.fontawesome, manifest)
+
+    (DIST / "manifest.json").write_text(json.dumps(manifest, indent=2, sort_keys=True), encoding="utf-8")
+    for name, built in sorted(manifest.items()):
+        print(f"{name} -> {built}")
+    if brotli is None:
+        print("[WARN] brotli не установлен — собраны только .gz")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+// Server-side paginated tables: rows are requested page by page from a JSON endpoint
+// ({items, total, page, limit, pages}) instead of rendering the whole list into the page.
+(function() {
+    const HTML_ESCAPES = { '&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;' };
+
+    function escapeHtml(value) {
+        if (value === null || value === undefined) return '';
+        return String(value).replace(/[&<>"']/g, ch => HTML_ESCAPES[ch]);
+    }
+
+    function rowFromHtml(html) {
+        const tr = document.createElement('tr');
+        tr.innerHTML = html;
+        return tr;
+    }
+
+    class PagedTable {
+        // params: optional function returning extra query parameters (page-level filters).
+        constructor({ url, table, renderRow, searchInput = null, pager = null, initial = null, params = null }) {
+            this.url = url;
+            this.extraParams = params;
+            this.table = table;
+            this.tbody = table.querySelector('tbody');
+            this.renderRow = renderRow;
+            this.pager = pager;
+            this.state = { page: 1, limit: initial ? initial.limit : 50, sort: null, order: 'asc', q: '' };
+            this.requestId = 0;
+
+            if (searchInput) {
+                let timer = null;
+                searchInput.addEventListener('input', () => {
+                    clearTimeout(timer);
+                    timer = setTimeout(() => {
+                        this.state.q = searchInput.value.trim();
+                        this.state.page = 1;
+                        this.load();
+                    }, 300);
+                });
+            }
+
+            table.querySelectorAll('th[data-sort]').forEach(th => {
+                th.classList.add('sortable-header');
+                th.addEventListener('click', () => {
+                    const field = th.dataset.sort;
+                    this.state.order = this.state.sort === field && this.state.order === 'asc' ? 'desc' : 'asc';
+                    this.state.sort = field;
+                    this.state.page = 1;
+                    this.load();
+                });
+            });
+
+            if (initial) this.render(initial);
+            else this.load();
+        }
+
+        async load() {
+            const requestId = ++this.requestId;
+            const params = new URLSearchParams({
+                page: this.state.page,
+                limit: this.state.limit,
+                order: this.state.order
+            });
+            if (this.state.sort) params.set('sort', this.state.sort);
+            if (this.state.q) params.set('q', this.state.q);
+            if (this.extraParams) {
+                Object.entries(this.extraParams()).forEach(([key, value]) => params.set(key, value));
+            }
+
+            try {
+                const res = await fetch(`${this.url}?${params}`);
+                if (!res.ok) throw new Error(res.statusText);
+                const data = await res.json();
+                if (requestId === this.requestId) this.render(data);
+            } catch (e) {
+                showToast('Не удалось загрузить данные', 'error');
+            }
+        }
+
+        reload() {
+            return this.load();
+        }
+
+        render(data) {
+            this.state.page = data.page;
+            const fragment = document.createDocumentFragment();
+            data.items.forEach(item => fragment.appendChild(this.renderRow(item)));
+            this.tbody.replaceChildren(fragment);
+
+            this.table.querySelectorAll('th[data-sort]').forEach(th => {
+                const active = th.dataset.sort === this.state.sort;
+                th.classList.toggle('sort-asc', active && this.state.order === 'asc');
+                th.classList.toggle('sort-desc', active && this.state.order === 'desc');
+            });
+            this.renderPager(data);
+        }
+
+        renderPager(data) {
+            if (!this.pager) return;
+            this.pager.innerHTML = `
+                <button type="button" class="pagination-btn" data-page="${data.page - 1}" ${data.page <= 1 ? 'disabled' : ''}>‹</button>
+                <span class="pagination-info">${data.page} / ${data.pages} · ${data.total}</span>
+                <button type="button" class="pagination-btn" data-page="${data.page + 1}" ${data.page >= data.pages ? 'disabled' : ''}>›</button>
+            `;
+            this.pager.querySelectorAll('button[data-page]').forEach(btn => {
+                btn.addEventListener('click', () => {
+                    this.state.page = Number(btn.dataset.page);
+                    this.load();
+                });
+            });
+        }
+    }
+
+    window.PagedTable = PagedTable;
+    window.escapeHtml = escapeHtml;
+    window.rowFromHtml = rowFromHtml;
+})();
@@ -0,0 +1,14 @@
+from pathlib import Path
+import os
+import sys
+import types
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Репозиторий подключается в основное приложение каталогом app/ — в тестах корень репозитория
+# и есть пакет app, чтобы работали импорты вида from app.core.x import ...
+if "app" not in sys.modules:
+    package = types.ModuleType("app")
+    package.__path__ = [str(ROOT)]
+    sys.modules["app"] = package
+os.environ.setdefault("API_BASE_URL", "http://upstream.test/api")
@@ -0,0 +1,56 @@
+from app.core import cache
+from app.core.cache import MISSING, TTLCache
+import pytest
+import types
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache, "time", types.SimpleNamespace(monotonic=lambda: now[0]))
+    return now
+
+
+def test_expired_entry_is_missing_but_stale_readable(clock):
+    entries = TTLCache(10, ttl=5)
+    key = TTLCache.key("/users/", {"page": 1})
+    entries.set(key, ["fresh"])
+    clock[0] += 4
+    assert entries.get(key) == ["fresh"]
+    clock[0] += 2
+    assert entries.get(key) is MISSING
+    assert entries.get_stale(key) == ["fresh"]
+    assert entries.get_stale(TTLCache.key("/keys/")) is MISSING
+
+
+def test_per_entry_ttl(clock):
+    entries = TTLCache(10, ttl=60)
+    entries.set("short", 1, ttl=1)
+    entries.set("long", 2)
+    clock[0] += 2
+    assert entries.get("short") is MISSING
+    assert entries.get("long") == 2
+
+
+def test_lru_eviction_keeps_recently_read(clock):
+    entries = TTLCache(2, ttl=60)
+    entries.set("a", 1)
+    entries.set("b", 2)
+    entries.get("a")
+    entries.set("c", 3)
+    assert entries.get_stale("b") is MISSING
+    assert (entries.get("a"), entries.get("c")) == (1, 3)
+
+
+def test_invalidate_by_path_prefix(clock):
+    entries = TTLCache(10, ttl=60)
+    for path in ("/keys/", "/keys/all/1", "/users/"):
+        entries.set(TTLCache.key(path), path)
+    entries.invalidate("/keys/")
+    assert len(entries) == 1
+    assert entries.get_stale(TTLCache.key("/keys/all/1")) is MISSING
+    assert entries.get(TTLCache.key("/users/")) == "/users/"
+
+
+def test_params_order_does_not_change_key():
+    assert TTLCache.key("/users/", {"a": 1, "b": 2}) == TTLCache.key("/users/", {"b": 2, "a": 1})
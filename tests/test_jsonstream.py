@@ -0,0 +1,62 @@
+from app.core.jsonstream import iter_json_array
+import asyncio
+import json
+import pytest
+
+ITEMS = [
+    {"name": "Ёжик \"в\" тумане", "path": "C:\\temp\\]", "emoji": "😀", "list": [1, [2, 3]]},
+    "строка, с запятой ] и скобкой",
+    "\u00e9\\u00e9",
+    1.5e3,
+    -0.25,
+    12345,
+    True,
+    None,
+    [],
+    {},
+]
+
+
+async def _chunks(parts):
+    for part in parts:
+        yield part
+
+
+def _parse(parts) -> list:
+    async def collect():
+        return [item async for item in iter_json_array(_chunks(parts))]
+
+    return asyncio.run(collect())
+
+
+def test_every_chunk_boundary_gives_the_same_items():
+    body = json.dumps(ITEMS, ensure_ascii=False).encode("utf-8")
+    for cut in range(1, len(body)):
+        assert _parse([body[:cut], body[cut:]]) == ITEMS, cut
+
+
+def test_byte_by_byte_with_ascii_escapes():
+    body = json.dumps(ITEMS).encode("utf-8")  # \uXXXX, суррогатные пары
+    assert _parse([body[i:i + 1] for i in range(len(body))]) == ITEMS
+
+
+def test_scalar_cut_at_chunk_end_waits_for_the_rest():
+    assert _parse([b"[1.5", b"e3, 10", b"0]"]) == [1500.0, 100]
+    assert _parse([b'[tr', b'ue, "a', b'b"]']) == [True, "ab"]
+
+
+def test_whitespace_and_empty_array():
+    assert _parse([b"  \n[ ", b" ]  "]) == []
+    assert _parse([b"[", b"", b" 1 ,\n 2 ]"]) == [1, 2]
+
+
+def test_not_an_array():
+    with pytest.raises(ValueError):
+        _parse([b'{"a": 1}'])
+
+
+def test_truncated_array():
+    with pytest.raises(ValueError):
+        _parse([b'[{"a": 1}, {"b":'])
+    with pytest.raises(ValueError):
+        _parse([b"[1, 2"])
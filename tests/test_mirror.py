@@ -0,0 +1,121 @@
+from app.core import mirror, upstream
+import asyncio
+import httpx
+import json
+import pytest
+import threading
+
+KEYS = mirror.TABLES["keys"]
+
+
+def _key(email: str, **fields) -> dict:
+    return {"email": email, "tg_id": 1, "client_id": f"uuid-{email}", "expiry_time": 0, **fields}
+
+
+class GatedStream(httpx.AsyncByteStream):
+    """Тело ответа по кускам; перед каждым следующим куском ждёт открытия ворот."""
+
+    def __init__(self, chunks: list, gates: list):
+        self.chunks = chunks
+        self.gates = gates
+
+    async def __aiter__(self):
+        for i, chunk in enumerate(self.chunks):
+            if i and self.gates:
+                await self.gates[i - 1].wait()
+            yield chunk
+
+
+@pytest.fixture
+def upstream_keys(tmp_path, monkeypatch):
+    """Зеркало во временном файле; ответ /keys/ задаётся списком кусков тела."""
+    monkeypatch.setattr(mirror, "MIRROR_PATH", str(tmp_path / "mirror.db"))
+    monkeypatch.setattr(mirror, "MIRROR_SINCE_PARAM", "")
+    monkeypatch.setattr(mirror, "MIRROR_BATCH", 1)
+    monkeypatch.setattr(mirror, "_local", threading.local())
+    monkeypatch.setattr(mirror, "_ready", set())
+    monkeypatch.setattr(mirror, "_sync_locks", {})
+    response = {"chunks": [b"[]"], "gates": []}
+
+    def handler(request):
+        return httpx.Response(200, stream=GatedStream(response["chunks"], response["gates"]))
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler), base_url="http://upstream.test/api")
+    monkeypatch.setattr(upstream, "get_client", lambda: client)
+    return response
+
+
+def _body(*rows) -> bytes:
+    return json.dumps(list(rows)).encode()
+
+
+async def _generation(pk: str):
+    return await asyncio.to_thread(
+        lambda: mirror._connect().execute("SELECT generation FROM keys WHERE pk = ?", (pk,)).fetchone()[0]
+    )
+
+
+async def _emails() -> list:
+    return sorted(row["email"] for row in await mirror.rows("keys"))
+
+
+def test_full_sync_replaces_table_by_generation(upstream_keys):
+    async def scenario():
+        await asyncio.to_thread(mirror._init_schema)
+        assert await mirror.rows("keys") is None  # до первой полной синхронизации читать нельзя
+
+        upstream_keys["chunks"] = [_body(_key("a"), _key("b"), _key("c"))]
+        assert await mirror.sync_table(KEYS) == (3, 0)
+        assert mirror.ready("keys")
+        assert await _emails() == ["a", "b", "c"]
+
+        upstream_keys["chunks"] = [_body(_key("a"), _key("c", expiry_time=5))]
+        assert await mirror.sync_table(KEYS) == (2, 1)
+        assert await _emails() == ["a", "c"]
+        assert (await mirror.rows("keys", email="c"))[0]["expiry_time"] == 5
+
+    asyncio.run(scenario())
+
+
+def test_writes_during_full_sync_survive_it(upstream_keys):
+    async def scenario():
+        await asyncio.to_thread(mirror._init_schema)
+        upstream_keys["chunks"] = [_body(_key("a"), _key("b"), _key("old"))]
+        await mirror.sync_table(KEYS)
+
+        gate = asyncio.Event()
+        first, rest = _body(_key("a"), _key("b")).split(b"}, {", 1)
+        upstream_keys["chunks"] = [first + b"}, ", b"{" + rest]
+        upstream_keys["gates"] = [gate]
+        sync = asyncio.create_task(mirror.sync_table(KEYS))
+        # Ждём, пока синхронизация перепишет "a" (новое поколение) и остановится на воротах.
+        for _ in range(200):
+            if await _generation("a") == 2:
+                break
+            await asyncio.sleep(0.01)
+        assert await _generation("b") == 1
+
+        # Строка "a" уже переписана этой синхронизацией, "b" — ещё нет.
+        await mirror.patch("keys", {"expiry_time": 7}, email="a")
+        await mirror.patch("keys", {"expiry_time": 8}, email="b")
+        await mirror.upsert("keys", _key("new"))
+        gate.set()
+        assert await sync == (2, 1)
+
+        rows = {row["email"]: row for row in await mirror.rows("keys")}
+        assert sorted(rows) == ["a", "b", "new"]  # "old" удалена, запись через панель — нет
+        assert rows["a"]["expiry_time"] == 7  # правка после строки из upstream сохранилась
+        assert rows["b"]["expiry_time"] == 0  # строка из upstream пришла после правки и новее её
+
+    asyncio.run(scenario())
+
+
+def test_write_through_ignored_until_ready(upstream_keys):
+    async def scenario():
+        await asyncio.to_thread(mirror._init_schema)
+        await mirror.upsert("keys", _key("a"))
+        await mirror.patch("keys", {"expiry_time": 1}, email="a")
+        count = await asyncio.to_thread(mirror._count, KEYS)
+        assert count == 0
+
+    asyncio.run(scenario())
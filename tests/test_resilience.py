@@ -0,0 +1,52 @@
+from pathlib import Path
+import asyncio
+import httpx
+import importlib.util
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def _load_resilience():
+    # Как в scripts/build_assets.py: модуль грузится из файла, без установленного пакета app.
+    spec = importlib.util.spec_from_file_location("resilience", ROOT / "core" / "resilience.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+resilience = _load_resilience()
+
+
+class HangingTransport(httpx.AsyncBaseTransport):
+    """Первый запрос висит (его отменяют), остальные отвечают 200."""
+
+    def __init__(self):
+        self.calls = 0
+
+    async def handle_async_request(self, request):
+        self.calls += 1
+        if self.calls == 1:
+            await asyncio.sleep(3600)
+        return httpx.Response(200, request=request)
+
+
+def test_cancelled_half_open_probe_releases_breaker():
+    async def scenario():
+        breaker = resilience.CircuitBreaker(threshold=1, reset_timeout=0)
+        breaker.failure()
+        assert breaker.state == "half-open"
+
+        transport = resilience.ResilientTransport(
+            HangingTransport(), lambda path: httpx.Timeout(5), breaker,
+            resilience.RetryBudget(0.1, 10), retries=0, backoff=0,
+        )
+        request = httpx.Request("GET", "http://upstream/users/")
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(transport.handle_async_request(request), 0.05)
+
+        response = await transport.handle_async_request(httpx.Request("GET", "http://upstream/users/"))
+        assert response.status_code == 200
+        assert breaker.state == "closed"
+
+    asyncio.run(scenario())
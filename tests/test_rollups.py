@@ -0,0 +1,76 @@
+from app.core import rollups
+from app.core.columns import day_number
+from app.core.rollups import RevenueRollup
+import asyncio
+import pytest
+
+
+def _payment(payment_id: int, amount: float = 100.0, day: str = "2025-03-10", status: str = "success", **fields) -> dict:
+    return {"id": payment_id, "tg_id": 7, "amount": amount, "provider": "kassa",
+            "status": status, "created_at": f"{day}T12:00:00", **fields}
+
+
+def test_fold_adds_only_payments_above_watermark():
+    rollup = RevenueRollup()
+    assert rollup.fold([_payment(1), _payment(3), _payment(2)]) == 3
+    assert rollup.watermark == 3
+    # Повтор и старые id не учитываются второй раз, новые — да.
+    assert rollup.fold([_payment(2), _payment(3), _payment(4, amount=50)]) == 1
+    assert (rollup.count, rollup.amount, rollup.watermark) == (4, 350.0, 4)
+
+
+def test_buckets_by_day_system_and_user_month():
+    rollup = RevenueRollup()
+    rollup.fold([_payment(1, day="2025-03-10"), _payment(2, day="2025-03-11", provider="other"),
+                 _payment(3, day="2025-04-01", amount=10)])
+    march = (day_number("2025-03-01T00:00:00"), day_number("2025-03-31T00:00:00"))
+    assert rollup.totals(*march) == {"count": 2, "amount": 200.0}
+    assert [row["system"] for row in rollup.by_system(*march)] == ["kassa", "other"]
+    assert rollup.top_users(*march, limit=5) == [{"tg_id": 7, "count": 2, "amount": 200.0}]
+
+
+def test_status_filter_skips_payments_but_fold_moves_watermark(monkeypatch):
+    monkeypatch.setattr(rollups, "REVENUE_STATUSES", frozenset({"success"}))
+    rollup = RevenueRollup()
+    rollup.fold([_payment(1), _payment(2, status="pending")])
+    assert rollup.count == 1
+    # Поэтому со статусами update_revenue не добирает платежи по id (см. следующий тест).
+    assert rollup.watermark == 2
+
+
+@pytest.mark.parametrize("statuses, since, rebuilt", [
+    (frozenset(), [_payment(5)], False),
+    (frozenset(), None, True),  # ни зеркала, ни ROLLUP_SINCE_PARAM
+    (frozenset({"success"}), [_payment(5)], True),
+])
+def test_update_revenue_folds_or_rebuilds(monkeypatch, statuses, since, rebuilt):
+    current = RevenueRollup()
+    current.fold([_payment(1)])
+    monkeypatch.setattr(rollups.revenue, "value", current)
+    monkeypatch.setattr(rollups, "REVENUE_STATUSES", statuses)
+
+    async def new_payments(watermark):
+        assert watermark == 1
+        return since
+
+    async def build():
+        return RevenueRollup()
+
+    monkeypatch.setattr(rollups, "_new_payments", new_payments)
+    monkeypatch.setattr(rollups, "_build_revenue", build)
+    result = asyncio.run(rollups.update_revenue())
+    assert (result is not current) == rebuilt
+    if not rebuilt:
+        assert (result.count, result.watermark) == (2, 5)
+
+
+def test_series_is_bounded_by_data():
+    assert RevenueRollup().series(0, 10 ** 9, "day") == []
+    rollup = RevenueRollup()
+    rollup.fold([_payment(1, day="2025-03-10"), _payment(2, day="2025-03-12")])
+    series = rollup.series(0, 10 ** 9, "day")
+    assert series[0] == {"period": "2025-03-10", "count": 1, "amount": 100.0}
+    assert series[2]["period"] == "2025-03-12"
+    assert series[1]["count"] == 0
+    weeks = rollup.series(0, day_number("2025-03-12T00:00:00"), "week")
+    assert weeks == [{"period": "2025-03-10", "count": 2, "amount": 200.0}]
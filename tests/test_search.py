@@ -0,0 +1,77 @@
+from app.core.search import TrigramIndex
+import random
+
+
+def _index(items) -> TrigramIndex:
+    index = TrigramIndex("tg_id", ("tg_id", "first_name", "username"))
+    for item in items:
+        index.add(item)
+    return index
+
+
+def _brute(items, needle: str) -> list:
+    return [item for item in items
+            if any(needle in str(item.get(field) or "").lower() for field in ("tg_id", "first_name", "username"))]
+
+
+USERS = [
+    {"tg_id": 101, "first_name": "Анна", "username": "anna_k"},
+    {"tg_id": 202, "first_name": "Иван", "username": "ivan"},
+    {"tg_id": 303, "first_name": "Joanna", "username": None},
+]
+
+
+def test_matches_agree_with_full_scan():
+    rng = random.Random(7)
+    alphabet = "abcабв_01"
+    items = [{"tg_id": i, "first_name": "".join(rng.choices(alphabet, k=rng.randint(0, 8))),
+              "username": "".join(rng.choices(alphabet, k=rng.randint(0, 8)))} for i in range(300)]
+    index = _index(items)
+    for needle in ["a", "аб", "ab_", "b0a", "1", "12", "zzz", "в_а"] + [items[i]["username"][1:4] for i in range(20)]:
+        assert index.matches(needle) == _brute(items, needle), needle
+
+
+def test_matches_is_case_insensitive_on_fields():
+    index = _index(USERS)
+    assert [u["tg_id"] for u in index.matches("анн")] == [101]
+    assert [u["tg_id"] for u in index.matches("anna")] == [101, 303]
+
+
+def test_readd_replaces_previous_version():
+    index = _index(USERS)
+    index.add({"tg_id": 202, "first_name": "Пётр", "username": "petr"})
+    assert index.count == 3
+    assert index.matches("ivan") == []
+    assert [u["first_name"] for u in index.matches("petr")] == ["Пётр"]
+
+
+def test_remove_and_remove_where():
+    index = _index(USERS)
+    index.remove(101)
+    index.remove(999)  # неизвестный ключ — без ошибки
+    assert index.count == 2
+    assert [u["tg_id"] for u in index.matches("anna")] == [303]
+    index.remove_where("username", "ivan")
+    assert index.count == 1
+    assert index.matches("ivan") == []
+
+
+def test_patch_updates_text_and_key():
+    index = _index(USERS)
+    index.patch(303, {"username": "jo_new"})
+    assert [u["tg_id"] for u in index.matches("jo_new")] == [303]
+    assert index.count == 3
+    index.patch(303, {"tg_id": 404})
+    assert [u["tg_id"] for u in index.matches("jo_new")] == [404]
+    assert index.matches("303") == []
+    assert index.count == 3
+
+
+def test_search_ranks_exact_then_prefix_then_substring():
+    index = _index([
+        {"tg_id": 1, "first_name": "xannax", "username": None},
+        {"tg_id": 2, "first_name": "annabel", "username": None},
+        {"tg_id": 3, "first_name": "anna", "username": None},
+    ])
+    assert [u["tg_id"] for u in index.search("anna", 10)] == [3, 2, 1]
+    assert [u["tg_id"] for u in index.search("anna", 2)] == [3, 2]
@@ -0,0 +1,101 @@
+from app.core.singleflight import SingleFlight
+import asyncio
+
+KEY = ("/users/", ())
+
+
+def test_identical_calls_share_one_execution():
+    async def scenario():
+        flight = SingleFlight()
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return ["users"]
+
+        results = await asyncio.gather(*(flight.do(KEY, fetch) for _ in range(5)))
+        assert results == [["users"]] * 5
+        assert len(calls) == 1
+        assert len(flight) == 0
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_waiter_does_not_cancel_the_call():
+    async def scenario():
+        flight = SingleFlight()
+        release = asyncio.Event()
+
+        async def fetch():
+            await release.wait()
+            return "done"
+
+        first = asyncio.create_task(flight.do(KEY, fetch))
+        second = asyncio.create_task(flight.do(KEY, fetch))
+        await asyncio.sleep(0)
+        first.cancel()
+        release.set()
+        assert await second == "done"
+
+    asyncio.run(scenario())
+
+
+def test_forget_starts_a_new_call_and_old_completion_keeps_it():
+    async def scenario():
+        flight = SingleFlight()
+        old_release, new_release = asyncio.Event(), asyncio.Event()
+
+        async def old():
+            await old_release.wait()
+            return "old"
+
+        async def new():
+            await new_release.wait()
+            return "new"
+
+        before = asyncio.create_task(flight.do(KEY, old))
+        await asyncio.sleep(0)
+        flight.forget("/users/")
+        after = asyncio.create_task(flight.do(KEY, new))
+        await asyncio.sleep(0)
+        current = flight.get(KEY)
+
+        old_release.set()
+        assert await before == "old"
+        # Завершение старого вызова не снимает регистрацию нового.
+        assert flight.get(KEY) is current
+        joined = asyncio.create_task(flight.do(KEY, old))
+        new_release.set()
+        assert (await after, await joined) == ("new", "new")
+
+    asyncio.run(scenario())
+
+
+def test_forget_only_matching_prefixes():
+    async def scenario():
+        flight = SingleFlight()
+        users = flight.claim(("/users/", ()))
+        keys = flight.claim(("/keys/", ()))
+        flight.forget("/keys/")
+        assert flight.get(("/users/", ())) is users
+        assert flight.get(("/keys/", ())) is None
+        flight.release(users)
+        flight.release(keys)
+
+    asyncio.run(scenario())
+
+
+def test_claim_and_release():
+    async def scenario():
+        flight = SingleFlight()
+        future = flight.claim(KEY)
+        assert future is not None
+        assert flight.claim(KEY) is None
+        waiter = asyncio.ensure_future(flight.get(KEY))
+        flight.release(future, ["rows"])
+        assert await waiter == ["rows"]
+        await asyncio.sleep(0)
+        assert len(flight) == 0
+
+    asyncio.run(scenario())